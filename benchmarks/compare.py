@@ -0,0 +1,79 @@
+"""
+Сравнение результатов benchmarks/load_bench.py между коммитами.
+
+Сценарий считается регрессией, если задержка или пик памяти выросли, а
+пропускная способность упала больше чем на --threshold (доля), или выросло
+число запросов к БД на запрос или ошибок. Код выхода 1 при регрессиях.
+Запуск: python -m benchmarks.compare base.json new.json --threshold 0.15
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def relative_change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old
+
+
+def find_regressions(base, new, threshold=0.15):
+    regressions = []
+    for server, scenarios in new['results'].items():
+        for scenario, result in scenarios.items():
+            old = base['results'].get(server, {}).get(scenario)
+            if old is None:
+                continue
+            name = f'{server} {scenario}'
+
+            for percentile in ('p50', 'p95', 'p99'):
+                change = relative_change(old['latency_ms'][percentile], result['latency_ms'][percentile])
+                if change > threshold:
+                    regressions.append(f'{name}: {percentile} latency +{change:.0%}')
+            change = relative_change(old['throughput_rps'], result['throughput_rps'])
+            if -change > threshold:
+                regressions.append(f'{name}: throughput {change:.0%}')
+            if old.get('alloc_peak_kib') and result.get('alloc_peak_kib'):
+                change = relative_change(old['alloc_peak_kib'], result['alloc_peak_kib'])
+                if change > threshold:
+                    regressions.append(f'{name}: allocations +{change:.0%}')
+
+            # Число запросов детерминировано, любой рост - регрессия
+            if result['queries_per_request'] > old['queries_per_request'] + 0.01:
+                regressions.append(
+                    f"{name}: queries per request {old['queries_per_request']} -> {result['queries_per_request']}"
+                )
+            if result['errors'] > old['errors']:
+                regressions.append(f"{name}: errors {old['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--threshold', type=float, default=0.15)
+    args = parser.parse_args()
+
+    base = json.loads(args.base.read_text())
+    new = json.loads(args.new.read_text())
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    for server, scenarios in new['results'].items():
+        for scenario, result in scenarios.items():
+            old = base['results'].get(server, {}).get(scenario)
+            if old is None:
+                continue
+            print(
+                f"{server + ' ' + scenario:<14} p95 {old['latency_ms']['p95']:>8.2f} -> {result['latency_ms']['p95']:>8.2f} ms"
+                f"   rps {old['throughput_rps']:>8.1f} -> {result['throughput_rps']:>8.1f}"
+            )
+
+    regressions = find_regressions(base, new, args.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Бенчмарк форматов ответа со списком задач: размер тела (без сжатия, gzip,
+brotli) и время кодирования.
+
+  JSONRenderer      - рендерер DRF по умолчанию;
+  ORJSONRenderer    - тот же JSON на orjson;
+  MessagePack       - MessagePackRenderer;
+  MessagePack cols  - MessagePackRenderer с layout=columns.
+
+Сжатие - с уровнями из TODOLIST_COMPRESSION, как в compression_middleware.
+Запуск: python -m benchmarks.format_bench --rows 100
+"""
+import argparse
+import os
+import timeit
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from benchmarks.serializer_bench import make_rows  # noqa: E402
+from todolist.compression import brotli, compress_bytes, get_compression_settings  # noqa: E402
+from todolist.parsers import unpack_msgpack  # noqa: E402
+from todolist.renderers import MessagePackRenderer, ORJSONRenderer, msgpack  # noqa: E402
+from todolist.serializers import TaskCharRowEncoder  # noqa: E402
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    # Страница списка в том виде, в каком её отдаёт TaskCharListAPIView
+    data = {'next': None, 'results': TaskCharRowEncoder().encode_rows(make_rows(args.rows))}
+    renderers = {
+        'JSONRenderer': lambda: JSONRenderer().render(data),
+        'ORJSONRenderer': lambda: ORJSONRenderer().render(data),
+    }
+    if msgpack is not None:
+        renderers['MessagePack'] = lambda: MessagePackRenderer().render(data, 'application/msgpack')
+        renderers['MessagePack cols'] = lambda: MessagePackRenderer().render(
+            data, 'application/msgpack; layout=columns'
+        )
+        columns = renderers['MessagePack cols']()
+        assert unpack_msgpack(columns, 'application/msgpack; layout=columns') == unpack_msgpack(
+            renderers['MessagePack'](), 'application/msgpack'
+        )
+    else:  # pragma: no cover
+        print('msgpack is not installed, MessagePack skipped')
+
+    config = get_compression_settings()
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    header = f'{"":<18} {"encode ms":>10} {"raw":>9}' + ''.join(f' {name:>9}' for name in encodings)
+    print(f'{args.rows} tasks per page')
+    print(header)
+    json_size = None
+    for name, render in renderers.items():
+        body = render()
+        json_size = json_size or len(body)
+        seconds = best_of(render, args.repeat)
+        sizes = ''.join(f' {len(compress_bytes(encoding, body, config)):>9}' for encoding in encodings)
+        print(f'{name:<18} {seconds * 1000:10.3f} {len(body):>9}{sizes}   ({len(body) / json_size:.0%} of JSON)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""
+Нагрузочный бенчмарк API задач внутри процесса, через todoapp/wsgi.py и todoapp/asgi.py.
+
+Готовит отдельную базу (по умолчанию benchmarks/bench.sqlite3) командой
+seed_tasks, затем гоняет tasks/, tasks/<pk>/, create, update и delete с
+заданной конкурентностью. Для каждого сценария считает p50/p95/p99,
+пропускную способность, запросы к БД на запрос и пик выделенной памяти,
+результаты пишет в JSON для benchmarks/compare.py.
+Запуск: python -m benchmarks.load_bench --users 10 --tasks 1000 --requests 500 --concurrency 8 --output base.json
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from todoapp.asgi import application as asgi_application  # noqa: E402
+from todoapp.wsgi import application as wsgi_application  # noqa: E402
+from todolist.authentication import issue_token  # noqa: E402
+from todolist.models import Task_char  # noqa: E402
+
+
+SCENARIOS = ('list', 'detail', 'create', 'update', 'delete')
+SERVERS = ('wsgi', 'asgi')
+DEFAULT_DATABASE = Path(__file__).resolve().parent / 'bench.sqlite3'
+HOST = 'localhost'
+
+
+class QueryCounter:
+    # Считает запросы во всех потоках: обёртка ставится на каждое подключение
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Workload:
+    """
+    Запросы сценариев для одного сервера.
+
+    Пользователи выбираются по кругу, задачи для detail/update - случайно
+    из первых задач пользователя, delete удаляет задачи, созданные в create.
+    """
+
+    def __init__(self, users, routes, seed, list_limit=None):
+        self.users = users
+        self.routes = routes
+        self.list_query = urlencode({'limit': list_limit}) if list_limit else ''
+        self.rng = random.Random(seed)
+        self.created = []
+        self._numbers = itertools.count()
+
+    def build(self, scenario, count):
+        requests = []
+        if scenario == 'delete':
+            targets, self.created = self.created[:count], self.created[count:]
+            for token, task_id in targets:
+                requests.append(('DELETE', reverse(self.routes['delete'], args=[task_id]), '', b'', token))
+            return requests
+
+        for _ in range(count):
+            number = next(self._numbers)
+            token, task_ids = self.users[number % len(self.users)]
+            task_id = self.rng.choice(task_ids)
+            if scenario == 'list':
+                requests.append(('GET', reverse(self.routes['list']), self.list_query, b'', token))
+            elif scenario == 'detail':
+                requests.append(('GET', reverse(self.routes['detail'], args=[task_id]), '', b'', token))
+            elif scenario == 'create':
+                body = json.dumps({'title': f'Bench task {number}', 'description': 'Created by load_bench'})
+                requests.append(('POST', reverse(self.routes['create']), '', body.encode(), token))
+            elif scenario == 'update':
+                body = json.dumps({'completed': bool(number % 2)})
+                requests.append(('PATCH', reverse(self.routes['update'], args=[task_id]), '', body.encode(), token))
+        return requests
+
+
+def wsgi_request(method, path, query, body, token):
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': HOST,
+        'HTTP_ACCEPT': 'application/json',
+        'HTTP_AUTHORIZATION': f'Bearer {token}',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split()[0])
+
+    result = wsgi_application(environ, start_response)
+    try:
+        content = b''.join(result)
+    finally:
+        # close() отправляет request_finished, как настоящий WSGI-сервер
+        result.close()
+    return response['status'], content
+
+
+async def asgi_request(method, path, query, body, token):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [
+            (b'host', HOST.encode()),
+            (b'accept', b'application/json'),
+            (b'authorization', f'Bearer {token}'.encode()),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': (HOST, 80),
+    }
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {'body': []}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Клиент не отключается; ожидание отменит сам обработчик
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'].append(message.get('body', b''))
+
+    await asgi_application(scope, receive, send)
+    return response['status'], b''.join(response['body'])
+
+
+def run_wsgi(requests, concurrency):
+    def timed(request):
+        start = time.perf_counter()
+        status, content = wsgi_request(*request)
+        return time.perf_counter() - start, status, content
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, requests))
+
+
+def run_asgi(requests, concurrency):
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(request):
+            async with semaphore:
+                start = time.perf_counter()
+                status, content = await asgi_request(*request)
+                return time.perf_counter() - start, status, content
+
+        return await asyncio.gather(*(timed(request) for request in requests))
+
+    return asyncio.run(run())
+
+
+def measure_allocations(server, requests):
+    # Отдельный последовательный проход: tracemalloc сильно замедляет запросы
+    results, peaks = [], []
+    tracemalloc.start()
+    try:
+        for request in requests:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            if server == 'wsgi':
+                status, content = wsgi_request(*request)
+            else:
+                status, content = asyncio.run(asgi_request(*request))
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            results.append((None, status, content))
+    finally:
+        tracemalloc.stop()
+    return results, peaks
+
+
+def summarize(results, elapsed, queries, peaks):
+    latencies = [latency * 1000 for latency, _, _ in results]
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'statuses': dict(Counter(str(status) for _, status, _ in results)),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': round(cuts[49], 3),
+            'p95': round(cuts[94], 3),
+            'p99': round(cuts[98], 3),
+            'mean': round(statistics.fmean(latencies), 3),
+            'max': round(max(latencies), 3),
+        },
+        'queries_per_request': round(queries / len(results), 2),
+        'alloc_peak_kib': round(statistics.fmean(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def run_scenario(server, workload, scenario, args, counter):
+    requests = workload.build(scenario, args.requests + args.alloc_sample)
+    if not requests:
+        return None
+    # Первые запросы (и прогрев) идут под tracemalloc, остальные - под замер времени
+    alloc_requests, timed_requests = requests[:args.alloc_sample], requests[args.alloc_sample:]
+    alloc_results, peaks = measure_allocations(server, alloc_requests)
+    if not timed_requests:
+        return None
+
+    counter.count = 0
+    start = time.perf_counter()
+    results = (run_wsgi if server == 'wsgi' else run_asgi)(timed_requests, args.concurrency)
+    elapsed = time.perf_counter() - start
+
+    if scenario == 'create':
+        # Всё созданное удаляет сценарий delete, база остаётся прежней
+        workload.created = [
+            (request[4], json.loads(content)['id'])
+            for request, (_, status, content) in zip(requests, alloc_results + results) if status == 201
+        ]
+    return summarize(results, elapsed, counter.count, peaks)
+
+
+def prepare_database(args):
+    connections['default'].settings_dict['NAME'] = str(args.database)
+    call_command('migrate', verbosity=0)
+    users = User.objects.filter(username__startswith=args.prefix)
+    seeded = Task_char.objects.filter(user__username__startswith=args.prefix).count()
+    if args.reseed or users.count() != args.users or seeded != args.users * args.tasks:
+        call_command(
+            'seed_tasks', users=args.users, tasks=args.tasks, prefix=args.prefix, seed=args.seed, clear=True,
+            stdout=io.StringIO(),
+        )
+
+    # Токены вместо сессий: без CSRF и без запросов к django_session
+    return [
+        (issue_token(user), list(user.task_char_set.order_by('id').values_list('uuid', flat=True)[:1000]))
+        for user in User.objects.filter(username__startswith=args.prefix).order_by('username')
+    ]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results):
+    print(f"{'':<12}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'KiB':>9}{'errors':>8}")
+    for server, scenarios in results.items():
+        for scenario, result in scenarios.items():
+            latency = result['latency_ms']
+            print(
+                f"{server + ' ' + scenario:<12}{result['throughput_rps']:>10.1f}{latency['p50']:>10.2f}"
+                f"{latency['p95']:>10.2f}{latency['p99']:>10.2f}{result['queries_per_request']:>9.1f}"
+                f"{result['alloc_peak_kib'] or 0:>9.1f}{result['errors']:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=1000, help='Tasks per user.')
+    parser.add_argument('--requests', type=int, default=500, help='Timed requests per scenario and server.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--list-limit', type=int, help='Request tasks/ with ?limit=N instead of the full list.')
+    parser.add_argument('--alloc-sample', type=int, default=20, help='Sequential requests measured with tracemalloc.')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument(
+        '--asgi-views', choices=('sync', 'async'), default='async',
+        help='Under ASGI, drive tasks/... (sync views) or async/tasks/... (async views).',
+    )
+    parser.add_argument('--no-cache', action='store_true', help='Disable TODOLIST_CACHE.')
+    parser.add_argument(
+        '--throttle', choices=('on', 'off'), default='on',
+        help='on: rate and concurrency checks run with limits the benchmark never reaches; off: disabled.',
+    )
+    parser.add_argument('--database', type=Path, default=DEFAULT_DATABASE)
+    parser.add_argument('--prefix', default='bench')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reseed', action='store_true')
+    parser.add_argument('--output', type=Path, help='Write JSON results to this file.')
+    args = parser.parse_args()
+
+    overrides = {'DEBUG': False, 'ALLOWED_HOSTS': [HOST]}
+    if args.no_cache:
+        overrides['TODOLIST_CACHE'] = {'ENABLED': False}
+    if args.throttle == 'on':
+        overrides['TODOLIST_THROTTLE'] = {
+            **settings.TODOLIST_THROTTLE,
+            'RATES': {'anon': '1000000000/s', 'user': '1000000000/s'},
+            'MAX_CONCURRENT_REQUESTS': max(args.concurrency * 2, settings.TODOLIST_THROTTLE['MAX_CONCURRENT_REQUESTS']),
+        }
+    else:
+        overrides['TODOLIST_THROTTLE'] = {'ENABLED': False, 'MAX_CONCURRENT_REQUESTS': 0}
+
+    with override_settings(**overrides):
+        users = prepare_database(args)
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+
+        results = {}
+        for server in args.servers:
+            prefix = 'async-' if server == 'asgi' and args.asgi_views == 'async' else ''
+            routes = {scenario: f'{prefix}task-{scenario}' for scenario in SCENARIOS}
+            workload = Workload(users, routes, args.seed, args.list_limit)
+            results[server] = {}
+            for scenario in args.scenarios:
+                result = run_scenario(server, workload, scenario, args, counter)
+                if result is not None:
+                    results[server][scenario] = result
+
+    report = {
+        'meta': {
+            'commit': get_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database_engine': connections['default'].settings_dict['ENGINE'],
+            'sqlite_profile': getattr(settings, 'TODOLIST_SQLITE_PROFILE', None),
+            'platform': platform.platform(),
+            'users': args.users,
+            'tasks': args.tasks,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'list_limit': args.list_limit,
+            'asgi_views': args.asgi_views,
+            'cache': not args.no_cache,
+            'throttle': args.throttle,
+        },
+        'results': results,
+    }
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
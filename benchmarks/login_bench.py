@@ -0,0 +1,81 @@
+"""
+Бенчмарк проверки пароля при входе: входов в секунду на ядро по алгоритмам.
+
+Для каждого хэшера проверяет один и тот же пароль --logins раз в одном потоке
+и в --threads потоках. Входов на ядро - число проверок на секунду
+процессорного времени. Отдельно меряется вход по имени, заблокированному
+после FAILED_LOGIN_LIMIT неудач: пароль не проверяется.
+Запуск: python -m benchmarks.login_bench --logins 20 --threads 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib.util import find_spec
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+django.setup()
+
+from django.contrib.auth.hashers import check_password, make_password  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from todolist.backends import LoginFailureBackend, clear_login_failures, record_login_failure  # noqa: E402
+from todolist.hashers import get_password_settings  # noqa: E402
+
+PASSWORD = 'bench-password'
+
+HASHERS = {
+    'pbkdf2 (Django default)': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt (tuned)': 'todolist.hashers.TunedScryptPasswordHasher',
+    'argon2 (tuned)': 'todolist.hashers.TunedArgon2PasswordHasher',
+}
+
+
+def measure(func, count, threads):
+    started, cpu_started = time.perf_counter(), time.process_time()
+    if threads == 1:
+        for _ in range(count):
+            func()
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            for future in [executor.submit(func) for _ in range(count)]:
+                future.result()
+    wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    return count / wall, count / cpu if cpu else float('inf')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f'cpus: {os.cpu_count()}, hash workers: {get_password_settings()["HASH_WORKERS"]}')
+    for name, path in HASHERS.items():
+        if 'Argon2' in path and not find_spec('argon2'):
+            print(f'{name:<24} skipped, argon2-cffi is not installed')
+            continue
+        with override_settings(PASSWORD_HASHERS=[path]):
+            encoded = make_password(PASSWORD)
+
+            def login():
+                assert check_password(PASSWORD, encoded)
+
+            per_second, per_core = measure(login, args.logins, 1)
+            threaded, _ = measure(login, args.logins, args.threads)
+        print(f'{name:<24} {per_core:8.1f} logins/s per core   {per_second:8.1f} logins/s in 1 thread   '
+              f'{threaded:8.1f} logins/s in {args.threads} threads')
+
+    username = 'bench-locked-user'
+    for _ in range(get_password_settings()['FAILED_LOGIN_LIMIT']):
+        record_login_failure(username)
+    backend = LoginFailureBackend()
+    per_second, per_core = measure(lambda: backend.authenticate(None, username, 'wrong'), args.logins * 100, 1)
+    clear_login_failures(username)
+    print(f'{"locked username":<24} {per_core:8.0f} logins/s per core (password not checked)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Микробенчмарк сериализации списка задач.
+
+Сравнивает TaskCharSerializer (экземпляры модели + ModelSerializer) с
+TaskCharRowEncoder (строки values_list()) и рендеринг JSONRenderer/ORJSONRenderer.
+Запуск: python -m benchmarks.serializer_bench --rows 10000
+"""
+import argparse
+import os
+import timeit
+import uuid
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from todolist.models import Task_char  # noqa: E402
+from todolist.renderers import ORJSONRenderer  # noqa: E402
+from todolist.serializers import TaskCharRowEncoder, TaskCharSerializer  # noqa: E402
+
+
+def make_rows(count):
+    now = timezone.now()
+    return [
+        (uuid.uuid4(), 1, f'Task {i}', f'Description of task {i}', i % 3 == 0,
+         now - timedelta(minutes=i), now - timedelta(seconds=i), i + 1)
+        for i in range(count)
+    ]
+
+
+def best_of(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    encoder = TaskCharRowEncoder()
+    # Так ORM строит экземпляры из строк результата запроса
+    attnames = [field.attname for field in Task_char._meta.concrete_fields]
+    by_column = {column: index for index, column in enumerate(encoder.columns)}
+    db_rows = [tuple(row[by_column[name]] for name in attnames) for row in rows]
+
+    def model_serializer():
+        tasks = [Task_char.from_db('default', attnames, row) for row in db_rows]
+        return TaskCharSerializer(tasks, many=True).data
+
+    def row_encoder():
+        return encoder.encode_rows(rows)
+
+    slow_data = model_serializer()
+    fast_data = row_encoder()
+    assert JSONRenderer().render(slow_data) == JSONRenderer().render(fast_data)
+
+    results = {
+        'TaskCharSerializer': best_of(model_serializer, args.repeat),
+        'TaskCharRowEncoder': best_of(row_encoder, args.repeat),
+        'JSONRenderer': best_of(lambda: JSONRenderer().render(fast_data), args.repeat),
+        'ORJSONRenderer': best_of(lambda: ORJSONRenderer().render(fast_data), args.repeat),
+    }
+    for name, seconds in results.items():
+        print(f'{name:<20} {seconds * 1000:9.2f} ms  ({args.rows / seconds:,.0f} rows/s)')
+    print(f"encode speedup: {results['TaskCharSerializer'] / results['TaskCharRowEncoder']:.1f}x, "
+          f"render speedup: {results['JSONRenderer'] / results['ORJSONRenderer']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
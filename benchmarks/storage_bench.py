@@ -0,0 +1,145 @@
+"""
+Бенчмарк хранения задач на SQLite: скорость вставки и размер индексов при
+разных первичных ключах todolist_task_char.
+
+  uuid4     - прежняя схема: случайный UUID в char(32) как первичный ключ;
+  uuid7     - тот же char(32), но UUID упорядочен по времени;
+  integer   - текущая схема (миграция 0009): целый id и уникальный uuid.
+
+Задачи --users пользователей вставляются вперемешку пакетами по --batch в
+файл с WAL, как при обычной работе. Размеры таблицы и индексов - из dbstat,
+после вставки меряется чтение страницы списка пользователя по индексу.
+Запуск: python -m benchmarks.storage_bench --tasks 200000 --users 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+COLUMNS = (
+    '"title" varchar(30) NOT NULL, "description" text NULL, "completed" bool NOT NULL, '
+    '"created_at" datetime NOT NULL, "updated_at" datetime NOT NULL, '
+    '"user_id" integer NULL REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED'
+)
+
+INDEXES = [
+    'CREATE INDEX "todolist_task_char_user_id_56da415a" ON "todolist_task_char" ("user_id")',
+    'CREATE INDEX "task_user_updated_idx" ON "todolist_task_char" ("user_id", "completed", "updated_at", "id")',
+    'CREATE INDEX "task_user_created_idx" ON "todolist_task_char" ("user_id", "completed", "created_at", "id")',
+    'CREATE INDEX "task_user_title_idx" ON "todolist_task_char" ("user_id", "completed", "title", "id")',
+]
+
+LAYOUTS = {
+    'uuid4': f'CREATE TABLE "todolist_task_char" ("id" char(32) NOT NULL PRIMARY KEY, {COLUMNS})',
+    'uuid7': f'CREATE TABLE "todolist_task_char" ("id" char(32) NOT NULL PRIMARY KEY, {COLUMNS})',
+    'integer': (
+        f'CREATE TABLE "todolist_task_char" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, {COLUMNS}, '
+        '"uuid" char(32) NOT NULL UNIQUE)'
+    ),
+}
+
+LIST_PAGE = (
+    'SELECT * FROM "todolist_task_char" WHERE "user_id" = ? AND "completed" = 0 '
+    'ORDER BY "updated_at" DESC, "id" DESC LIMIT 100'
+)
+
+
+def uuid7_hex(now):
+    # 48 бит миллисекунд Unix-времени, версия 7, остальное случайно (RFC 9562)
+    value = (int(now.timestamp() * 1000) << 80) | random.getrandbits(80)
+    value = (value & ~(0xF << 76)) | (0x7 << 76)
+    value = (value & ~(0x3 << 62)) | (0x2 << 62)
+    return f'{value:032x}'
+
+
+def make_row(layout, user_id, number, now):
+    stamp = now.isoformat(sep=' ')
+    values = (f'Task {number}', None, number % 5 == 0, stamp, stamp, user_id)
+    if layout == 'uuid4':
+        return (uuid.uuid4().hex, *values)
+    if layout == 'uuid7':
+        return (uuid7_hex(now), *values)
+    return (*values, uuid.uuid4().hex)
+
+
+def insert_sql(layout):
+    columns = '"title", "description", "completed", "created_at", "updated_at", "user_id"'
+    if layout == 'integer':
+        return f'INSERT INTO "todolist_task_char" ({columns}, "uuid") VALUES (?, ?, ?, ?, ?, ?, ?)'
+    return f'INSERT INTO "todolist_task_char" ("id", {columns}) VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+
+def run_layout(layout, path, args):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = NORMAL')
+    connection.execute(LAYOUTS[layout])
+    for sql in INDEXES:
+        connection.execute(sql)
+
+    rng = random.Random(args.seed)
+    sql = insert_sql(layout)
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    elapsed = 0.0
+    for start in range(0, args.tasks, args.batch):
+        rows = []
+        for number in range(start, min(start + args.batch, args.tasks)):
+            now += timedelta(milliseconds=rng.randint(1, 20))
+            rows.append(make_row(layout, rng.randint(1, args.users), number, now))
+        began = time.perf_counter()
+        connection.execute('BEGIN')
+        connection.executemany(sql, rows)
+        connection.execute('COMMIT')
+        elapsed += time.perf_counter() - began
+    connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    sizes = dict(connection.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+    table = sizes.pop('todolist_task_char')
+    sizes.pop('sqlite_schema', None)
+    sizes.pop('sqlite_sequence', None)
+
+    users = [rng.randint(1, args.users) for _ in range(args.reads)]
+    began = time.perf_counter()
+    for user_id in users:
+        connection.execute(LIST_PAGE, (user_id,)).fetchall()
+    read_time = (time.perf_counter() - began) / args.reads
+    connection.close()
+    return {
+        'inserts_per_second': args.tasks / elapsed,
+        'table_bytes': table,
+        'index_bytes': sizes,
+        'file_bytes': os.path.getsize(path),
+        'list_page_ms': read_time * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--layouts', nargs='+', choices=list(LAYOUTS), default=list(LAYOUTS))
+    args = parser.parse_args()
+
+    print(f'sqlite {sqlite3.sqlite_version}, {args.tasks} tasks, {args.users} users, batch {args.batch}')
+    with tempfile.TemporaryDirectory() as directory:
+        for layout in args.layouts:
+            result = run_layout(layout, os.path.join(directory, f'{layout}.sqlite3'), args)
+            indexes = sum(result['index_bytes'].values())
+            print(
+                f'{layout:<8} {result["inserts_per_second"]:9.0f} inserts/s   '
+                f'table {result["table_bytes"] / 2 ** 20:6.1f} MiB   indexes {indexes / 2 ** 20:6.1f} MiB   '
+                f'file {result["file_bytes"] / 2 ** 20:6.1f} MiB   list page {result["list_page_ms"]:.3f} ms'
+            )
+            for name, size in sorted(result['index_bytes'].items()):
+                print(f'         {name:<40} {size / 2 ** 20:6.1f} MiB')
+
+
+if __name__ == '__main__':
+    main()
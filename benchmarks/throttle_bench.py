@@ -0,0 +1,103 @@
+"""
+Микробенчмарк накладных расходов ограничения запросов (todolist/throttling.py).
+
+Меряет TokenBucketThrottle.allow_request с корзинами в памяти процесса и в
+кэше Django (LocMemCache), в одном и в нескольких потоках, и пару
+acquire/release ConcurrencyLimiter. Влияние на весь запрос показывает
+load_bench: python -m benchmarks.load_bench --throttle off/on и compare.py.
+Запуск: python -m benchmarks.throttle_bench --checks 100000 --threads 8
+"""
+import argparse
+import os
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'todoapp.settings')
+django.setup()
+
+from django.contrib.auth.models import AnonymousUser  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+
+from todolist.throttling import ConcurrencyLimiter, TokenBucketThrottle  # noqa: E402
+
+# Лимиты, которые бенчмарк не исчерпает: меряется проверка, а не отказ
+UNLIMITED_RATES = {'anon': '1000000000/s', 'user': '1000000000/s'}
+
+
+class BenchUser(AnonymousUser):
+    is_authenticated = True
+
+    def __init__(self, pk):
+        self.pk = self.id = pk
+
+
+def make_requests(users):
+    factory = RequestFactory()
+    requests = []
+    for pk in range(users):
+        request = Request(factory.get('/tasks/'))
+        request.user = BenchUser(pk)
+        requests.append(request)
+    return requests
+
+
+def per_check(func, checks, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat)) / checks
+
+
+def run_checks(requests, checks):
+    throttle = TokenBucketThrottle()
+    count = len(requests)
+    for i in range(checks):
+        throttle.allow_request(requests[i % count], None)
+
+
+def run_threaded(requests, checks, threads):
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(run_checks, requests, checks // threads) for _ in range(threads)]:
+            future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    requests = make_requests(args.users)
+    stores = {
+        'memory': {'BACKEND': 'todolist.throttling.MemoryBucketStore'},
+        'cache': {'BACKEND': 'todolist.throttling.CacheBucketStore', 'OPTIONS': {'alias': 'default'}},
+    }
+    results = {}
+    for name, store in stores.items():
+        with override_settings(TODOLIST_THROTTLE={**store, 'RATES': UNLIMITED_RATES}):
+            results[f'{name}, 1 thread'] = per_check(lambda: run_checks(requests, args.checks), args.checks,
+                                                      args.repeat)
+            results[f'{name}, {args.threads} threads'] = per_check(
+                lambda: run_threaded(requests, args.checks, args.threads), args.checks, args.repeat,
+            )
+    with override_settings(TODOLIST_THROTTLE={'ENABLED': False}):
+        results['disabled'] = per_check(lambda: run_checks(requests, args.checks), args.checks, args.repeat)
+
+    limiter = ConcurrencyLimiter(64)
+
+    def limiter_pairs():
+        for _ in range(args.checks):
+            limiter.acquire()
+            limiter.release()
+
+    results['concurrency limiter'] = per_check(limiter_pairs, args.checks, args.repeat)
+
+    for name, seconds in results.items():
+        print(f'{name:<22} {seconds * 1e6:7.2f} us/check  ({seconds / 1e-3:.2%} of a 1 ms request)')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
 
@@ -47,8 +48,148 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'todolist.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-    ]
+    ],
+    # ORJSONRenderer использует orjson, если он установлен, иначе работает как JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'todolist.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        # Accept: application/msgpack (с ; layout=columns - списки колонками), если установлен msgpack
+        *(['todolist.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['todolist.parsers.MessagePackParser'] if find_spec('msgpack') else []),
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'todolist.throttling.TokenBucketThrottle',
+    ],
+}
+
+# default - кэш в памяти процесса. shared - общий для всех процессов: счётчик
+# неудачных входов и read-your-writes реплик должны видеть все воркеры (с
+# кэшем в памяти процесса manage.py check не пройдёт, см. todolist/checks.py).
+# По умолчанию это таблица todolist_cache в БД (создаётся migrate), для
+# нескольких хостов - TODOLIST_REDIS_URL (нужен пакет redis)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'todolist_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+if os.environ.get('TODOLIST_REDIS_URL'):
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['TODOLIST_REDIS_URL'],
+    }
+
+# Кэш ответов списка и деталей задач (todolist/cache.py), по умолчанию выключен.
+# Версия пользователя меняется только в кэше процесса, сделавшего запись:
+# LocMemLRUBackend годится лишь для одного процесса, иначе остальные воркеры
+# до TIMEOUT отдают старые списки. Для нескольких воркеров:
+# 'BACKEND': 'todolist.cache.DjangoCacheBackend', 'OPTIONS': {'alias': 'shared'}
+TODOLIST_CACHE = {
+    'ENABLED': False,
+    'BACKEND': 'todolist.cache.LocMemLRUBackend',
+    'TIMEOUT': 300,
+    'OPTIONS': {'max_entries': 10000},
+}
+
+# Максимальный размер пакета для tasks/bulk/* эндпоинтов
+TODOLIST_MAX_BATCH_SIZE = 500
+
+# Поток событий tasks/events/ (todolist/broker.py)
+TODOLIST_EVENTS = {
+    'BACKEND': 'todolist.broker.InMemoryBroker',
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+}
+
+# True - по адресам tasks/ работают асинхронные view из todolist/async_views.py
+# (они всегда доступны и по префиксу async/)
+TODOLIST_ASYNC_API = False
+
+# Список задач сериализуется через values_list() и TaskCharRowEncoder
+# (тот же JSON, что у TaskCharSerializer, но быстрее)
+TODOLIST_FAST_SERIALIZER = True
+
+# Вход по подписанным токенам (todolist/authentication.py).
+# MODE: 'session', 'token' (без сессий) или 'both'. Отозванные при выходе
+# токены хранятся в таблице RevokedToken до истечения их срока
+TODOLIST_AUTH = {
+    'MODE': 'both',
+    'TOKEN_TTL': 24 * 60 * 60,
+    'USER_CACHE_TTL': 60,
+}
+
+# Метрики запросов по view для Prometheus на /metrics/ (todolist/metrics.py).
+# Медленные запросы с их SQL пишутся в лог todolist.metrics
+TODOLIST_METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_SAMPLE_RATE': 0.1,
+}
+
+# Очередь фоновых задач в БД (todolist/jobs.py): экспорт, импорт, удаление
+# выполненных. Выполняются командой manage.py run_jobs
+TODOLIST_JOBS = {
+    'FILES_DIR': BASE_DIR / 'job_files',
+    'VISIBILITY_TIMEOUT': 300,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+}
+
+# Ограничение частоты запросов и числа одновременных запросов (todolist/throttling.py).
+# RATES - по throttle_scope view, корзина на пользователя или IP. Общие для процессов
+# корзины: 'BACKEND': 'todolist.throttling.CacheBucketStore', 'OPTIONS': {'alias': 'default'}
+TODOLIST_THROTTLE = {
+    'ENABLED': True,
+    'BACKEND': 'todolist.throttling.MemoryBucketStore',
+    'RATES': {
+        'anon': '60/min',
+        'user': '1200/min',
+        'auth': '10/min',
+    },
+    'MAX_CONCURRENT_REQUESTS': 64,
+    'QUEUE_TIMEOUT': 0.05,
+}
+
+# Хэширование паролей и защита входа (todolist/hashers.py, todolist/backends.py):
+# параметры scrypt/argon2, пул потоков для хэшей и пропуск проверки пароля для
+# имени после FAILED_LOGIN_LIMIT неудач
+TODOLIST_PASSWORDS = {
+    'SCRYPT': {'WORK_FACTOR': 2 ** 15, 'BLOCK_SIZE': 8, 'PARALLELISM': 1},
+    'ARGON2': {'TIME_COST': 2, 'MEMORY_COST': 19456, 'PARALLELISM': 1},
+    'FAILED_LOGIN_LIMIT': 5,
+    'FAILED_LOGIN_WINDOW': 300,
+}
+
+# Архив выполненных задач (todolist/archive.py): manage.py archive_tasks по
+# расписанию переносит задачи, выполненные больше AGE_DAYS дней назад
+TODOLIST_ARCHIVE = {
+    'AGE_DAYS': 30,
+    'BATCH_SIZE': 500,
+}
+
+# Объединение одновременных одинаковых чтений задач (todolist/singleflight.py):
+# данные считает один запрос, остальные ждут его результат не дольше TIMEOUT секунд
+TODOLIST_SINGLE_FLIGHT = {
+    'ENABLED': True,
+    'TIMEOUT': 5,
+}
+
+# Сжатие ответов (todolist/compression.py): brotli, если установлен, иначе gzip.
+# Ответы короче MIN_SIZE байт и поток событий не сжимаются
+TODOLIST_COMPRESSION = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
 }
 
 CSRF_COOKIE_SECURE = False
@@ -58,6 +199,14 @@ CSRF_TRUSTED_ORIGINS = ["http://localhost:8080", "http://127.0.0.1:8080"]
 CORS_ALLOWED_ORIGINS = ["http://localhost:8080", "http://127.0.0.1:8080"]
 
 MIDDLEWARE = [
+    # Первым, чтобы время запроса включало остальные middleware
+    'todolist.metrics.metrics_middleware',
+    # Сразу после метрик: отброшенные запросы видны в /metrics/ и стоят дёшево
+    'todolist.throttling.concurrency_limit_middleware',
+    # Формат и сжатие в ETag; снаружи сжатия, чтобы видеть Content-Encoding
+    'todolist.conditional.representation_etag_middleware',
+    # Сжатие brotli/gzip снаружи остальных middleware: сжимается окончательный ответ
+    'todolist.compression.compression_middleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -111,6 +260,70 @@ DATABASES = {
     }
 }
 
+# Профиль SQLite для продакшена (todolist/db/sqlite3): WAL и прагмы при
+# подключении, постоянные подключения и запись через BEGIN IMMEDIATE с
+# очередью внутри процесса. Включается TODOLIST_SQLITE_PROFILE=production
+# (см. README): WAL меняет заголовок файла базы и создаёт файлы -wal/-shm
+TODOLIST_SQLITE_PROFILE = os.environ.get('TODOLIST_SQLITE_PROFILE', 'default')
+
+if TODOLIST_SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'todolist.db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 5000,
+                'cache_size': -64000,
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
+    })
+
+# Реплики для чтения списка и отдельных задач (todolist/routers.py); пустой
+# список - всё читается из default. После записи пользователь STICKY_SECONDS
+# читает из default (read-your-writes)
+TODOLIST_REPLICAS = {
+    'DATABASES': [],
+    'STICKY_SECONDS': 5,
+    'MAX_LAG_SECONDS': 10,
+    'HEALTH_CHECK_INTERVAL': 5,
+}
+
+# Локальная проверка: TODOLIST_REPLICA_PATH - копия db.sqlite3 в роли реплики
+if os.environ.get('TODOLIST_REPLICA_PATH'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['TODOLIST_REPLICA_PATH'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    TODOLIST_REPLICAS['DATABASES'] = ['replica']
+
+# Шарды задач (todolist/routers.py): пользователи и прочие данные - в default,
+# задачи, архив, журнал изменений и счётчики пользователя - на одной из
+# DATABASES по хешу его id. Пустой список - всё в default. Переносит
+# пользователей между шардами команда rebalance_shards
+TODOLIST_SHARDS = {
+    'DATABASES': [],
+    'PLACEMENT_TTL': 10,
+    'MOVE_WAIT': 15,
+}
+
+# Локальные шарды - файлы SQLite рядом с db.sqlite3 (TODOLIST_SHARD_COUNT штук).
+# TODOLIST_SHARDING=1 включает их: migrate --database shardN для каждого,
+# rebalance_shards --pin до включения и rebalance_shards после
+if os.environ.get('TODOLIST_SHARDING'):
+    for index in range(int(os.environ.get('TODOLIST_SHARD_COUNT', 2))):
+        DATABASES[f'shard{index}'] = {**DATABASES['default'], 'NAME': BASE_DIR / f'shard{index}.sqlite3'}
+    TODOLIST_SHARDS['DATABASES'] = [alias for alias in DATABASES if alias.startswith('shard')]
+
+# Шардирование раньше реплик: задачи уходят на шард, остальное - как прежде
+DATABASE_ROUTERS = ['todolist.routers.ShardRouter', 'todolist.routers.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -130,6 +343,20 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Алгоритм для новых хэшей: argon2, если установлен argon2-cffi, иначе scrypt.
+# Хэши остальных алгоритмов проверяются и пересчитываются при входе
+TODOLIST_PASSWORD_HASHER = os.environ.get('TODOLIST_PASSWORD_HASHER', 'argon2' if find_spec('argon2') else 'scrypt')
+_PASSWORD_HASHERS = {
+    'argon2': 'todolist.hashers.TunedArgon2PasswordHasher',
+    'scrypt': 'todolist.hashers.TunedScryptPasswordHasher',
+    'pbkdf2': 'todolist.hashers.BoundedPBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[TODOLIST_PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != TODOLIST_PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+AUTHENTICATION_BACKENDS = ['todolist.backends.LoginFailureBackend']
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
@@ -14,11 +14,37 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 from django.views.generic import TemplateView
 from todolist.views import TaskCharListView, TaskCharDetailView, TaskCharCreateView, TaskCharUpdateView, TaskDeleteAPIView, LoginAPIView, LogoutAPIView, RegisterAPIView
+from todolist.views import TaskBulkCreateAPIView, TaskBulkUpdateAPIView, TaskBulkDeleteAPIView, TaskChangesAPIView, TaskStatsAPIView, metrics_view
+from todolist.views import TaskExportAPIView, TaskImportAPIView
+from todolist.views import JobListAPIView, JobDetailAPIView, JobResultAPIView, JobEnqueueAPIView, JobImportAPIView
+from todolist.models import Job
+from todolist import async_views
+from todolist.async_views import task_events
+
+sync_task_views = {
+    'list': TaskCharListView.as_view(),
+    'detail': TaskCharDetailView.as_view(),
+    'create': TaskCharCreateView.as_view(),
+    'update': TaskCharUpdateView.as_view(),
+    'delete': TaskDeleteAPIView.as_view(),
+}
+
+async_task_views = {
+    'list': async_views.task_list,
+    'detail': async_views.task_detail,
+    'create': async_views.task_create,
+    'update': async_views.task_update,
+    'delete': async_views.task_delete,
+}
+
+# TODOLIST_ASYNC_API = True отдаёт по основным адресам tasks/ асинхронные view
+task_views = async_task_views if getattr(settings, 'TODOLIST_ASYNC_API', False) else sync_task_views
 
 urlpatterns = [
     path('swagger/', TemplateView.as_view(
@@ -28,12 +54,34 @@ urlpatterns = [
 
     path('admin/', admin.site.urls),
 
-    path('tasks/', TaskCharListView.as_view(), name='task-list'),
-    path('tasks/<uuid:pk>/', TaskCharDetailView.as_view(), name='task-detail'),
-    path('tasks/create/', TaskCharCreateView.as_view(), name='task-create'),
-    path('tasks/update/<uuid:pk>/', TaskCharUpdateView.as_view(), name='task-update'),
-    path('tasks/delete/<uuid:pk>/', TaskDeleteAPIView.as_view(), name='task-delete'),
+    path('tasks/', task_views['list'], name='task-list'),
+    path('tasks/<uuid:pk>/', task_views['detail'], name='task-detail'),
+    path('tasks/create/', task_views['create'], name='task-create'),
+    path('tasks/update/<uuid:pk>/', task_views['update'], name='task-update'),
+    path('tasks/delete/<uuid:pk>/', task_views['delete'], name='task-delete'),
+    path('tasks/bulk/create/', TaskBulkCreateAPIView.as_view(), name='task-bulk-create'),
+    path('tasks/bulk/update/', TaskBulkUpdateAPIView.as_view(), name='task-bulk-update'),
+    path('tasks/bulk/delete/', TaskBulkDeleteAPIView.as_view(), name='task-bulk-delete'),
+    path('tasks/export/', TaskExportAPIView.as_view(), name='task-export'),
+    path('tasks/import/', TaskImportAPIView.as_view(), name='task-import'),
+    path('tasks/changes/', TaskChangesAPIView.as_view(), name='task-changes'),
+    path('tasks/stats/', TaskStatsAPIView.as_view(), name='task-stats'),
+    path('tasks/events/', task_events, name='task-events'),
     path('login/', LoginAPIView.as_view(), name='login'),
     path('logout/', LogoutAPIView.as_view(), name='logout'),
     path('register/', RegisterAPIView.as_view(), name='register'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('jobs/', JobListAPIView.as_view(), name='job-list'),
+    path('jobs/<int:pk>/', JobDetailAPIView.as_view(), name='job-detail'),
+    path('jobs/<int:pk>/result/', JobResultAPIView.as_view(), name='job-result'),
+    path('jobs/export/', JobEnqueueAPIView.as_view(kind=Job.EXPORT), name='job-export'),
+    path('jobs/import/', JobImportAPIView.as_view(), name='job-import'),
+    path('jobs/clear-completed/', JobEnqueueAPIView.as_view(kind=Job.CLEAR_COMPLETED), name='job-clear-completed'),
+
+    # Асинхронные варианты тех же эндпоинтов, для сравнения под ASGI
+    path('async/tasks/', async_task_views['list'], name='async-task-list'),
+    path('async/tasks/<uuid:pk>/', async_task_views['detail'], name='async-task-detail'),
+    path('async/tasks/create/', async_task_views['create'], name='async-task-create'),
+    path('async/tasks/update/<uuid:pk>/', async_task_views['update'], name='async-task-update'),
+    path('async/tasks/delete/<uuid:pk>/', async_task_views['delete'], name='async-task-delete'),
 ]
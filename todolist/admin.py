@@ -1,5 +1,76 @@
 from django.contrib import admin
-from .models import Task_char
+from django.http import QueryDict
+
+from .routers import get_shard_settings, shard_aliases
+from .models import ArchivedTask, Task_char, TaskShard
 # from .models import Meta
 
-admin.site.register(Task_char)
+
+class ShardListFilter(admin.SimpleListFilter):
+    # Список задач в админке - по одному шарду за раз
+    title = 'shard'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in shard_aliases()]
+
+    def value(self):
+        return super().value() or shard_aliases()[0]
+
+    def choices(self, changelist):
+        # Без пункта "All": задачи разных шардов не собрать одним запросом
+        return list(super().choices(changelist))[1:]
+
+    def queryset(self, request, queryset):
+        # База выбрана в ShardedTaskAdmin.get_queryset
+        return queryset
+
+
+class ShardedTaskAdmin(admin.ModelAdmin):
+    """
+    Задачи выбранного в фильтре шарда. Формы задачи получают шард из
+    сохранённых фильтров списка (_changelist_filters).
+    """
+
+    def get_list_filter(self, request):
+        list_filter = list(super().get_list_filter(request))
+        return [ShardListFilter, *list_filter] if get_shard_settings()['DATABASES'] else list_filter
+
+    def get_shard(self, request):
+        shard = request.GET.get(ShardListFilter.parameter_name)
+        if shard is None:
+            shard = QueryDict(request.GET.get('_changelist_filters', '')).get(ShardListFilter.parameter_name)
+        return shard if shard in shard_aliases() else shard_aliases()[0]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if not get_shard_settings()['DATABASES']:
+            return queryset
+        return queryset.using(self.get_shard(request))
+
+    def get_readonly_fields(self, request, obj=None):
+        # Смена владельца перенесла бы задачу на другой шард
+        readonly_fields = super().get_readonly_fields(request, obj)
+        if obj is not None and get_shard_settings()['DATABASES']:
+            return (*readonly_fields, 'user')
+        return readonly_fields
+
+
+class TaskShardAdmin(admin.ModelAdmin):
+    # Только просмотр: размещение меняет команда rebalance_shards
+    list_display = ('user', 'alias', 'moving', 'updated_at')
+    list_filter = ('alias', 'moving')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(Task_char, ShardedTaskAdmin)
+admin.site.register(ArchivedTask, ShardedTaskAdmin)
+admin.site.register(TaskShard, TaskShardAdmin)
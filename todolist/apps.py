@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TodolistConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'todolist'
+
+    def ready(self):
+        from todolist import checks, signals  # noqa: F401
@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from todolist.cache import invalidate_user_tasks
+from todolist.models import ArchivedTask, Task_char, TaskShard
+from todolist.routers import shard_aliases
+
+
+# Давно выполненные задачи переносятся из рабочей таблицы в ArchivedTask,
+# чтобы списки, индексы и поиск работали с небольшим набором строк.
+# Перенос не меняет задачу: tasks_changed не отправляется, журнал изменений
+# и счётчики (триггеры есть на обеих таблицах) его не видят. Любая запись в
+# архивную задачу сначала возвращает её в рабочую таблицу (restore_tasks).
+
+DEFAULT_SETTINGS = {
+    # В архив попадают выполненные задачи, не менявшиеся столько дней
+    'AGE_DAYS': 30,
+    # Задач за транзакцию: блокировка записи не держится долго
+    'BATCH_SIZE': 500,
+}
+
+# Общие столбцы рабочей таблицы и архива
+COLUMNS = [field.column for field in Task_char._meta.concrete_fields]
+
+
+def get_archive_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_ARCHIVE', {})}
+
+
+def move_rows(queryset, model, **values):
+    """
+    Переносит строки `queryset` в таблицу `model`: INSERT ... SELECT и DELETE
+    тех же строк, без чтения задач в Python. `values` - значения столбцов,
+    которых нет в исходной таблице. Возвращает число перенесённых строк.
+    """
+    using = queryset.db
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    subquery, params = queryset.order_by().values('id').query.get_compiler(using).as_sql()
+    fields = [model._meta.get_field(name) for name in values]
+    columns = ', '.join(qn(column) for column in COLUMNS)
+    source = qn(queryset.model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {} ({}{}) SELECT {}{} FROM {} WHERE {} IN ({})'.format(
+                qn(model._meta.db_table),
+                columns, ''.join(f', {qn(field.column)}' for field in fields),
+                columns, ', %s' * len(fields),
+                source, qn('id'), subquery,
+            ),
+            [field.get_db_prep_save(values[field.name], connection) for field in fields] + list(params),
+        )
+        moved = cursor.rowcount
+        cursor.execute(f'DELETE FROM {source} WHERE {qn("id")} IN ({subquery})', params)
+    return moved
+
+
+def archive_completed_tasks(days=None, batch_size=None, user_id=None):
+    """
+    Переносит в архив выполненные задачи, не менявшиеся дольше `days` дней
+    (по умолчанию TODOLIST_ARCHIVE['AGE_DAYS']), пакетами в отдельных
+    транзакциях на каждом шарде. Возвращает число перенесённых задач.
+    """
+    config = get_archive_settings()
+    cutoff = timezone.now() - timedelta(days=config['AGE_DAYS'] if days is None else days)
+    batch_size = batch_size or config['BATCH_SIZE']
+    if user_id is not None:
+        return _archive_on(router.db_for_write(Task_char, user_id=user_id), cutoff, batch_size, user_id)
+    return sum(_archive_on(using, cutoff, batch_size) for using in shard_aliases())
+
+
+def _archive_on(using, cutoff, batch_size, user_id=None):
+    candidates = Task_char.objects.using(using).filter(completed=True, updated_at__lt=cutoff)
+    if user_id is not None:
+        candidates = candidates.filter(user_id=user_id)
+    else:
+        # Задачи пользователей, которых переносят на другой шард, не трогаем
+        candidates = candidates.exclude(user_id__in=list(
+            TaskShard.objects.filter(moving=True).values_list('user_id', flat=True)
+        ))
+
+    archived = last_id = 0
+    while True:
+        with transaction.atomic(using=using):
+            # Строки блокируются до переноса; условия проверяются ещё раз в
+            # INSERT ... SELECT на случай записи между выборкой и переносом
+            batch = list(
+                candidates.filter(id__gt=last_id).select_for_update().order_by('id').values_list('id', 'user_id')
+                [:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            archived += move_rows(candidates.filter(id__in=[pk for pk, _ in batch]), ArchivedTask, archived_at=timezone.now())
+            for task_user_id in {task_user_id for _, task_user_id in batch}:
+                invalidate_user_tasks(task_user_id)
+    return archived
+
+
+def restore_tasks(user_id, task_ids):
+    """
+    Возвращает архивные задачи пользователя с публичными id `task_ids` в
+    рабочую таблицу как есть, с прежними id, uuid и updated_at. Возвращает
+    число восстановленных; если в архиве их нет - один запрос по индексу.
+    """
+    using = router.db_for_write(Task_char, user_id=user_id)
+    with transaction.atomic(using=using):
+        archived = ArchivedTask.objects.using(using).filter(user_id=user_id, uuid__in=task_ids)
+        ids = list(archived.select_for_update().values_list('id', flat=True))
+        if not ids:
+            return 0
+        restored = move_rows(archived.filter(id__in=ids), Task_char)
+        invalidate_user_tasks(user_id)
+    return restored
@@ -0,0 +1,280 @@
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, QueryDict, StreamingHttpResponse
+from django.http.multipartparser import MultiPartParserError
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+
+from todolist.authentication import aauthenticate_token
+from todolist.broker import get_broker, get_broker_settings
+from todolist.cache import list_params
+from todolist.conditional import has_preconditions, list_validators, set_validator_headers, task_validators
+from todolist.models import ArchivedTask, Task_char, TaskChange
+from todolist.pagination import TaskKeysetPagination, include_archived, merge_tasks
+from todolist.parsers import MessagePackParser, msgpack, unpack_msgpack
+from todolist.renderers import MessagePackRenderer, ORJSONRenderer
+from todolist.routers import TasksMoving, replica_reads
+from todolist.serializers import TaskCharSerializer
+from todolist.signals import change_event
+from todolist.singleflight import acoalesce
+from todolist.throttling import acheck_rate, throttled_response
+from todolist.views import get_task_list_queryset
+from todolist.writes import delete_task, update_task, update_task_checked
+
+
+# Асинхронные варианты API задач для ASGI: ORM вызывается через aget/acreate/...
+# без переключения каждого запроса в поток. Подключаются по префиксу async/
+# или вместо синхронных при TODOLIST_ASYNC_API = True (см. todoapp/urls.py)
+
+def async_login_required(view):
+    # Токен из заголовка Authorization или сессия, как у синхронных view.
+    # CSRF, как в DRF SessionAuthentication, проверяется только для сессии
+    @csrf_exempt
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await aauthenticate_token(request)
+        except AuthenticationFailed as exc:
+            return JsonResponse({'detail': str(exc.detail)}, status=401, headers={'WWW-Authenticate': 'Bearer'})
+        if result is not None:
+            request.user = result[0]
+            return await throttled_view(request, *args, **kwargs)
+
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+        csrf_check = CsrfViewMiddleware(lambda request: None)
+        csrf_check.process_request(request)
+        rejected = csrf_check.process_view(request, None, (), {})
+        if rejected is not None:
+            return rejected
+        return await throttled_view(request, *args, **kwargs)
+
+    async def throttled_view(request, *args, **kwargs):
+        # Та же корзина 'user', что у синхронных view
+        wait = await acheck_rate(request, request.user)
+        if wait:
+            return throttled_response(wait)
+        try:
+            return await view(request, *args, **kwargs)
+        except TasksMoving as exc:
+            # Как обработчик исключений DRF у синхронных view
+            return JsonResponse(
+                {'detail': str(exc.detail)}, status=exc.status_code, headers={'Retry-After': str(exc.wait)},
+            )
+    return wrapper
+
+
+def parse_body(request):
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    if request.content_type == MessagePackParser.media_type and msgpack is not None:
+        return unpack_msgpack(request.body, request.META.get('CONTENT_TYPE')) if request.body else {}
+    # Django разбирает тело формы только для POST
+    return request.POST if request.method == 'POST' else QueryDict(request.body, encoding=request.encoding)
+
+
+def negotiate(request):
+    # (рендерер, тип) - MessagePack, если клиент предпочитает его JSON (как согласование
+    # DRF в синхронных view). Параметры (layout=columns) не мешают выбору, поэтому
+    # без request.get_preferred_type()
+    for media_type in request.accepted_types:
+        if msgpack is not None and f'{media_type.main_type}/{media_type.sub_type}' == MessagePackRenderer.media_type:
+            return MessagePackRenderer(), str(media_type)
+        if media_type.match('application/json'):
+            break
+    return ORJSONRenderer(), ORJSONRenderer.media_type
+
+
+def render(request, data):
+    # Тело и Content-Type - те же байты, что у синхронных view с тем же типом
+    renderer, media_type = negotiate(request)
+    return renderer.render(data, media_type), renderer.media_type
+
+
+def api_response(request, data, status=200):
+    content, content_type = render(request, data)
+    return HttpResponse(content, status=status, content_type=content_type)
+
+
+def bad_request(errors):
+    return JsonResponse(errors, status=400, safe=False)
+
+
+def not_found():
+    return JsonResponse({'detail': 'No Task_char matches the given query.'}, status=404)
+
+
+@require_GET
+@async_login_required
+async def task_list(request):
+    drf_request = Request(request)
+    params = drf_request.query_params
+    # Те же ETag и ключ single-flight, что у TaskCharListView
+    variant = '|'.join(list_params(drf_request))
+    with replica_reads(request.user.pk):
+        etag, last_modified = await sync_to_async(list_validators)(
+            get_task_list_queryset(request.user, params), request.user.pk, variant,
+        )
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    _, media_type = negotiate(request)
+
+    async def compute():
+        with replica_reads(request.user.pk):
+            querysets = [get_task_list_queryset(request.user, params)]
+            if include_archived(params):
+                querysets.append(get_task_list_queryset(request.user, params, ArchivedTask))
+
+            paginator = TaskKeysetPagination()
+            page_querysets = [paginator.get_page_queryset(queryset, drf_request) for queryset in querysets]
+            if page_querysets[0] is None:
+                tasks = merge_tasks([[task async for task in queryset] for queryset in querysets], params)
+                data = TaskCharSerializer(tasks, many=True).data
+            else:
+                page = paginator.set_page(
+                    merge_tasks([[task async for task in page] for page in page_querysets], params)
+                )
+                data = {'next': paginator.get_next_link(), 'results': TaskCharSerializer(page, many=True).data}
+        # Результат того же вида, что у conditional_task_response
+        return data, 200, render(request, data)
+
+    # Одновременные одинаковые запросы пользователя, в том числе к синхронному
+    # списку, делят одно вычисление и отрисованное тело
+    data, status, rendered = await acoalesce((request.user.pk, 'list', variant, media_type, etag), compute)
+    content, content_type = rendered if rendered is not None else render(request, data)
+    response = HttpResponse(content, status=status, content_type=content_type)
+    return set_validator_headers(response, etag, last_modified)
+
+
+@require_GET
+@async_login_required
+async def task_detail(request, pk):
+    async def compute():
+        with replica_reads(request.user.pk):
+            task = await Task_char.objects.filter(uuid=pk, user=request.user).afirst()
+            if task is None:
+                # Архивная задача читается из архива, как в TaskCharDetailView
+                task = await ArchivedTask.objects.filter(uuid=pk, user=request.user).afirst()
+        if task is None:
+            return None
+        return TaskCharSerializer(task).data, task_validators(task.uuid, task.updated_at)
+
+    found = await acoalesce((request.user.pk, 'async-detail', str(pk)), compute)
+    if found is None:
+        return not_found()
+    data, validators = found
+    # Промежуточного ConditionalGetMiddleware нет: If-None-Match и
+    # If-Modified-Since проверяются здесь, как в conditional_task_response
+    not_modified = get_conditional_response(request, *validators)
+    if not_modified is not None:
+        return not_modified
+    return set_validator_headers(api_response(request, data), *validators)
+
+
+@require_http_methods(['POST'])
+@async_login_required
+async def task_create(request):
+    try:
+        data = parse_body(request)
+    except (ValueError, MultiPartParserError):
+        return bad_request({'detail': 'Malformed request body.'})
+
+    serializer = TaskCharSerializer(data=data)
+    if not serializer.is_valid():
+        return bad_request(serializer.errors)
+    task = await Task_char.objects.acreate(user=request.user, **serializer.validated_data)
+    return api_response(request, TaskCharSerializer(task).data, status=201)
+
+
+@require_http_methods(['PUT', 'PATCH'])
+@async_login_required
+async def task_update(request, pk):
+    try:
+        data = parse_body(request)
+    except (ValueError, MultiPartParserError):
+        return bad_request({'detail': 'Malformed request body.'})
+
+    serializer = TaskCharSerializer(data=data, partial=request.method == 'PATCH')
+    if not serializer.is_valid():
+        return bad_request(serializer.errors)
+    if not has_preconditions(request):
+        # Одна команда UPDATE ... RETURNING, как в TaskCharUpdateView
+        task = await sync_to_async(update_task)(request.user.pk, pk, serializer.validated_data)
+    else:
+        # If-Match / If-Unmodified-Since проверяются под блокировкой строки, как в TaskCharUpdateView
+        task, precondition_failed = await sync_to_async(update_task_checked)(
+            request.user.pk, pk, serializer.validated_data,
+            lambda task: get_conditional_response(request, *task_validators(task.uuid, task.updated_at)),
+        )
+        if precondition_failed is not None:
+            return precondition_failed
+    if task is None:
+        return not_found()
+
+    response = api_response(request, TaskCharSerializer(task).data)
+    return set_validator_headers(response, *task_validators(task.uuid, task.updated_at))
+
+
+@require_http_methods(['DELETE'])
+@async_login_required
+async def task_delete(request, pk):
+    if not await sync_to_async(delete_task)(request.user.pk, pk):
+        return not_found()
+    return HttpResponse(status=204)
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['action']}\ndata: {json.dumps(event)}\n\n"
+
+
+def get_last_event_id(request):
+    raw = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+async def stream_task_events(user_id, last_event_id, heartbeat):
+    broker = get_broker()
+    # Подписка до чтения журнала, чтобы не потерять события между ними
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f'retry: {heartbeat * 1000}\n\n'
+        if last_event_id is not None:
+            changes = TaskChange.objects.filter(user_id=user_id, id__gt=last_event_id).order_by('id')
+            async for change in changes:
+                last_event_id = change.id
+                yield format_event(change_event(change))
+
+        while not subscription.overflowed:
+            event = await subscription.get(timeout=heartbeat)
+            if event is None:
+                yield ': heartbeat\n\n'
+            elif last_event_id is None or event['id'] > last_event_id:
+                last_event_id = event['id']
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+@async_login_required
+async def task_events(request):
+    # Поток Server-Sent Events об изменениях задач пользователя
+    heartbeat = get_broker_settings()['HEARTBEAT']
+    response = StreamingHttpResponse(
+        stream_task_events(request.user.pk, get_last_event_id(request), heartbeat),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
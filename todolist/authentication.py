@@ -0,0 +1,182 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from todolist.cache import LocMemLRUBackend
+from todolist.models import RevokedToken
+
+
+DEFAULT_SETTINGS = {
+    # 'session' - только сессии, 'token' - только токены (LoginAPIView не
+    # создаёт сессию), 'both' - сессия и токен в ответе на вход
+    'MODE': 'both',
+    'TOKEN_TTL': 24 * 60 * 60,
+    # Сколько секунд пользователь из токена живёт в кэше процесса
+    'USER_CACHE_TTL': 60,
+    'USER_CACHE_SIZE': 10000,
+}
+
+TOKEN_SALT = 'todolist.authentication.token'
+
+
+def get_auth_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_AUTH', {})}
+
+
+def token_auth_enabled():
+    return get_auth_settings()['MODE'] in ('token', 'both')
+
+
+def session_auth_enabled():
+    return get_auth_settings()['MODE'] in ('session', 'both')
+
+
+def user_fingerprint(user):
+    # Меняется при смене пароля и делает старые токены недействительными
+    return user.get_session_auth_hash()[:16]
+
+
+def issue_token(user):
+    payload = {'uid': user.pk, 'jti': uuid.uuid4().hex, 'fp': user_fingerprint(user)}
+    return signing.dumps(payload, salt=TOKEN_SALT, compress=True)
+
+
+def load_token(token):
+    # Проверяет подпись HMAC и срок действия, без обращения к БД
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=get_auth_settings()['TOKEN_TTL'])
+    except signing.SignatureExpired:
+        raise AuthenticationFailed('Token has expired.')
+    except signing.BadSignature:
+        raise AuthenticationFailed('Invalid token.')
+
+
+def revoke_token(payload):
+    # Запись нужна, пока токен не истёк сам; заодно удаляются истёкшие
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=get_auth_settings()['TOKEN_TTL'])
+    RevokedToken.objects.update_or_create(jti=payload['jti'], defaults={'expires_at': expires_at})
+    RevokedToken.objects.filter(expires_at__lte=now).delete()
+
+
+def revoked_tokens(payload):
+    return RevokedToken.objects.filter(jti=payload['jti'], expires_at__gt=timezone.now())
+
+
+_user_cache = None
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = LocMemLRUBackend(max_entries=get_auth_settings()['USER_CACHE_SIZE'])
+    return _user_cache
+
+
+def check_token_user(user, payload):
+    if user is None or not user.is_active:
+        raise AuthenticationFailed('User inactive or deleted.')
+    if not constant_time_compare(user_fingerprint(user), payload.get('fp', '')):
+        raise AuthenticationFailed('Invalid token.')
+    return user
+
+
+def get_cached_token_user(payload):
+    # Устаревшая копия (например, пароль сменили после кэширования) не
+    # отклоняет новый токен, а перечитывается из БД
+    user = get_user_cache().get(payload['uid'])
+    if user is None or not user.is_active:
+        return None
+    if not constant_time_compare(user_fingerprint(user), payload.get('fp', '')):
+        return None
+    return user
+
+
+def cache_token_user(user):
+    get_user_cache().set(user.pk, user, get_auth_settings()['USER_CACHE_TTL'])
+
+
+def get_bearer_token(request):
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'bearer':
+        return None
+    if len(auth) != 2:
+        raise AuthenticationFailed('Invalid token header.')
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        raise AuthenticationFailed('Invalid token header.')
+
+
+def get_request_token_payload(request):
+    # Содержимое проверенного токена из заголовка или None, если заголовка нет
+    token = get_bearer_token(request)
+    if token is None:
+        return None
+    payload = load_token(token)
+    if revoked_tokens(payload).exists():
+        raise AuthenticationFailed('Token has been revoked.')
+    return payload
+
+
+async def aget_request_token_payload(request):
+    token = get_bearer_token(request)
+    if token is None:
+        return None
+    payload = load_token(token)
+    if await revoked_tokens(payload).aexists():
+        raise AuthenticationFailed('Token has been revoked.')
+    return payload
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Аутентификация по подписанному токену: Authorization: Bearer <token>.
+
+    Подпись и срок проверяются без БД, пользователь берётся из кэша процесса.
+    К БД идёт лишь проверка отзыва: один запрос по первичному ключу
+    RevokedToken, без таблиц пользователей и сессий.
+    """
+
+    def authenticate(self, request):
+        payload = get_request_token_payload(request)
+        if payload is None:
+            return None
+
+        user = get_cached_token_user(payload)
+        if user is None:
+            user = check_token_user(User.objects.filter(pk=payload['uid']).first(), payload)
+            cache_token_user(user)
+        return user, payload
+
+    def authenticate_header(self, request):
+        return 'Bearer'
+
+
+async def aauthenticate_token(request):
+    # Вариант SignedTokenAuthentication для асинхронных view
+    payload = await aget_request_token_payload(request)
+    if payload is None:
+        return None
+
+    user = get_cached_token_user(payload)
+    if user is None:
+        user = check_token_user(await User.objects.filter(pk=payload['uid']).afirst(), payload)
+        cache_token_user(user)
+    return user, payload
+
+
+@receiver(setting_changed)
+def reset_user_cache(setting, **kwargs):
+    global _user_cache
+    if setting == 'TODOLIST_AUTH':
+        _user_cache = None
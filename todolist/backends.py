@@ -0,0 +1,61 @@
+import hashlib
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+from todolist.hashers import get_password_settings
+
+
+def failed_login_key(username):
+    # Хэш имени: в ключе memcached нельзя пробелы и управляющие символы
+    digest = hashlib.sha256(username.casefold().encode()).hexdigest()
+    return f'todolist:login-failures:{digest}'
+
+
+def get_failure_cache():
+    return caches[get_password_settings()['FAILED_LOGIN_CACHE']]
+
+
+def login_failures(username):
+    return get_failure_cache().get(failed_login_key(username), 0)
+
+
+def is_login_locked(username):
+    return login_failures(username) >= get_password_settings()['FAILED_LOGIN_LIMIT']
+
+
+def record_login_failure(username):
+    # Окно считается от первой неудачи: add не продлевает срок существующего ключа
+    cache = get_failure_cache()
+    key = failed_login_key(username)
+    cache.add(key, 0, get_password_settings()['FAILED_LOGIN_WINDOW'])
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Ключ истёк между add и incr
+        cache.add(key, 1, get_password_settings()['FAILED_LOGIN_WINDOW'])
+
+
+def clear_login_failures(username):
+    get_failure_cache().delete(failed_login_key(username))
+
+
+class LoginFailureBackend(ModelBackend):
+    """
+    ModelBackend, который не проверяет пароль для имени, на котором
+    FAILED_LOGIN_LIMIT раз подряд ошиблись: перебор такого имени не стоит
+    ни одного вычисления хэша до конца окна FAILED_LOGIN_WINDOW.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        # Не строку (число из JSON) счётчик не ведёт: такое имя не совпадёт ни с одним
+        if not isinstance(username, str) or password is None:
+            return super().authenticate(request, username, password, **kwargs)
+        if is_login_locked(username):
+            return None
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None:
+            record_login_failure(username)
+        else:
+            clear_login_failures(username)
+        return user
@@ -0,0 +1,121 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'todolist.broker.InMemoryBroker',
+    # Максимум событий в очереди одного подключения
+    'QUEUE_SIZE': 100,
+    # Интервал пустых комментариев SSE, секунды
+    'HEARTBEAT': 15,
+}
+
+
+class Subscription:
+    def __init__(self, user_id, maxsize):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        # Подписчик не успевал читать и был отключён; клиент
+        # переподключится с Last-Event-ID и догонит по журналу изменений
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Выполняется в цикле событий подписчика
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BaseBroker:
+    """
+    Pub/sub событий задач внутри процесса.
+
+    publish() можно вызывать из любого потока (синхронные view работают
+    в пуле потоков), subscribe() - только из цикла событий.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+
+    def subscribe(self, user_id):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, user_id, events):
+        raise NotImplementedError
+
+
+class InMemoryBroker(BaseBroker):
+    def __init__(self, queue_size=100):
+        super().__init__(queue_size)
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, events):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            for event in events:
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+                except RuntimeError:
+                    # Цикл событий подписчика уже закрыт
+                    self.unsubscribe(subscription)
+                    break
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+def get_broker_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_EVENTS', {})}
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        config = get_broker_settings()
+        _broker = import_string(config['BACKEND'])(queue_size=config['QUEUE_SIZE'])
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'TODOLIST_EVENTS':
+        _broker = None
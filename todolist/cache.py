@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from todolist.pagination import get_task_ordering, include_archived
+from todolist.routers import shard_for_user
+
+
+DEFAULT_SETTINGS = {
+    # Включать только с общим для процессов бэкендом или с одним процессом
+    'ENABLED': False,
+    'BACKEND': 'todolist.cache.LocMemLRUBackend',
+    'TIMEOUT': 300,
+    'OPTIONS': {},
+}
+
+
+def list_params(request):
+    # Нормализованные параметры запроса списка, от которых зависит ответ
+    params = request.query_params
+    sort_by, descending = get_task_ordering(params)
+    return [
+        params.get('search-area', '').strip(),
+        sort_by,
+        'desc' if descending else 'asc',
+        params.get('limit', ''),
+        params.get('cursor', ''),
+        'archived' if include_archived(params) else '',
+        # Ссылка next повторяет адрес запроса; без пагинации ответ от него не зависит
+        request.build_absolute_uri() if 'limit' in params or 'cursor' in params else '',
+    ]
+
+
+class LocMemLRUBackend:
+    """
+    Кэш в памяти процесса: вытеснение по LRU при превышении max_entries
+    и по TTL при чтении.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DjangoCacheBackend:
+    """
+    Обёртка над кэшем из settings.CACHES (файловый, БД, memcached, redis...),
+    позволяет делить кэш между процессами.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class TaskResponseCache:
+    """
+    Кэш ответов списка и деталей задач.
+
+    Ключ содержит номер версии пользователя, поэтому любая запись задач
+    пользователя инвалидирует все его записи одним обновлением версии.
+    """
+
+    def __init__(self, backend, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def version_key(self, user_id):
+        return f'todolist:version:{user_id}'
+
+    def get_version(self, user_id):
+        version = self.backend.get(self.version_key(user_id))
+        if version is None:
+            # Версия по времени, а не с 1: после вытеснения ключа версии
+            # старые записи не должны снова стать актуальными
+            version = self.bump(user_id)
+        return version
+
+    def bump(self, user_id):
+        version = time.time_ns()
+        self.backend.set(self.version_key(user_id), version)
+        return version
+
+    def list_key(self, request):
+        return self.make_key(request.user.pk, 'list', list_params(request))
+
+    def detail_key(self, request, pk):
+        return self.make_key(request.user.pk, 'detail', [str(pk)])
+
+    def make_key(self, user_id, kind, parts):
+        version = self.get_version(user_id)
+        return f'todolist:{kind}:{user_id}:{version}:' + '|'.join(parts)
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.timeout)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def get_cache_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_CACHE', {})}
+
+
+_task_cache = None
+
+
+def get_task_cache():
+    # None, если кэширование отключено в настройках
+    global _task_cache
+    if _task_cache is None:
+        config = get_cache_settings()
+        if not config['ENABLED']:
+            return None
+        backend = import_string(config['BACKEND'])(**config['OPTIONS'])
+        _task_cache = TaskResponseCache(backend, timeout=config['TIMEOUT'])
+    return _task_cache
+
+
+def invalidate_user_tasks(user_id):
+    task_cache = get_task_cache()
+    if task_cache is None or user_id is None:
+        return
+    task_cache.bump(user_id)
+    using = shard_for_user(user_id)
+    if transaction.get_connection(using).in_atomic_block:
+        # Повторно после коммита, чтобы не закэшировать данные, прочитанные
+        # параллельным запросом до завершения транзакции
+        transaction.on_commit(lambda: task_cache.bump(user_id), using=using)
+
+
+@receiver(setting_changed)
+def reset_task_cache(setting, **kwargs):
+    global _task_cache
+    if setting == 'TODOLIST_CACHE':
+        _task_cache = None
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+from todolist.cache import get_cache_settings
+from todolist.hashers import get_password_settings
+from todolist.routers import get_replica_settings
+
+
+# Бэкенды settings.CACHES, данные которых видит только один процесс
+LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def is_local_cache(alias):
+    return settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_CACHE_BACKENDS
+
+
+def shared_caches():
+    # (настройка, алиас, что сломается) для включённых возможностей. Кэш
+    # размещения шардов может быть в памяти процесса: он живёт PLACEMENT_TTL
+    if 'todolist.backends.LoginFailureBackend' in settings.AUTHENTICATION_BACKENDS:
+        yield 'TODOLIST_PASSWORDS FAILED_LOGIN_CACHE', get_password_settings()['FAILED_LOGIN_CACHE'], \
+            'each process counts failed logins separately'
+    if get_replica_settings()['DATABASES']:
+        yield 'TODOLIST_REPLICAS STICKY_CACHE', get_replica_settings()['STICKY_CACHE'], \
+            'other processes read a user\'s own writes from a lagging replica'
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    errors = [
+        Error(
+            f"{setting} uses the cache '{alias}', which is local to one process: {problem}.",
+            hint='Use a backend shared by all processes in CACHES (redis, memcached, file or database cache).',
+            id='todolist.E001',
+        )
+        for setting, alias, problem in shared_caches() if is_local_cache(alias)
+    ]
+
+    config = get_cache_settings()
+    if config['ENABLED'] and (
+        config['BACKEND'] == 'todolist.cache.LocMemLRUBackend'
+        or config['BACKEND'] == 'todolist.cache.DjangoCacheBackend'
+        and is_local_cache(config['OPTIONS'].get('alias', 'default'))
+    ):
+        errors.append(Warning(
+            'TODOLIST_CACHE keeps responses in one process: with several workers, the others serve stale '
+            'task lists until TIMEOUT.',
+            hint="Use 'todolist.cache.DjangoCacheBackend' with a shared CACHES alias, or run a single process.",
+            id='todolist.W001',
+        ))
+    return errors
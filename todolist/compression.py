@@ -0,0 +1,158 @@
+import zlib
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    # Ответы короче не сжимаются: выигрыш меньше заголовков и времени сжатия
+    'MIN_SIZE': 1024,
+    # Порядок предпочтения; 'br' - только если установлен brotli
+    'ALGORITHMS': ('br', 'gzip'),
+    # Уровни для динамических ответов: почти та же степень сжатия за малую долю времени
+    'BROTLI_QUALITY': 4,
+    'GZIP_LEVEL': 6,
+    'CONTENT_TYPES': (
+        'application/json', 'application/msgpack', 'application/x-ndjson', 'text/csv',
+        'text/html', 'text/plain', 'text/css', 'application/javascript',
+    ),
+}
+
+
+def get_compression_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_COMPRESSION', {})}
+
+
+def available_algorithms(config):
+    return [name for name in config['ALGORITHMS'] if name == 'gzip' or (name == 'br' and brotli is not None)]
+
+
+def choose_encoding(accept_encoding, algorithms):
+    # Первый из algorithms, который клиент принимает с q > 0
+    accepted = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        try:
+            accepted[name.strip()] = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            accepted[name.strip()] = 0.0
+    for name in algorithms:
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return None
+
+
+class GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data):
+        # Z_SYNC_FLUSH: каждый кусок потока сразу уходит клиенту
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+def make_stream(encoding, config):
+    if encoding == 'br':
+        return BrotliStream(config['BROTLI_QUALITY'])
+    return GzipStream(config['GZIP_LEVEL'])
+
+
+def compress_bytes(encoding, data, config):
+    # Ответ целиком: без промежуточных сбросов потока
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['BROTLI_QUALITY'])
+    compressor = zlib.compressobj(config['GZIP_LEVEL'], zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_chunks(chunks, stream):
+    for chunk in chunks:
+        if chunk:
+            yield stream.compress(chunk)
+    yield stream.finish()
+
+
+async def acompress_chunks(chunks, stream):
+    async for chunk in chunks:
+        if chunk:
+            yield stream.compress(chunk)
+    yield stream.finish()
+
+
+@sync_and_async_middleware
+def compression_middleware(get_response):
+    """
+    Сжатие ответов brotli или gzip по Accept-Encoding.
+
+    Обычные ответы сжимаются целиком, если они не короче MIN_SIZE и сжатый
+    вариант меньше. Потоковые (экспорт задач) сжимаются по мере отдачи, без
+    накопления в памяти; поток событий (text/event-stream) не сжимается.
+    Суффикс сжатия в ETag добавляет representation_etag_middleware
+    (todolist/conditional.py), она же снимает его с If-Match.
+    """
+    config = get_compression_settings()
+    algorithms = available_algorithms(config)
+    if not config['ENABLED'] or not algorithms:
+        raise MiddlewareNotUsed
+    content_types = tuple(config['CONTENT_TYPES'])
+
+    def compress_response(request, response):
+        if response.has_header('Content-Encoding') or response.status_code == 206:
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in content_types:
+            return response
+        if not response.streaming and len(response.content) < config['MIN_SIZE']:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), algorithms)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            stream = make_stream(encoding, config)
+            if response.is_async:
+                response.streaming_content = acompress_chunks(response.streaming_content, stream)
+            else:
+                response.streaming_content = compress_chunks(response.streaming_content, stream)
+            del response['Content-Length']
+        else:
+            compressed = compress_bytes(encoding, response.content, config)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return compress_response(request, await get_response(request))
+    else:
+        def middleware(request):
+            return compress_response(request, get_response(request))
+    return middleware
@@ -0,0 +1,175 @@
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.db.models import Count, Max, Subquery
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.http import http_date, parse_etags
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from todolist.cache import get_task_cache
+from todolist.models import TaskListState
+from todolist.singleflight import coalesce
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def list_validators(queryset, user_id, variant=''):
+    # Один агрегирующий запрос: последнее обновление, число строк и
+    # время последнего удаления (иначе удаление старой задачи не меняет ETag)
+    last_deleted = TaskListState.objects.filter(user_id=user_id).values('last_deleted_at')
+    row = queryset.order_by().aggregate(
+        last_updated=Max('updated_at'),
+        count=Count('id'),
+        last_deleted=Max(Subquery(last_deleted[:1])),
+    )
+    stamps = [stamp for stamp in (row['last_updated'], row['last_deleted']) if stamp is not None]
+    last_modified = int(max(stamps).timestamp()) if stamps else None
+    etag = make_etag(row['last_updated'], row['count'], row['last_deleted'], variant)
+    return etag, last_modified
+
+
+def task_validators(task_id, updated_at):
+    return make_etag(task_id, updated_at), int(updated_at.timestamp())
+
+
+def has_preconditions(request):
+    # If-Match / If-Unmodified-Since требуют сравнить версию задачи до записи
+    return 'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+
+
+def detail_validators(queryset, task_id, archived=None):
+    # archived - задачи пользователя в архиве, там ищется задача, которой нет в queryset
+    updated_at = queryset.filter(uuid=task_id).values_list('updated_at', flat=True).first()
+    if updated_at is None and archived is not None:
+        updated_at = archived.filter(uuid=task_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        raise Http404
+    return task_validators(task_id, updated_at)
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # Формат и сжатие добавляет к ETag representation_etag_middleware
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def render_response(request, response):
+    # Тело и Content-Type, как после finalize_response DRF
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = request.parser_context['view'].get_renderer_context()
+    return response.rendered_content, response['Content-Type']
+
+
+def conditional_task_response(request, make_cache_key, get_validators, get_response, flight_key):
+    """
+    Ответ на GET списка или задачи с учётом кэша и условных заголовков.
+
+    ETag и Last-Modified хранятся в кэше вместе с данными, поэтому при
+    попадании в кэш ответ 304 отдаётся без запросов к задачам. Иначе
+    валидаторы считаются до данных: если между запросами произойдёт запись,
+    клиент получит более старый ETag и просто перезапросит список.
+    Одновременные запросы с тем же flight_key, типом ответа и ETag получают
+    тело, отрисованное один раз (todolist/singleflight.py).
+    """
+    task_cache = get_task_cache()
+    entry = None
+    if task_cache is not None:
+        cache_key = make_cache_key(task_cache)
+        entry = task_cache.get(cache_key)
+    if entry is not None:
+        etag, last_modified = entry['etag'], entry['last_modified']
+    else:
+        etag, last_modified = get_validators()
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    if entry is not None:
+        response = Response(entry['data'], headers={'X-Cache': 'HIT'})
+    else:
+        # Страница Browsable API содержит CSRF-токен сессии, её каждый отрисовывает сам
+        share_content = not isinstance(request.accepted_renderer, BrowsableAPIRenderer)
+        media_type = request.accepted_media_type if share_content else 'api'
+
+        def compute():
+            shared = get_response()
+            rendered = render_response(request, shared) if share_content and shared.status_code == 200 else None
+            return shared.data, shared.status_code, rendered
+
+        data, status, rendered = coalesce((request.user.pk, *flight_key, media_type, etag), compute)
+        response = Response(data, status=status)
+        if rendered is not None:
+            response.content, response['Content-Type'] = rendered
+        if task_cache is not None and response.status_code == 200:
+            task_cache.set(cache_key, {'data': response.data, 'etag': etag, 'last_modified': last_modified})
+            response['X-Cache'] = 'MISS'
+    return set_validator_headers(response, etag, last_modified)
+
+
+def representation_suffix(response):
+    # Формат (кроме JSON) и Content-Encoding: байты этих представлений различаются
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    parts = [] if content_type in ('', 'application/json') else [content_type.rpartition('/')[2]]
+    if response.has_header('Content-Encoding'):
+        parts.append(response['Content-Encoding'])
+    return ''.join(f'-{part}' for part in parts)
+
+
+def split_etag(etag):
+    # '"<sha1>-msgpack-gzip"' -> '"<sha1>"'; в версиях из make_etag дефисов нет
+    base, dash, _ = etag.partition('-')
+    return base + '"' if dash else etag
+
+
+@sync_and_async_middleware
+def representation_etag_middleware(get_response):
+    """
+    ETag представления: к версии задач из make_etag добавляются формат и
+    Content-Encoding ответа ("<версия>-msgpack-gzip"), чтобы сильный ETag не
+    совпадал у разных байтов. Из If-Match и If-None-Match суффиксы
+    отбрасываются до views, поэтому If-Match после сжатого GET проходит, а
+    ответ 304 с ETag получает тот, что прислал клиент. Стоит снаружи сжатия.
+    """
+    def strip_request(request):
+        sent = {}
+        for header in ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH'):
+            if header not in request.META:
+                continue
+            etags = parse_etags(request.META[header])
+            if header == 'HTTP_IF_NONE_MATCH':
+                for etag in etags:
+                    sent.setdefault(split_etag(etag).removeprefix('W/'), etag)
+            request.META[header] = ', '.join(split_etag(etag) for etag in etags)
+        return sent
+
+    def patch_response(response, sent):
+        if not response.has_header('ETag'):
+            return response
+        if response.status_code == 304:
+            response['ETag'] = sent.get(response['ETag'].removeprefix('W/'), response['ETag'])
+        else:
+            suffix = representation_suffix(response)
+            if suffix:
+                response['ETag'] = response['ETag'][:-1] + suffix + '"'
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            sent = strip_request(request)
+            return patch_response(await get_response(request), sent)
+    else:
+        def middleware(request):
+            sent = strip_request(request)
+            return patch_response(get_response(request), sent)
+    return middleware
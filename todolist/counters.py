@@ -0,0 +1,195 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import connections, router
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from todolist.models import ArchivedTask, Task_char, TaskListState
+
+
+TASK_TABLE = Task_char._meta.db_table
+ARCHIVE_TABLE = ArchivedTask._meta.db_table
+STATE_TABLE = TaskListState._meta.db_table
+TRIGGER = 'todolist_task_counts'
+
+# Счётчики задач пользователя в TaskListState поддерживают триггеры БД: так
+# они меняются в той же транзакции при любой записи - из view, пакетных
+# эндпоинтов, ORM, админки и одиночного UPDATE ... RETURNING, которому
+# старые значения строки недоступны. Изменение задачи - это удаление старой
+# строки из счётчиков и добавление новой. Сутки для "обновлено сегодня" - по UTC.
+
+
+def _add_sql(row, completed, day):
+    # Учесть строку `row` (NEW) в счётчиках её пользователя
+    return f"""
+        INSERT INTO {STATE_TABLE} (user_id, compacted_through, task_count, completed_count, updated_today_count)
+        SELECT {row}.user_id, 0, 0, 0, 0 WHERE {row}.user_id IS NOT NULL
+        ON CONFLICT (user_id) DO NOTHING;
+        UPDATE {STATE_TABLE} SET
+            task_count = task_count + 1,
+            completed_count = completed_count + {completed},
+            updated_today_count = CASE
+                WHEN updated_day = {day} THEN updated_today_count + 1
+                WHEN updated_day IS NULL OR updated_day < {day} THEN 1
+                ELSE updated_today_count END,
+            updated_day = CASE WHEN updated_day IS NULL OR updated_day < {day} THEN {day} ELSE updated_day END
+        WHERE user_id = {row}.user_id;"""
+
+
+def _remove_sql(row, completed, day):
+    # Убрать строку `row` (OLD) из счётчиков; строку состояния не создаёт,
+    # иначе удаление пользователя каскадом вставило бы её заново
+    return f"""
+        UPDATE {STATE_TABLE} SET
+            task_count = task_count - 1,
+            completed_count = completed_count - {completed},
+            updated_today_count = updated_today_count - CASE WHEN updated_day = {day} THEN 1 ELSE 0 END
+        WHERE user_id = {row}.user_id;"""
+
+
+def _sqlite(row):
+    return row, f'{row}.completed', f'date({row}.updated_at)'
+
+
+def _pg(row):
+    return row, f'{row}.completed::int', f"({row}.updated_at AT TIME ZONE 'UTC')::date"
+
+
+def sqlite_install(table, trigger):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {trigger}_ai AFTER INSERT ON {table} BEGIN
+            {_add_sql(*_sqlite('new'))}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {trigger}_ad AFTER DELETE ON {table} BEGIN
+            {_remove_sql(*_sqlite('old'))}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {trigger}_au AFTER UPDATE OF user_id, completed, updated_at ON {table} BEGIN
+            {_remove_sql(*_sqlite('old'))}
+            {_add_sql(*_sqlite('new'))}
+        END""",
+    ]
+
+
+def sqlite_uninstall(table, trigger):
+    return [
+        f'DROP TRIGGER IF EXISTS {trigger}_ai',
+        f'DROP TRIGGER IF EXISTS {trigger}_ad',
+        f'DROP TRIGGER IF EXISTS {trigger}_au',
+    ]
+
+
+# Функция PostgreSQL общая для рабочей таблицы и архива
+PG_FUNCTION = f"""CREATE OR REPLACE FUNCTION {TRIGGER}() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            {_remove_sql(*_pg('OLD'))}
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            {_add_sql(*_pg('NEW'))}
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql"""
+
+
+def pg_install(table, trigger):
+    return [
+        PG_FUNCTION,
+        f'DROP TRIGGER IF EXISTS {trigger} ON {table}',
+        f"""CREATE TRIGGER {trigger} AFTER INSERT OR DELETE OR UPDATE OF user_id, completed, updated_at
+            ON {table} FOR EACH ROW EXECUTE FUNCTION {TRIGGER}()""",
+    ]
+
+
+def pg_uninstall(table, trigger):
+    statements = [f'DROP TRIGGER IF EXISTS {trigger} ON {table}']
+    if table == TASK_TABLE:
+        statements.append(f'DROP FUNCTION IF EXISTS {TRIGGER}()')
+    return statements
+
+
+# Задачи в архиве (ArchivedTask) тоже считаются: перенос в архив и обратно -
+# удаление из одной таблицы и вставка в другую, счётчики не меняются
+TRIGGERS = {
+    TASK_TABLE: TRIGGER,
+    ARCHIVE_TABLE: 'todolist_archived_task_counts',
+}
+
+
+def counters_supported(connection):
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def install_task_counters(connection, table=TASK_TABLE):
+    # Триггеры SQLite пропадают при пересоздании таблицы задач - миграции,
+    # которые её пересоздают, должны вызвать это снова
+    if connection.vendor == 'sqlite':
+        _execute(connection, sqlite_install(table, TRIGGERS[table]))
+    elif connection.vendor == 'postgresql':
+        _execute(connection, pg_install(table, TRIGGERS[table]))
+
+
+def uninstall_task_counters(connection, table=TASK_TABLE):
+    if connection.vendor == 'sqlite':
+        _execute(connection, sqlite_uninstall(table, TRIGGERS[table]))
+    elif connection.vendor == 'postgresql':
+        _execute(connection, pg_uninstall(table, TRIGGERS[table]))
+
+
+def utc_today():
+    return timezone.now().astimezone(dt_timezone.utc).date()
+
+
+def count_aggregates(today):
+    # Агрегаты для подсчёта по таблице задач (и в миграции с исторической моделью)
+    start = datetime.combine(today, time.min, tzinfo=dt_timezone.utc)
+    return {
+        'total': Count('id'),
+        'completed': Count('id', filter=Q(completed=True)),
+        'updated_today': Count('id', filter=Q(updated_at__gte=start, updated_at__lt=start + timedelta(days=1))),
+    }
+
+
+def count_tasks(user_id, today=None):
+    # Подсчёт по задачам и архиву: эталон для reconcile_task_counts и запасной путь
+    aggregates = count_aggregates(today or utc_today())
+    counts = Task_char.objects.filter(user_id=user_id).aggregate(**aggregates)
+    archived = ArchivedTask.objects.filter(user_id=user_id).aggregate(**aggregates)
+    return {name: counts[name] + archived[name] for name in counts}
+
+
+def stored_counts(state, today=None):
+    # Счётчики из строки TaskListState (или None) в том же виде, что count_tasks()
+    if state is None:
+        return {'total': 0, 'completed': 0, 'updated_today': 0}
+    today = today or utc_today()
+    return {
+        'total': state.task_count,
+        'completed': state.completed_count,
+        # Счётчик за прошлые сутки означает, что сегодня обновлений ещё не было
+        'updated_today': state.updated_today_count if state.updated_day == today else 0,
+    }
+
+
+def get_task_stats(user_id):
+    """
+    Сводка задач пользователя: total, completed, pending, updated_today.
+
+    Где есть триггеры - чтение одной строки по первичному ключу, иначе подсчёт.
+    """
+    if counters_supported(connections[router.db_for_read(TaskListState, user_id=user_id)]):
+        counts = stored_counts(TaskListState.objects.filter(user_id=user_id).first())
+    else:
+        counts = count_tasks(user_id)
+    return {
+        'total': counts['total'],
+        'completed': counts['completed'],
+        'pending': counts['total'] - counts['completed'],
+        'updated_today': counts['updated_today'],
+    }
@@ -0,0 +1,87 @@
+import threading
+
+from django.db.backends.sqlite3 import base
+
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # С WAL fsync только при checkpoint, транзакция не теряет целостность
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательное значение - размер в KiB
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+
+
+def get_write_queue(name):
+    # Одна очередь записи на файл базы в процессе
+    with _write_queues_lock:
+        return _write_queues.setdefault(str(name), threading.RLock())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite для продакшена.
+
+    Прагмы из OPTIONS['pragmas'] (поверх DEFAULT_PRAGMAS) ставятся при
+    подключении. Пишущие транзакции (transaction_mode IMMEDIATE или EXCLUSIVE)
+    внутри процесса ждут своей очереди на блокировке Python, а не опрашивают
+    файл в busy-handler SQLite; busy_timeout остаётся для других процессов.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.write_queue = True
+        self._holds_write_queue = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        self.write_queue = kwargs.pop('write_queue', True)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.write_queue and self.transaction_mode in ('IMMEDIATE', 'EXCLUSIVE'):
+            # По истечении busy_timeout идём дальше и полагаемся на SQLite
+            queue = get_write_queue(self.settings_dict['NAME'])
+            self._holds_write_queue = queue.acquire(timeout=int(self.pragmas['busy_timeout']) / 1000)
+        try:
+            super()._start_transaction_under_autocommit()
+        except Exception:
+            self._release_write_queue()
+            raise
+
+    def _release_write_queue(self):
+        if self._holds_write_queue:
+            self._holds_write_queue = False
+            get_write_queue(self.settings_dict['NAME']).release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_write_queue()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_write_queue()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_write_queue()
@@ -0,0 +1,144 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import APIException
+
+
+DEFAULT_SETTINGS = {
+    # Параметры по рекомендациям OWASP; при изменении хэш пересчитывается при входе
+    'SCRYPT': {'WORK_FACTOR': 2 ** 15, 'BLOCK_SIZE': 8, 'PARALLELISM': 1},
+    'ARGON2': {'TIME_COST': 2, 'MEMORY_COST': 19456, 'PARALLELISM': 1},
+    # Одновременных вычислений хэша на процесс и сколько их может ждать в очереди
+    'HASH_WORKERS': os.cpu_count() or 1,
+    'MAX_PENDING_HASHES': 4 * (os.cpu_count() or 1),
+    # После стольких неудачных входов подряд пароль этого имени не проверяется
+    # до конца окна (секунды)
+    'FAILED_LOGIN_LIMIT': 5,
+    'FAILED_LOGIN_WINDOW': 300,
+    # Кэш из settings.CACHES, общий для всех процессов (todolist/checks.py)
+    'FAILED_LOGIN_CACHE': 'shared',
+}
+
+
+def get_password_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_PASSWORDS', {})}
+
+
+class HashingOverloaded(APIException):
+    status_code = 503
+    default_detail = 'Too many password checks in progress, try again later.'
+    default_code = 'hashing_overloaded'
+    # DRF добавляет Retry-After по атрибуту wait
+    wait = 1
+
+
+class HashingExecutor:
+    """
+    Пул потоков для вычисления хэшей паролей.
+
+    hashlib и argon2 отпускают GIL, поэтому хэши считаются параллельно, но не
+    больше workers одновременно: волна входов не забирает все ядра у
+    запросов задач. Если в очереди уже max_pending хэшей, сразу HashingOverloaded.
+    """
+
+    def __init__(self, workers, max_pending):
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='todolist-hash', initializer=self._mark)
+        self._slots = threading.BoundedSemaphore(max(max_pending, workers))
+
+    def _mark(self):
+        self._local.in_pool = True
+
+    def run(self, func, *args):
+        # verify() хэшеров вызывает encode(): внутри пула считаем на месте
+        if getattr(self._local, 'in_pool', False):
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingOverloaded
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future.result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                config = get_password_settings()
+                _executor = HashingExecutor(config['HASH_WORKERS'], config['MAX_PENDING_HASHES'])
+    return _executor
+
+
+@receiver(setting_changed)
+def reset_hashing_executor(setting, **kwargs):
+    global _executor
+    if setting == 'TODOLIST_PASSWORDS' and _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+class BoundedHashingMixin:
+    # Вычисление хэша - в HashingExecutor, а не в потоке запроса
+    def encode(self, password, salt, *args):
+        return get_hashing_executor().run(super().encode, password, salt, *args)
+
+    def verify(self, password, encoded):
+        return get_hashing_executor().run(super().verify, password, encoded)
+
+    def harden_runtime(self, password, encoded):
+        return get_hashing_executor().run(super().harden_runtime, password, encoded)
+
+
+class TunedScryptPasswordHasher(BoundedHashingMixin, ScryptPasswordHasher):
+    # Тот же формат "scrypt$...", что у ScryptPasswordHasher, с параметрами из настроек.
+    # scrypt требует 128 * N * r байт, лимит OpenSSL по умолчанию - 32 МиБ;
+    # запас на проверку старых хэшей с большим N
+    maxmem = 256 * 1024 * 1024
+
+    @property
+    def work_factor(self):
+        return get_password_settings()['SCRYPT']['WORK_FACTOR']
+
+    @property
+    def block_size(self):
+        return get_password_settings()['SCRYPT']['BLOCK_SIZE']
+
+    @property
+    def parallelism(self):
+        return get_password_settings()['SCRYPT']['PARALLELISM']
+
+
+class TunedArgon2PasswordHasher(BoundedHashingMixin, Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return get_password_settings()['ARGON2']['TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return get_password_settings()['ARGON2']['MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return get_password_settings()['ARGON2']['PARALLELISM']
+
+
+class BoundedPBKDF2PasswordHasher(BoundedHashingMixin, PBKDF2PasswordHasher):
+    # Для старых хэшей: пересчитываются в основной алгоритм при входе
+    pass
@@ -0,0 +1,225 @@
+import logging
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from todolist.models import ArchivedTask, Job, Task_char
+from todolist.parsers import iter_ndjson
+from todolist.renderers import NDJSONRenderer
+from todolist.routers import shard_for_user
+from todolist.signals import bulk_task_changes, tasks_changed
+from todolist.transfer import TaskImporter, export_rows
+
+
+logger = logging.getLogger('todolist.jobs')
+
+DEFAULT_SETTINGS = {
+    # Файлы экспорта и загруженные файлы импорта
+    'FILES_DIR': Path(settings.BASE_DIR) / 'job_files',
+    # Сколько секунд задача принадлежит воркеру без продления аренды
+    'VISIBILITY_TIMEOUT': 300,
+    'MAX_ATTEMPTS': 3,
+    # Задержка перед повтором, удваивается с каждой попыткой
+    'RETRY_DELAY': 10,
+    'BATCH_SIZE': 500,
+}
+
+JOB_HANDLERS = {}
+
+
+class JobLeaseLost(Exception):
+    # Аренда истекла и задачу забрал другой воркер
+    pass
+
+
+def get_jobs_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_JOBS', {})}
+
+
+def job_handler(kind):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def job_file_path(job, name):
+    files_dir = Path(get_jobs_settings()['FILES_DIR'])
+    files_dir.mkdir(parents=True, exist_ok=True)
+    return files_dir / f'{job.id}-{name}'
+
+
+def enqueue_job(user, kind, payload=None, write_files=None):
+    """
+    Ставит задачу в очередь. write_files(job) пишет входные файлы до коммита,
+    поэтому воркер не увидит задачу без них.
+    """
+    with transaction.atomic():
+        job = Job.objects.create(
+            user=user, kind=kind, payload=payload or {}, max_attempts=get_jobs_settings()['MAX_ATTEMPTS'],
+        )
+        if write_files is not None:
+            write_files(job)
+    return job
+
+
+def claimable(now):
+    # В очереди и пора запускать, или выполнялась, но аренда истекла
+    return (
+        Q(status=Job.QUEUED, run_after__lte=now)
+        | Q(status=Job.RUNNING, locked_until__lt=now)
+    )
+
+
+def fail_abandoned_jobs():
+    # Воркер пропал на последней попытке - повторять больше нечего
+    now = timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_until__lt=now, attempts__gte=F('max_attempts'),
+    ).update(status=Job.FAILED, error='Visibility timeout expired.', finished_at=now, locked_until=None)
+
+
+def claim_jobs(limit):
+    """
+    Забирает до `limit` задач. Каждая забирается условным UPDATE, поэтому
+    два воркера не получат одну задачу ни в SQLite, ни в PostgreSQL.
+    Возвращает список (job_id, lease).
+    """
+    fail_abandoned_jobs()
+    now = timezone.now()
+    visibility = timedelta(seconds=get_jobs_settings()['VISIBILITY_TIMEOUT'])
+    candidates = Job.objects.filter(claimable(now)).order_by('run_after', 'id').values_list('id', flat=True)[:limit]
+    claimed = []
+    for job_id in list(candidates):
+        lease = uuid.uuid4().hex
+        updated = Job.objects.filter(claimable(now), id=job_id).update(
+            status=Job.RUNNING, locked_by=lease, locked_until=now + visibility,
+            attempts=F('attempts') + 1, updated_at=now,
+        )
+        if updated:
+            claimed.append((job_id, lease))
+    return claimed
+
+
+class JobContext:
+    def __init__(self, job, lease):
+        self.job = job
+        self.lease = lease
+        self.visibility = timedelta(seconds=get_jobs_settings()['VISIBILITY_TIMEOUT'])
+        self.extended_at = timezone.now()
+
+    def owned(self):
+        return Job.objects.filter(id=self.job.id, locked_by=self.lease)
+
+    def heartbeat(self):
+        # Продлевает аренду не чаще, чем раз в половину таймаута
+        now = timezone.now()
+        if now - self.extended_at < self.visibility / 2:
+            return
+        if not self.owned().update(locked_until=now + self.visibility, updated_at=now):
+            raise JobLeaseLost(self.job.id)
+        self.extended_at = now
+
+    def save_progress(self, progress):
+        # Вызывать в одной транзакции с записью данных: повтор продолжит с этого места
+        if not self.owned().update(result=progress, updated_at=timezone.now()):
+            raise JobLeaseLost(self.job.id)
+
+
+def run_job(job_id, lease):
+    try:
+        job = Job.objects.get(id=job_id, locked_by=lease)
+    except Job.DoesNotExist:
+        return
+    context = JobContext(job, lease)
+    try:
+        result = JOB_HANDLERS[job.kind](job, context)
+    except JobLeaseLost:
+        logger.warning('Job %s lost its lease', job_id)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %d', job_id, job.kind, job.attempts)
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            delay = get_jobs_settings()['RETRY_DELAY'] * 2 ** (job.attempts - 1)
+            context.owned().update(
+                status=Job.QUEUED, error=repr(exc), run_after=now + timedelta(seconds=delay),
+                locked_by='', locked_until=None, updated_at=now,
+            )
+        else:
+            context.owned().update(
+                status=Job.FAILED, error=repr(exc), finished_at=now, locked_by='', locked_until=None, updated_at=now,
+            )
+    else:
+        now = timezone.now()
+        context.owned().update(
+            status=Job.SUCCEEDED, result=result, error='', finished_at=now, locked_by='', locked_until=None,
+            updated_at=now,
+        )
+
+
+def run_job_in_worker(job_id, lease):
+    # Поток или процесс пула держит своё подключение между задачами
+    close_old_connections()
+    try:
+        run_job(job_id, lease)
+    finally:
+        close_old_connections()
+
+
+@job_handler(Job.EXPORT)
+def export_tasks(job, context):
+    # NDJSON: одна задача в строке, в формате TaskCharSerializer
+    count = 0
+
+    def rows():
+        nonlocal count
+        for row in export_rows(job.user_id):
+            count += 1
+            yield row
+
+    with open(job_file_path(job, 'export.ndjson'), 'wb') as output:
+        for chunk in NDJSONRenderer().stream(rows()):
+            output.write(chunk)
+            context.heartbeat()
+    return {'count': count, 'format': 'ndjson'}
+
+
+@job_handler(Job.IMPORT)
+def import_tasks(job, context):
+    # Прогресс сохраняется вместе с каждым пакетом, повтор не создаёт дубликатов
+    def save_progress(importer):
+        context.save_progress(importer.progress())
+        context.heartbeat()
+
+    importer = TaskImporter(job.user_id, get_jobs_settings()['BATCH_SIZE'], on_batch=save_progress, **job.result)
+    with open(job_file_path(job, 'import.ndjson'), 'rb') as source:
+        importer.feed(iter_ndjson(source))
+    return {'created': importer.created, 'updated': importer.updated, 'errors': importer.errors}
+
+
+@job_handler(Job.CLEAR_COMPLETED)
+def clear_completed_tasks(job, context):
+    # Короткими пакетами, чтобы не держать блокировку записи на всё время.
+    # Задачи в архиве тоже выполненные и удаляются следом за рабочими
+    batch_size = get_jobs_settings()['BATCH_SIZE']
+    deleted = 0
+    for model in (Task_char, ArchivedTask):
+        while True:
+            with transaction.atomic(using=shard_for_user(job.user_id)):
+                queryset = model.objects.filter(user_id=job.user_id, completed=True)
+                batch = list(queryset.values_list('id', 'uuid')[:batch_size])
+                if not batch:
+                    break
+                with bulk_task_changes():
+                    model.objects.filter(user_id=job.user_id, id__in=[pk for pk, _ in batch]).delete()
+                tasks_changed.send(
+                    sender=Task_char, user_id=job.user_id, deleted=[task_uuid for _, task_uuid in batch],
+                )
+            deleted += len(batch)
+            context.heartbeat()
+    return {'deleted': deleted}
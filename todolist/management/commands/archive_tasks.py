@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from todolist.archive import archive_completed_tasks, get_archive_settings
+
+
+class Command(BaseCommand):
+    help = 'Move tasks completed long ago from the task table to the archive (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Archive completed tasks not updated for this many days (TODOLIST_ARCHIVE AGE_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=None, help='Tasks moved per transaction.')
+        parser.add_argument('--user', type=int, default=None, help='Only archive tasks of this user id.')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_archive_settings()['AGE_DAYS']
+        archived = archive_completed_tasks(days=days, batch_size=options['batch_size'], user_id=options['user'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} tasks completed more than {days} days ago.'))
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from todolist.models import TaskChange, TaskListState
+from todolist.routers import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Delete task change log entries (including tombstones) older than the given age'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Keep entries newer than this many days.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = 0
+        # Журнал каждого пользователя - на его шарде
+        for using in shard_aliases():
+            with transaction.atomic(using=using):
+                old = TaskChange.objects.using(using).filter(created_at__lt=cutoff)
+                # Запоминаем границу сжатия, чтобы клиенты со старым токеном
+                # получили 410 и сделали полную синхронизацию
+                for row in old.values('user').annotate(through=Max('id')):
+                    state, _ = TaskListState.objects.using(using).get_or_create(user_id=row['user'])
+                    if row['through'] > state.compacted_through:
+                        state.compacted_through = row['through']
+                        state.save(using=using, update_fields=['compacted_through'])
+                deleted += old.delete()[0]
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change log entries older than {cutoff:%Y-%m-%d}.'))
@@ -0,0 +1,53 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from todolist.routers import get_shard_settings, hash_shard, shard_aliases
+from todolist.sharding import move_user_tasks, pin_users, pinned_users
+
+
+class Command(BaseCommand):
+    help = ('Move users\' tasks between task shards (TODOLIST_SHARDS): to the shard given by the user hash, '
+            'or one user to a chosen shard')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pin', action='store_true',
+                            help='Pin every user to the shard their tasks are on now. Run before changing '
+                                 'TODOLIST_SHARDS DATABASES, then rebalance with the new settings.')
+        parser.add_argument('--user', type=int, default=None, help='Only move this user id.')
+        parser.add_argument('--to', default=None, help='Target shard alias for --user (default: by hash).')
+        parser.add_argument('--wait', type=float, default=None,
+                            help='Seconds to wait for processes to see the new placement (TODOLIST_SHARDS MOVE_WAIT).')
+        parser.add_argument('--dry-run', action='store_true', help='Only list users that would be moved.')
+
+    def handle(self, *args, **options):
+        if options['pin']:
+            if options['dry_run']:
+                unpinned = User.objects.filter(task_shard__isnull=True).count()
+                self.stdout.write(f'{unpinned} users would be pinned to their current shard.')
+                return
+            self.stdout.write(self.style.SUCCESS(f'Pinned {pin_users()} users to their current shard.'))
+            return
+        if not get_shard_settings()['DATABASES']:
+            raise CommandError('Task sharding is disabled: TODOLIST_SHARDS DATABASES is empty.')
+        if options['to'] is not None:
+            if options['user'] is None:
+                raise CommandError('--to requires --user.')
+            if options['to'] not in shard_aliases():
+                raise CommandError(f'Unknown shard "{options["to"]}", expected one of: {", ".join(shard_aliases())}.')
+
+        if options['user'] is not None:
+            moves = [(options['user'], options['to'] or hash_shard(options['user']))]
+        else:
+            # Все закреплённые переезжают на шард по хешу; кто уже там -
+            # только открепляется, прерванный перенос завершается
+            moves = [(user_id, hash_shard(user_id)) for user_id, _ in pinned_users()]
+
+        moved = 0
+        for user_id, target in moves:
+            if options['dry_run']:
+                self.stdout.write(f'user {user_id} -> {target}')
+                continue
+            count = move_user_tasks(user_id, target, wait=options['wait'])
+            moved += count
+            self.stdout.write(f'user {user_id} -> {target}: moved {count} tasks')
+        self.stdout.write(self.style.SUCCESS(f'Rebalanced {len(moves)} users, moved {moved} tasks.'))
@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from todolist.counters import count_tasks, stored_counts, utc_today
+from todolist.models import TaskListState
+from todolist.routers import shard_for_user
+
+
+class Command(BaseCommand):
+    help = 'Recount per-user task counters (tasks/stats/) from the task table and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not fix counters.')
+
+    def handle(self, *args, **options):
+        today = utc_today()
+        checked = drifted = 0
+        for user_id in User.objects.order_by('pk').values_list('pk', flat=True).iterator():
+            # Строка состояния заблокирована на время подсчёта: триггеры
+            # параллельных записей этого пользователя ждут, счёт не устаревает
+            using = shard_for_user(user_id)
+            with transaction.atomic(using=using):
+                state = TaskListState.objects.using(using).select_for_update().filter(user_id=user_id).first()
+                actual = count_tasks(user_id, today)
+                stored = stored_counts(state, today)
+                checked += 1
+                if actual == stored:
+                    continue
+                drifted += 1
+                drift = ', '.join(
+                    f'{name} {stored[name]} -> {actual[name]}' for name in actual if actual[name] != stored[name]
+                )
+                self.stdout.write(f'user {user_id}: {drift}')
+                if not options['dry_run']:
+                    TaskListState.objects.using(using).update_or_create(user_id=user_id, defaults={
+                        'task_count': actual['total'],
+                        'completed_count': actual['completed'],
+                        'updated_day': today,
+                        'updated_today_count': actual['updated_today'],
+                    })
+
+        action = 'found' if options['dry_run'] else 'fixed'
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(f'Checked {checked} users, {action} drift for {drifted}.'))
@@ -0,0 +1,72 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+
+
+
+def init_process():
+    # Дочерний процесс (spawn) начинает с чистого интерпретатора и импортирует
+    # этот модуль до django.setup(), поэтому todolist.jobs импортируется в handle()
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (export, import, clear completed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Pool size; 0 runs jobs one by one in the current thread.')
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait on an empty queue.')
+
+    def handle(self, *args, **options):
+        from todolist.jobs import claim_jobs, run_job, run_job_in_worker
+
+        workers = options['workers']
+        if workers == 0:
+            executor = None
+        elif options['pool'] == 'process':
+            # Подключения к БД не переживают fork, поэтому spawn
+            executor = ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_process,
+            )
+        else:
+            executor = ThreadPoolExecutor(workers, thread_name_prefix='todolist-job')
+
+        processed = 0
+        running = set()
+        try:
+            while True:
+                # Внутри внешней транзакции (call_command в тестах) подключение не трогаем
+                if not connection.in_atomic_block:
+                    close_old_connections()
+                capacity = max(workers - len(running), 0) if executor else 1
+                claimed = claim_jobs(capacity) if capacity else []
+                for job_id, lease in claimed:
+                    if executor is None:
+                        run_job(job_id, lease)
+                    else:
+                        running.add(executor.submit(run_job_in_worker, job_id, lease))
+                processed += len(claimed)
+
+                if running:
+                    done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                elif not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+            if not connection.in_atomic_block:
+                connections.close_all()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} jobs.'))
@@ -0,0 +1,62 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from todolist.models import Task_char
+from todolist.signals import tasks_changed
+
+
+WORDS = (
+    'buy milk report call meeting review plan fix deploy write read email clean book pay send check update '
+    'prepare order draft test design refactor backup archive invoice travel doctor gym garden'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Create users with generated tasks for load testing (benchmarks/load_bench.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Number of users to create.')
+        parser.add_argument('--tasks', type=int, default=100, help='Number of tasks per user.')
+        parser.add_argument('--prefix', default='bench', help='Usernames are <prefix><n>.')
+        parser.add_argument('--password', default='bench-password')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--clear', action='store_true', help='Delete existing users with this prefix first.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        # Один хэш на всех: иначе сидирование упирается в PBKDF2
+        password = make_password(options['password'])
+
+        with transaction.atomic():
+            if options['clear']:
+                User.objects.filter(username__startswith=prefix).delete()
+
+            usernames = [f'{prefix}{n}' for n in range(options['users'])]
+            existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+            User.objects.bulk_create([
+                User(username=username, password=password) for username in usernames if username not in existing
+            ])
+
+            created = 0
+            for user in User.objects.filter(username__in=usernames).exclude(username__in=existing):
+                tasks = Task_char.objects.bulk_create([
+                    Task_char(
+                        user=user,
+                        title=' '.join(rng.choices(WORDS, k=rng.randint(1, 4))).capitalize(),
+                        description=' '.join(rng.choices(WORDS, k=rng.randint(0, 20))) or None,
+                        completed=rng.random() < 0.3,
+                    )
+                    for _ in range(options['tasks'])
+                ], batch_size=1000)
+                # Журнал изменений и кэш должны знать о новых задачах, как после bulk-эндпоинта
+                tasks_changed.send(sender=Task_char, user_id=user.pk, created=[task.uuid for task in tasks])
+                created += len(tasks)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(usernames) - len(existing)} users and {created} tasks (password: {options["password"]}).'
+        ))
@@ -0,0 +1,349 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+
+
+logger = logging.getLogger('todolist.metrics')
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    # Границы гистограммы длительности запроса, секунды
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    'QUERY_BUCKETS': (0, 1, 2, 5, 10, 20, 50, 100),
+    # Медленные запросы пишутся в лог todolist.metrics вместе с SQL; SQL
+    # собирается только у доли запросов SLOW_SAMPLE_RATE
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_SAMPLE_RATE': 0.1,
+    'MAX_LOGGED_QUERIES': 50,
+    # Кому доступен /metrics/ кроме staff-пользователей
+    'ALLOWED_IPS': ('127.0.0.1', '::1'),
+}
+
+# Метрики текущего запроса; asgiref копирует контекст в поток sync_to_async,
+# поэтому запросы к БД из синхронного кода находят свой запрос и под ASGI
+_current = contextvars.ContextVar('todolist_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serialize_time', 'sql', 'flights', 'coalesced')
+
+    def __init__(self, collect_sql):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.sql = [] if collect_sql else None
+        # Вычисления через single-flight и сколько из них получено от другого запроса
+        self.flights = 0
+        self.coalesced = 0
+
+
+class ViewStats:
+    __slots__ = ('durations', 'duration_sum', 'queries', 'query_sum', 'db_time', 'serialize_time', 'response_bytes',
+                 'statuses', 'flights', 'coalesced')
+
+    def __init__(self, buckets, query_buckets):
+        # Последняя ячейка - значения больше всех границ (+Inf)
+        self.durations = [0] * (len(buckets) + 1)
+        self.duration_sum = 0.0
+        self.queries = [0] * (len(query_buckets) + 1)
+        self.query_sum = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.response_bytes = 0
+        self.statuses = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    def add(self, other):
+        self.durations = [a + b for a, b in zip(self.durations, other.durations)]
+        self.duration_sum += other.duration_sum
+        self.queries = [a + b for a, b in zip(self.queries, other.queries)]
+        self.query_sum += other.query_sum
+        self.db_time += other.db_time
+        self.serialize_time += other.serialize_time
+        self.response_bytes += other.response_bytes
+        self.flights += other.flights
+        self.coalesced += other.coalesced
+        for status, count in list(other.statuses.items()):
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+class ThreadStats:
+    # Владелец словаря потока в threading.local: исчезает вместе с потоком
+    __slots__ = ('stats', '__weakref__')
+
+    def __init__(self):
+        self.stats = {}
+
+
+class MetricsRegistry:
+    """
+    Агрегаты по view без блокировок на пути запроса.
+
+    Каждый поток (и цикл событий ASGI) пишет только в свой словарь; блокировка
+    берётся один раз при создании словаря потока и при сборе /metrics/.
+    Словари завершившихся потоков складываются в общий итог.
+    """
+
+    def __init__(self, buckets, query_buckets):
+        self.buckets = tuple(buckets)
+        self.query_buckets = tuple(query_buckets)
+        self._local = threading.local()
+        self._thread_stats = []
+        # Словари завершившихся потоков ждут переноса в _retired; финализатор
+        # может сработать внутри collect, поэтому он только дописывает в список
+        self._finished = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _stats(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            holder = self._local.holder = ThreadStats()
+            weakref.finalize(holder, self._finished.append, holder.stats)
+            with self._lock:
+                self._retire_finished()
+                self._thread_stats.append(holder.stats)
+        return holder.stats
+
+    def _retire_finished(self):
+        # Под self._lock
+        while self._finished:
+            stats = self._finished.pop()
+            self._merge(self._retired, stats)
+            self._thread_stats = [live for live in self._thread_stats if live is not stats]
+
+    def _merge(self, merged, stats):
+        for key, view_stats in list(stats.items()):
+            total = merged.get(key)
+            if total is None:
+                total = merged[key] = ViewStats(self.buckets, self.query_buckets)
+            total.add(view_stats)
+
+    def record(self, view, method, status, duration, metrics, response_bytes):
+        stats = self._stats()
+        view_stats = stats.get((view, method))
+        if view_stats is None:
+            view_stats = stats[view, method] = ViewStats(self.buckets, self.query_buckets)
+        view_stats.durations[bisect_left(self.buckets, duration)] += 1
+        view_stats.duration_sum += duration
+        view_stats.queries[bisect_left(self.query_buckets, metrics.queries)] += 1
+        view_stats.query_sum += metrics.queries
+        view_stats.db_time += metrics.db_time
+        view_stats.serialize_time += metrics.serialize_time
+        view_stats.response_bytes += response_bytes
+        view_stats.statuses[status] = view_stats.statuses.get(status, 0) + 1
+        view_stats.flights += metrics.flights
+        view_stats.coalesced += metrics.coalesced
+
+    def collect(self):
+        merged = {}
+        with self._lock:
+            self._retire_finished()
+            self._merge(merged, self._retired)
+            thread_stats = list(self._thread_stats)
+        for stats in thread_stats:
+            self._merge(merged, stats)
+        return merged
+
+    def render(self):
+        # Текстовый формат Prometheus 0.0.4
+        merged = sorted(self.collect().items())
+        lines = []
+
+        def histogram(name, help_text, bounds, get_counts, get_sum):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (view, method), stats in merged:
+                labels = f'view="{escape_label(view)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip([*bounds, '+Inf'], get_counts(stats)):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{labels}}} {get_sum(stats)}')
+                lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+        def counter(name, help_text, get_value, items=None):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (view, method), stats in merged if items is None else items:
+                lines.append(f'{name}{{view="{escape_label(view)}",method="{method}"}} {get_value(stats)}')
+
+        lines.append('# HELP todolist_http_requests_total Requests by view, method and status.')
+        lines.append('# TYPE todolist_http_requests_total counter')
+        for (view, method), stats in merged:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(
+                    f'todolist_http_requests_total{{view="{escape_label(view)}",method="{method}",status="{status}"}} '
+                    f'{count}'
+                )
+        histogram(
+            'todolist_http_request_duration_seconds', 'Request latency by view.',
+            self.buckets, lambda stats: stats.durations, lambda stats: round(stats.duration_sum, 6),
+        )
+        histogram(
+            'todolist_http_request_db_queries', 'SQL queries per request by view.',
+            self.query_buckets, lambda stats: stats.queries, lambda stats: stats.query_sum,
+        )
+        counter('todolist_http_request_db_seconds_total', 'Time spent in SQL queries.',
+                lambda stats: round(stats.db_time, 6))
+        counter('todolist_http_request_serialize_seconds_total', 'Time spent serializing responses.',
+                lambda stats: round(stats.serialize_time, 6))
+        counter('todolist_http_response_bytes_total', 'Size of non-streaming response bodies.',
+                lambda stats: stats.response_bytes)
+
+        # Только view с single-flight (todolist/singleflight.py)
+        flights = [(key, stats) for key, stats in merged if stats.flights]
+        counter('todolist_singleflight_requests_total', 'Computations requested through single-flight.',
+                lambda stats: stats.flights, flights)
+        counter('todolist_singleflight_coalesced_total', 'Requests served by a concurrent identical request.',
+                lambda stats: stats.coalesced, flights)
+        lines.append('# HELP todolist_singleflight_coalescing_ratio Share of single-flight requests that were coalesced.')
+        lines.append('# TYPE todolist_singleflight_coalescing_ratio gauge')
+        for (view, method), stats in flights:
+            lines.append(
+                f'todolist_singleflight_coalescing_ratio{{view="{escape_label(view)}",method="{method}"}} '
+                f'{round(stats.coalesced / stats.flights, 6)}'
+            )
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def get_metrics_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_METRICS', {})}
+
+
+_registry = None
+
+
+def get_metrics_registry():
+    global _registry
+    if _registry is None:
+        config = get_metrics_settings()
+        _registry = MetricsRegistry(config['BUCKETS'], config['QUERY_BUCKETS'])
+    return _registry
+
+
+@receiver(setting_changed)
+def reset_metrics_registry(setting, **kwargs):
+    global _registry
+    if setting == 'TODOLIST_METRICS':
+        _registry = None
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.db_time += elapsed
+        if metrics.sql is not None and len(metrics.sql) < get_metrics_settings()['MAX_LOGGED_QUERIES']:
+            metrics.sql.append((elapsed, sql))
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_query_recorder(connection)
+
+
+def record_flight(coalesced):
+    # Запрос прошёл через single-flight; coalesced - результат посчитал другой запрос
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.flights += 1
+        metrics.coalesced += int(coalesced)
+
+
+@contextmanager
+def measure_serialization():
+    # Время сериализации без запросов к БД, которые ленивый QuerySet делает внутри
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Собирает по каждой view гистограммы длительности и числа SQL-запросов,
+    время в БД и в сериализаторах, размер ответа. Отдаются на /metrics/.
+    """
+    config = get_metrics_settings()
+    if not config['ENABLED']:
+        raise MiddlewareNotUsed
+    slow_seconds = config['SLOW_REQUEST_MS'] / 1000
+    sample_rate = config['SLOW_SAMPLE_RATE']
+
+    def start():
+        # Подключения, открытые до подключения middleware (например, в тестах)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        metrics = RequestMetrics(collect_sql=sample_rate > 0 and random.random() < sample_rate)
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def finish(request, response, metrics, token, started):
+        duration = time.perf_counter() - started
+        _current.reset(token)
+        response_bytes = 0 if response.streaming else len(response.content)
+        view = get_view_name(request)
+        get_metrics_registry().record(view, request.method, response.status_code, duration, metrics, response_bytes)
+        if metrics.sql is not None and duration >= slow_seconds:
+            logger.warning(
+                'Slow request %s %s (%s): %.1f ms, %d queries, %.1f ms in SQL\n%s',
+                request.method, request.path, view, duration * 1000, metrics.queries, metrics.db_time * 1000,
+                '\n'.join(f'  {elapsed * 1000:.1f} ms  {sql}' for elapsed, sql in metrics.sql),
+            )
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            metrics, token, started = start()
+            response = await get_response(request)
+            finish(request, response, metrics, token, started)
+            return response
+    else:
+        def middleware(request):
+            metrics, token, started = start()
+            response = get_response(request)
+            finish(request, response, metrics, token, started)
+            return response
+    return middleware
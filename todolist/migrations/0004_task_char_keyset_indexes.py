@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0003_alter_task_char_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task_char',
+            index=models.Index(fields=['user', 'completed', 'updated_at', 'id'], name='task_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task_char',
+            index=models.Index(fields=['user', 'completed', 'created_at', 'id'], name='task_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task_char',
+            index=models.Index(fields=['user', 'completed', 'title', 'id'], name='task_user_title_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+from todolist.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0005_tasklist_state'),
+    ]
+
+    operations = [
+        # FTS5 + триггеры на SQLite, GIN-индекс по tsvector на PostgreSQL
+        migrations.RunPython(install, uninstall, hints={'model_name': 'task_char'}),
+    ]
@@ -0,0 +1,98 @@
+import uuid
+
+from django.db import migrations, models
+
+from todolist.search import rebuild_search_index
+
+
+TASK_TABLE = 'todolist_task_char'
+# connection.vendor, для MariaDB тоже 'mysql'
+RENUMBER_VENDORS = ('sqlite', 'postgresql', 'mysql')
+REVERSIBLE_VENDORS = ('sqlite', 'mysql')
+
+
+def renumber(apps, schema_editor):
+    # Старый UUID переезжает в колонку uuid, id становится номером строки по порядку вставки
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # id = rowid: строки FTS остаются привязаны к тем же задачам, а при
+            # пересоздании таблицы в AlterField текст '1' станет целым 1
+            cursor.execute(f'UPDATE {TASK_TABLE} SET uuid = id')
+            cursor.execute(f'UPDATE {TASK_TABLE} SET id = rowid')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'UPDATE {TASK_TABLE} SET uuid = id')
+            cursor.execute(f'ALTER TABLE {TASK_TABLE} ADD COLUMN new_id bigint')
+            cursor.execute(
+                f'UPDATE {TASK_TABLE} SET new_id = numbered.number FROM ('
+                f'SELECT id, row_number() OVER (ORDER BY created_at, id) AS number FROM {TASK_TABLE}'
+                f') numbered WHERE {TASK_TABLE}.id = numbered.id'
+            )
+            cursor.execute(f'ALTER TABLE {TASK_TABLE} ALTER COLUMN id TYPE bigint USING new_id')
+            cursor.execute(f'ALTER TABLE {TASK_TABLE} DROP COLUMN new_id')
+        elif connection.vendor == 'mysql':
+            # UUID хранится в char(32): id становится строкой с номером, которую
+            # AlterField (MODIFY ... bigint) приводит к целому
+            cursor.execute(f'UPDATE {TASK_TABLE} SET uuid = id')
+            cursor.execute(f'SELECT id FROM {TASK_TABLE} ORDER BY created_at, id')
+            ids = [row[0] for row in cursor.fetchall()]
+            cursor.executemany(
+                f'UPDATE {TASK_TABLE} SET id = %s WHERE id = %s',
+                [(str(number), old_id) for number, old_id in enumerate(ids, 1)],
+            )
+        else:
+            raise RuntimeError(
+                f'Migration todolist.0009 cannot renumber Task_char on {connection.vendor}: '
+                f'supported backends are {", ".join(RENUMBER_VENDORS)}.'
+            )
+
+
+def check_reversible(apps, schema_editor):
+    # Откат AlterField с bigint на uuid упадёт на PostgreSQL раньше restore_uuids
+    vendor = schema_editor.connection.vendor
+    if vendor not in REVERSIBLE_VENDORS:
+        raise RuntimeError(
+            f'Migration todolist.0009 cannot be reversed on {vendor}: integer task ids cannot be converted '
+            f'back to UUIDs. Reversible on {", ".join(REVERSIBLE_VENDORS)}.'
+        )
+
+
+def restore_uuids(apps, schema_editor):
+    check_reversible(apps, schema_editor)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'UPDATE {TASK_TABLE} SET id = uuid')
+
+
+def rebuild(apps, schema_editor):
+    rebuild_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0008_job_queue'),
+    ]
+
+    operations = [
+        # При откате таблица тоже пересоздаётся, индекс восстанавливается последним
+        migrations.RunPython(migrations.RunPython.noop, rebuild, hints={'model_name': 'task_char'}),
+        migrations.AddField(
+            model_name='task_char',
+            name='uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(renumber, restore_uuids, hints={'model_name': 'task_char'}),
+        migrations.AlterField(
+            model_name='task_char',
+            name='id',
+            field=models.BigAutoField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='task_char',
+            name='uuid',
+            field=models.UUIDField(default=uuid.uuid4, editable=False, unique=True),
+        ),
+        # Пересоздание таблицы на SQLite удаляет триггеры полнотекстового индекса;
+        # откат проверяет бэкенд до изменения таблицы
+        migrations.RunPython(rebuild, check_reversible, hints={'model_name': 'task_char'}),
+    ]
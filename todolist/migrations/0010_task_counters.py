@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+from todolist.counters import count_aggregates, install_task_counters, uninstall_task_counters, utc_today
+
+
+def install(apps, schema_editor):
+    install_task_counters(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_task_counters(schema_editor.connection)
+
+
+def backfill(apps, schema_editor):
+    # Начальные значения счётчиков по уже существующим задачам
+    Task_char = apps.get_model('todolist', 'Task_char')
+    TaskListState = apps.get_model('todolist', 'TaskListState')
+    # На той базе, которую мигрируют: у каждого шарда свои задачи
+    using = schema_editor.connection.alias
+    today = utc_today()
+    rows = Task_char.objects.using(using).filter(user__isnull=False).values('user').annotate(**count_aggregates(today))
+    TaskListState.objects.using(using).bulk_create(
+        [
+            TaskListState(
+                user_id=row['user'], task_count=row['total'], completed_count=row['completed'],
+                updated_day=today, updated_today_count=row['updated_today'],
+            )
+            for row in rows
+        ],
+        update_conflicts=True, unique_fields=['user'],
+        update_fields=['task_count', 'completed_count', 'updated_day', 'updated_today_count'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0009_task_char_integer_pk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskliststate',
+            name='completed_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='taskliststate',
+            name='task_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='taskliststate',
+            name='updated_day',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='taskliststate',
+            name='updated_today_count',
+            field=models.IntegerField(default=0),
+        ),
+        # Триггеры на SQLite и PostgreSQL, затем пересчёт по существующим задачам
+        migrations.RunPython(install, uninstall, hints={'model_name': 'task_char'}),
+        migrations.RunPython(backfill, migrations.RunPython.noop, hints={'model_name': 'taskliststate'}),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+from todolist.counters import ARCHIVE_TABLE, install_task_counters, uninstall_task_counters
+
+
+def install(apps, schema_editor):
+    # Задачи в архиве входят в счётчики tasks/stats/
+    install_task_counters(schema_editor.connection, ARCHIVE_TABLE)
+
+
+def uninstall(apps, schema_editor):
+    uninstall_task_counters(schema_editor.connection, ARCHIVE_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('todolist', '0010_task_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTask',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('uuid', models.UUIDField(editable=False, unique=True)),
+                ('title', models.CharField(max_length=30)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('completed', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archived task',
+                'verbose_name_plural': 'Archived tasks',
+                'indexes': [models.Index(fields=['user', 'completed', 'updated_at', 'id'], name='archived_user_updated_idx'), models.Index(fields=['user', 'completed', 'created_at', 'id'], name='archived_user_created_idx'), models.Index(fields=['user', 'completed', 'title', 'id'], name='archived_user_title_idx')],
+            },
+        ),
+        migrations.RunPython(install, uninstall, hints={'model_name': 'archivedtask'}),
+    ]
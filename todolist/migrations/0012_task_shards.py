@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from todolist.counters import ARCHIVE_TABLE, install_task_counters, uninstall_task_counters
+from todolist.search import rebuild_search_index
+
+
+def uninstall(apps, schema_editor):
+    # Триггеры счётчиков ссылаются на TaskListState: SQLite не даст пересоздать таблицу
+    uninstall_task_counters(schema_editor.connection)
+    uninstall_task_counters(schema_editor.connection, ARCHIVE_TABLE)
+
+
+def reinstall(apps, schema_editor):
+    # Пересоздание таблиц на SQLite удаляет триггеры счётчиков и полнотекстового индекса
+    connection = schema_editor.connection
+    rebuild_search_index(connection)
+    install_task_counters(connection)
+    install_task_counters(connection, ARCHIVE_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('todolist', '0011_archived_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # При откате таблицы тоже пересоздаются, триггеры восстанавливаются последними
+        migrations.RunPython(uninstall, reinstall, hints={'model_name': 'task_char'}),
+        migrations.CreateModel(
+            name='TaskShard',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='task_shard', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('alias', models.CharField(max_length=100)),
+                ('moving', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        # Без внешних ключей на пользователя: он в default, задачи - на шарде
+        migrations.AlterField(
+            model_name='archivedtask',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archived_tasks', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task_char',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='taskchange',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_changes', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='taskliststate',
+            name='user',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='task_state', serialize=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(reinstall, uninstall, hints={'model_name': 'task_char'}),
+    ]
@@ -1,16 +1,73 @@
 import uuid
-from django.db import models
+from django.db import models, router
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+
+class TaskQuerySet(models.QuerySet):
+    """
+    Запросы к данным одного пользователя (задачи, архив, журнал, счётчики).
+
+    Фильтр по пользователю добавляет подсказку user_id: по ней роутер
+    (todolist/routers.py) выбирает шард пользователя. Пакетные вставка и
+    обновление раскладывают объекты по шардам их пользователей.
+    """
+    USER_LOOKUPS = ('user', 'user_id', 'user__pk', 'user__id')
+
+    def _with_user_hint(self, lookups):
+        for lookup in self.USER_LOOKUPS:
+            if lookup in lookups:
+                value = lookups[lookup]
+                # Новый словарь: _hints общий у всех QuerySet одного менеджера
+                self._hints = {**self._hints, 'user_id': getattr(value, 'pk', value)}
+                break
+        return self
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        return clone if negate else clone._with_user_hint(kwargs)
+
+    def create(self, **kwargs):
+        return super(TaskQuerySet, self._chain()._with_user_hint(kwargs)).create(**kwargs)
+
+    def _by_database(self, objs):
+        databases = {}
+        for obj in objs:
+            databases.setdefault(router.db_for_write(self.model, instance=obj), []).append(obj)
+        return databases
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        for using, group in self._by_database(objs).items():
+            super(TaskQuerySet, self.using(using)).bulk_create(group, *args, **kwargs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if self._db is not None:
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        return sum(
+            super(TaskQuerySet, self.using(using)).bulk_update(group, fields, *args, **kwargs)
+            for using, group in self._by_database(objs).items()
+        )
+
+
 class Task_char(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Пользователь - в default, задачи - на его шарде: без внешнего ключа в БД
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    # Внутренний ключ: короткий и растущий, новые строки ложатся в конец индексов
+    id = models.BigAutoField(primary_key=True)
+    # Публичный id задачи в API и URL (tasks/<uuid:pk>/)
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     title = models.CharField(max_length=30, blank=False, null=False)
     description = models.TextField(blank=True, null=True)
     completed = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskQuerySet.as_manager()
     
     def __str__(self):
         return f'{self.title}'
@@ -19,3 +76,152 @@ class Task_char(models.Model):
         verbose_name = "Task"
         verbose_name_plural = "Tasks"
         ordering = ['completed', '-updated_at', '-created_at']
+        indexes = [
+            # Составные индексы под курсорную пагинацию списка задач
+            models.Index(fields=['user', 'completed', 'updated_at', 'id'], name='task_user_updated_idx'),
+            models.Index(fields=['user', 'completed', 'created_at', 'id'], name='task_user_created_idx'),
+            models.Index(fields=['user', 'completed', 'title', 'id'], name='task_user_title_idx'),
+        ]
+
+
+class ArchivedTask(models.Model):
+    # Архив давно выполненных задач (todolist/archive.py). Столбцы те же, что у
+    # Task_char; id и uuid при переносе сохраняются, поэтому курсоры, ETag и
+    # журнал изменений не замечают переноса
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, null=True, blank=True, related_name='archived_tasks', db_constraint=False,
+    )
+    id = models.BigIntegerField(primary_key=True)
+    uuid = models.UUIDField(unique=True, editable=False)
+    title = models.CharField(max_length=30)
+    description = models.TextField(blank=True, null=True)
+    completed = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    objects = TaskQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.title}'
+
+    class Meta:
+        verbose_name = "Archived task"
+        verbose_name_plural = "Archived tasks"
+        indexes = [
+            # Те же ключи сортировки, что у рабочей таблицы: список с ?include=archived
+            models.Index(fields=['user', 'completed', 'updated_at', 'id'], name='archived_user_updated_idx'),
+            models.Index(fields=['user', 'completed', 'created_at', 'id'], name='archived_user_created_idx'),
+            models.Index(fields=['user', 'completed', 'title', 'id'], name='archived_user_title_idx'),
+        ]
+
+
+class TaskListState(models.Model):
+    # Служебное состояние списка задач пользователя
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name='task_state', db_constraint=False,
+    )
+    # Время последнего удаления задачи, входит в ETag списка
+    last_deleted_at = models.DateTimeField(blank=True, null=True)
+    # Записи журнала изменений с id <= этого значения могли быть удалены сжатием
+    compacted_through = models.BigIntegerField(default=0)
+    # Счётчики задач пользователя для tasks/stats/, их ведут триггеры БД (todolist/counters.py)
+    task_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    # Сколько задач обновлено за сутки updated_day (UTC)
+    updated_day = models.DateField(blank=True, null=True)
+    updated_today_count = models.IntegerField(default=0)
+
+    objects = TaskQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.user}'
+
+
+class TaskChange(models.Model):
+    # Журнал изменений задач для инкрементальной синхронизации (tasks/changes/)
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    ACTION_CHOICES = [(UPSERT, 'Created or updated'), (DELETE, 'Deleted')]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_changes', db_constraint=False)
+    # Без внешнего ключа: запись об удалении переживает саму задачу
+    task_id = models.UUIDField()
+    action = models.CharField(max_length=6, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    def __str__(self):
+        return f'{self.action} {self.task_id}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='task_change_user_idx'),
+            models.Index(fields=['created_at'], name='task_change_created_idx'),
+        ]
+
+
+class Job(models.Model):
+    # Фоновая задача из очереди в БД, выполняется командой run_jobs
+    EXPORT = 'export'
+    IMPORT = 'import'
+    CLEAR_COMPLETED = 'clear_completed'
+    KIND_CHOICES = [(EXPORT, 'Export tasks'), (IMPORT, 'Import tasks'), (CLEAR_COMPLETED, 'Clear completed tasks')]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField(default=dict, blank=True)
+    # Итог задачи; во время выполнения - сохранённый прогресс для повтора
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Не запускать раньше этого времени (отложенный повтор)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Аренда воркера: после locked_until задачу может забрать другой воркер
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f'{self.kind} #{self.id} ({self.status})'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['user', '-id'], name='job_user_idx'),
+        ]
+
+
+class TaskShard(models.Model):
+    # Шард с задачами пользователя, если это не шард по хешу его id или идёт
+    # перенос (todolist/routers.py, команда rebalance_shards). Хранится в default
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='task_shard')
+    alias = models.CharField(max_length=100)
+    # Задачи копируются на другой шард: запись пользователя временно отклоняется
+    moving = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user} -> {self.alias}'
+
+
+class RevokedToken(models.Model):
+    # Токен, отозванный при выходе; нужен лишь до конца срока самого токена
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,212 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from itertools import chain
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from todolist.models import Task_char
+from todolist.serializers import TaskCharRowEncoder
+
+
+# Поля, по которым разрешена сортировка (для каждого есть составной индекс)
+SORT_FIELDS = ('updated_at', 'created_at', 'title')
+DEFAULT_SORT_FIELD = 'updated_at'
+# Сортировка по релевантности, доступна только вместе с ?search-area=
+RELEVANCE = 'relevance'
+
+
+def get_task_ordering(query_params):
+    # Возвращает (поле сортировки, по убыванию ли) из ?sort= и ?order=
+    sort_by = query_params.get('sort', DEFAULT_SORT_FIELD)
+    if sort_by == RELEVANCE and query_params.get('search-area', '').strip():
+        return RELEVANCE, False
+    if sort_by not in SORT_FIELDS:
+        sort_by = DEFAULT_SORT_FIELD
+    descending = query_params.get('order', 'desc') != 'asc'
+    return sort_by, descending
+
+
+def include_archived(query_params):
+    # ?include=archived - список вместе с задачами из архива (ArchivedTask)
+    return 'archived' in query_params.get('include', '').split(',')
+
+
+def task_value(task, name):
+    # `task` - экземпляр модели или строка TaskCharRowEncoder.values()
+    if isinstance(task, tuple):
+        return task[TaskCharRowEncoder.columns.index(name)]
+    return getattr(task, name)
+
+
+def merge_tasks(parts, query_params):
+    """
+    Сливает уже упорядоченные списки задач из рабочей таблицы и архива в
+    порядке order_tasks(); id в таблицах не повторяются. Один список
+    возвращается как есть.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    sort_by, descending = get_task_ordering(query_params)
+    if sort_by == RELEVANCE:
+        # У архива нет полнотекстового индекса и ранга: его совпадения идут последними
+        return list(chain(*parts))
+    tasks = sorted(
+        chain(*parts), key=lambda task: (task_value(task, sort_by), task_value(task, 'id')), reverse=descending,
+    )
+    # Сортировка устойчива: выполненные внизу, внутри групп порядок сохраняется
+    tasks.sort(key=lambda task: task_value(task, 'completed'))
+    return tasks
+
+
+def order_tasks(queryset, sort_by, descending):
+    # Выполненные задачи всегда внизу, `id` делает порядок однозначным
+    if sort_by == RELEVANCE:
+        return queryset.order_by('completed', 'search_rank', 'id')
+    if descending:
+        return queryset.order_by('completed', f'-{sort_by}', '-id')
+    return queryset.order_by('completed', sort_by, 'id')
+
+
+class TaskKeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по ключу (completed, поле сортировки, id).
+
+    Каждая страница - это диапазон по индексу, поэтому стоимость запроса
+    не зависит от того, насколько глубоко клиент пролистал список.
+    Пагинация включается параметром ?limit= или настройкой TODOLIST_PAGE_SIZE,
+    без них список отдаётся целиком, как раньше. Ранг поиска не хранится в
+    индексе, поэтому ?sort=relevance листается курсором со смещением.
+    """
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    default_limit = 100
+    max_limit = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_limit(self, request):
+        page_size = getattr(settings, 'TODOLIST_PAGE_SIZE', None)
+        raw_limit = request.query_params.get(self.limit_query_param)
+        if raw_limit is not None:
+            try:
+                page_size = int(raw_limit)
+            except ValueError:
+                pass
+        if page_size is None and self.cursor_query_param in request.query_params:
+            page_size = self.default_limit
+        if page_size is None or page_size <= 0:
+            return None
+        return min(page_size, self.max_limit)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    def get_page_queryset(self, queryset, request):
+        # Запрос страницы без выполнения (его можно выполнить и асинхронно);
+        # выбирает на одну строку больше, чтобы узнать, есть ли следующая страница
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.request = request
+        self.sort_by, self.descending = get_task_ordering(request.query_params)
+
+        if self.sort_by == RELEVANCE:
+            # Начало выдачи до конца страницы: у рабочей таблицы и архива оно
+            # сливается в начало общей выдачи, из него страница и берётся
+            self.offset = self.decode_offset(request)
+            return queryset[:self.offset + self.limit + 1]
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(*position))
+        return queryset[:self.limit + 1]
+
+    def set_page(self, results):
+        start = self.offset if self.sort_by == RELEVANCE else 0
+        self.has_next = len(results) > start + self.limit
+        self.page = results[start:start + self.limit]
+        return self.page
+
+    def get_position_filter(self, completed, value, pk):
+        # Строки строго после позиции курсора в порядке (completed, sort_by, id)
+        op = 'lt' if self.descending else 'gt'
+        return (
+            Q(completed__gt=completed)
+            | Q(completed=completed, **{f'{self.sort_by}__{op}': value})
+            | Q(completed=completed, **{self.sort_by: value, f'id__{op}': pk})
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(last))
+
+    def encode_cursor(self, task):
+        if self.sort_by == RELEVANCE:
+            return self.encode_position([self.offset + self.limit])
+        completed, value, pk = (task_value(task, name) for name in ('completed', self.sort_by, 'id'))
+        if isinstance(value, datetime):
+            # Тот же формат, что и в ответе API
+            value = TaskCharRowEncoder().format_datetime(value)
+        return self.encode_position([completed, value, pk])
+
+    def encode_position(self, position):
+        data = json.dumps(position, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def load_position(self, encoded):
+        data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        return json.loads(data)
+
+    def decode_offset(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0
+        try:
+            offset, = self.load_position(encoded)
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return offset
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            completed, value, pk = self.load_position(encoded)
+            field = Task_char._meta.get_field(self.sort_by)
+            return bool(completed), field.to_python(value), Task_char._meta.pk.to_python(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
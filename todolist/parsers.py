@@ -0,0 +1,104 @@
+import codecs
+import csv
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from todolist.renderers import get_layout
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+# Парсеры для потокового импорта: request.data - генератор пар
+# (номер строки, словарь полей или ParseError), тело читается по строкам.
+# Ошибка в строке не прерывает импорт, а попадает в отчёт.
+
+json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def iter_ndjson(stream):
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            item = json_loads(line)
+        except ValueError:
+            yield line_number, ParseError('Invalid JSON.')
+            continue
+        if not isinstance(item, dict):
+            yield line_number, ParseError('Expected a JSON object.')
+            continue
+        yield line_number, item
+
+
+def iter_csv(stream, encoding='utf-8-sig'):
+    reader = csv.DictReader(codecs.iterdecode(stream, encoding))
+    try:
+        for row in reader:
+            # Лишние значения без заголовка (ключ None) и недостающие колонки отбрасываются
+            yield reader.line_num, {key: value for key, value in row.items() if key is not None and value is not None}
+    except (csv.Error, UnicodeDecodeError) as exc:
+        # Дальше строки не разобрать
+        yield reader.line_num + 1, ParseError(f'Malformed CSV: {exc}')
+
+
+class NDJSONParser(BaseParser):
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter_ndjson(stream)
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding') or 'utf-8'
+        if codecs.lookup(encoding).name == 'utf-8':
+            encoding = 'utf-8-sig'
+        return iter_csv(stream, encoding)
+
+
+def _rows(value):
+    if isinstance(value, dict) and value.keys() == {'columns', 'rows'}:
+        return [dict(zip(value['columns'], row)) for row in value['rows']]
+    return value
+
+
+def from_columns(data):
+    # Обратно к спискам объектов (см. renderers.to_columns)
+    if isinstance(data, dict) and data.keys() != {'columns', 'rows'}:
+        return {key: _rows(value) for key, value in data.items()}
+    return _rows(data)
+
+
+def unpack_msgpack(body, media_type=None):
+    # ValueError при неверном теле, как json.loads (ошибки msgpack - его подклассы)
+    data = msgpack.unpackb(body, raw=False)
+    if get_layout(media_type) != 'columns':
+        return data
+    try:
+        return from_columns(data)
+    except TypeError as exc:
+        raise ValueError(f'Invalid columns layout: {exc}') from exc
+
+
+class MessagePackParser(BaseParser):
+    # Тело application/msgpack, с layout=columns - в колоночной раскладке
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return unpack_msgpack(stream.read(), media_type)
+        except ValueError as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
@@ -0,0 +1,140 @@
+import csv
+import io
+
+from django.utils.http import parse_header_parameters
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson, если он установлен.
+
+    Для компактного вывода даёт те же байты, что и JSONRenderer; в остальных
+    случаях (отступы, ensure_ascii, нет orjson) работает как JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            # Даты отдаём стандартному кодировщику DRF, чтобы формат совпадал до байта
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранируем разделители строк для встраивания в JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def buffered(chunks, size=64 * 1024):
+    # Склеивает мелкие куски потокового ответа, чтобы не писать в сокет по строке
+    buffer, buffered_size = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered_size += len(chunk)
+        if buffered_size >= size:
+            yield b''.join(buffer)
+            buffer, buffered_size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+class NDJSONRenderer(BaseRenderer):
+    # Объект JSON в строке; stream() отдаёт строки по мере чтения из БД
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+    def stream(self, items, fields=None):
+        json_renderer = ORJSONRenderer()
+        return buffered(json_renderer.render(item) + b'\n' for item in items)
+
+
+class CSVRenderer(BaseRenderer):
+    # Заголовок из fields (по умолчанию - ключи первого объекта), строка на объект
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return b''.join(self.stream(items, list(items[0]) if items else []))
+
+    def stream(self, items, fields=None):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fields, extrasaction='ignore')
+        writer.writeheader()
+        for item in items:
+            writer.writerow(item)
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue().encode(self.charset)
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode(self.charset)
+
+
+def _columns(value):
+    # Список объектов с одинаковыми полями -> {'columns': [...], 'rows': [[...], ...]}
+    if not isinstance(value, list) or not value or not isinstance(value[0], dict):
+        return value
+    keys = value[0].keys()
+    if not all(isinstance(item, dict) and item.keys() == keys for item in value):
+        return value
+    columns = list(keys)
+    return {'columns': columns, 'rows': [[item[column] for column in columns] for item in value]}
+
+
+def to_columns(data):
+    # Колоночная раскладка для ответа-списка и для списков в полях ответа (results, changed, ...)
+    if isinstance(data, dict):
+        return {key: _columns(value) for key, value in data.items()}
+    return _columns(data)
+
+
+def get_layout(media_type):
+    # Параметр layout из Accept или Content-Type: 'application/msgpack; layout=columns'
+    if not media_type:
+        return None
+    return parse_header_parameters(media_type)[1].get('layout')
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack вместо JSON: те же данные (даты и UUID - строками, как в
+    JSON), без кавычек, разделителей и экранирования.
+
+    С 'Accept: application/msgpack; layout=columns' списки однотипных
+    объектов отдаются колонками (to_columns): имена полей передаются один раз.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if get_layout(accepted_media_type) == 'columns':
+            data = to_columns(data)
+        return msgpack.packb(data, default=JSONEncoder().default)
+
@@ -0,0 +1,329 @@
+import asyncio
+import contextvars
+import hashlib
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.db.models import Max
+from django.dispatch import receiver
+from rest_framework.exceptions import APIException
+
+
+DEFAULT_SETTINGS = {
+    # Алиасы из settings.DATABASES; пустой список - всё читается из default
+    'DATABASES': [],
+    # Сколько секунд после записи пользователь читает из default
+    'STICKY_SECONDS': 5,
+    # Реплика, отставшая по журналу изменений больше, не используется
+    'MAX_LAG_SECONDS': 10,
+    'HEALTH_CHECK_INTERVAL': 5,
+    # Кэш из settings.CACHES, общий для всех процессов (todolist/checks.py)
+    'STICKY_CACHE': 'shared',
+}
+
+# Чтения внутри replica_reads(); выбор реплики ленивый - при первом запросе,
+# который всегда выполняется в синхронном потоке
+_selection = contextvars.ContextVar('todolist_replica_selection', default=None)
+
+
+def get_replica_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_REPLICAS', {})}
+
+
+def sticky_key(user_id):
+    return f'todolist:replica-sticky:{user_id}'
+
+
+def stick_to_primary(user_id):
+    config = get_replica_settings()
+    if config['DATABASES'] and config['STICKY_SECONDS']:
+        caches[config['STICKY_CACHE']].set(sticky_key(user_id), True, config['STICKY_SECONDS'])
+
+
+def is_sticky(user_id):
+    config = get_replica_settings()
+    return caches[config['STICKY_CACHE']].get(sticky_key(user_id)) is not None
+
+
+class ReplicaHealth:
+    """
+    Доступность и отставание реплик, проверяются не чаще HEALTH_CHECK_INTERVAL.
+
+    Отставание - разница между последними записями журнала TaskChange на
+    default и на реплике, так что проверка одинакова для любой СУБД.
+    """
+
+    def __init__(self, aliases, interval):
+        self.aliases = list(aliases)
+        self.interval = interval
+        self.state = {}
+        self.checked_at = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        from todolist.models import TaskChange
+
+        state = {}
+        primary = TaskChange.objects.using(DEFAULT_DB_ALIAS).aggregate(latest=Max('created_at'))['latest']
+        for alias in self.aliases:
+            try:
+                latest = TaskChange.objects.using(alias).aggregate(latest=Max('created_at'))['latest']
+            except DatabaseError:
+                state[alias] = None
+                continue
+            if primary is None or (latest is not None and latest >= primary):
+                state[alias] = 0.0
+            else:
+                state[alias] = (primary - latest).total_seconds() if latest is not None else float('inf')
+        self.state = state
+
+    def refresh(self):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.interval:
+            return
+        try:
+            asyncio.get_running_loop()
+            # В цикле событий запросы к БД запрещены; проверит синхронный поток
+            return
+        except RuntimeError:
+            pass
+        # Проверяет один поток, остальные используют прошлое состояние
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.checked_at = now
+            self.check()
+        except DatabaseError:
+            # default недоступен - решать о репликах нечем
+            self.state = {}
+        finally:
+            self._lock.release()
+
+    def available(self, max_lag):
+        self.refresh()
+        return [alias for alias, lag in self.state.items() if lag is not None and lag <= max_lag]
+
+
+_health = None
+
+
+def get_replica_health():
+    global _health
+    if _health is None:
+        config = get_replica_settings()
+        _health = ReplicaHealth(config['DATABASES'], config['HEALTH_CHECK_INTERVAL'])
+    return _health
+
+
+@receiver(setting_changed)
+def reset_replica_health(setting, **kwargs):
+    global _health
+    if setting in ('TODOLIST_REPLICAS', 'DATABASES'):
+        _health = None
+
+
+class ReplicaSelection:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.alias = None
+        self.resolved = False
+
+    def resolve(self):
+        if self.resolved:
+            return self.alias
+        config = get_replica_settings()
+        if not config['DATABASES'] or is_sticky(self.user_id):
+            self.resolved = True
+            return None
+        health = get_replica_health()
+        available = health.available(config['MAX_LAG_SECONDS'])
+        self.alias = random.choice(available) if available else None
+        # Пока реплики не проверены (из цикла событий проверка откладывается),
+        # решение не фиксируется и принимается заново в синхронном потоке
+        self.resolved = self.alias is not None or health.checked_at is not None
+        return self.alias
+
+
+@contextmanager
+def replica_reads(user_id):
+    # Чтения внутри блока могут уйти на реплику, если пользователь недавно не писал
+    token = _selection.set(ReplicaSelection(user_id))
+    try:
+        yield
+    finally:
+        _selection.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Записи - в default, чтения из replica_reads() - на здоровую реплику.
+
+    Остальные чтения (сессии, пользователи, кэш в БД, чтение перед записью)
+    всегда идут в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        # Модели других приложений, в том числе DatabaseCache: из него читается
+        # сам признак STICKY_CACHE при выборе реплики
+        if model._meta.app_label != 'todolist':
+            return DEFAULT_DB_ALIAS
+        selection = _selection.get()
+        if selection is None:
+            return DEFAULT_DB_ALIAS
+        return selection.resolve() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *get_replica_settings()['DATABASES']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+DEFAULT_SHARD_SETTINGS = {
+    # Алиасы шардов задач из settings.DATABASES; пустой список - всё в default.
+    # Новые шарды добавляются в конец: на них переезжает лишь часть пользователей
+    'DATABASES': [],
+    # Сколько секунд процессы помнят, на каком шарде задачи пользователя
+    'PLACEMENT_TTL': 10,
+    # Пауза rebalance_shards перед копированием и перед удалением с исходного
+    # шарда: не меньше PLACEMENT_TTL плюс время самого долгого запроса
+    'MOVE_WAIT': 15,
+    'PLACEMENT_CACHE': 'default',
+}
+
+# Данные одного пользователя - на его шарде. Пользователи, токены, очередь
+# фоновых задач и TaskShard остаются в default
+SHARDED_MODELS = {'todolist.Task_char', 'todolist.ArchivedTask', 'todolist.TaskListState', 'todolist.TaskChange'}
+
+
+class TasksMoving(APIException):
+    # Задачи пользователя переносятся на другой шард: запись ненадолго недоступна
+    status_code = 503
+    default_detail = 'Tasks are being moved to another database, retry shortly.'
+    default_code = 'tasks_moving'
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF отдаёт его в заголовке Retry-After, целым числом секунд
+        self.wait = max(math.ceil(wait), 1)
+
+
+def get_shard_settings():
+    return {**DEFAULT_SHARD_SETTINGS, **getattr(settings, 'TODOLIST_SHARDS', {})}
+
+
+def shard_aliases():
+    return get_shard_settings()['DATABASES'] or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    # Не _meta.label: у модели DatabaseCache урезанный Options без него
+    return f'{model._meta.app_label}.{model._meta.object_name}' in SHARDED_MODELS
+
+
+def hash_shard(user_id, aliases=None):
+    """
+    Шард пользователя по хешу id: jump consistent hash (Lamping, Veach) от
+    blake2b, одинаковый во всех процессах. При добавлении шарда в конец
+    списка на него переходит 1/N пользователей, остальные не меняют шард.
+    """
+    aliases = aliases or shard_aliases()
+    key = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), 'big')
+    bucket, candidate = -1, 0
+    while candidate < len(aliases):
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return aliases[bucket]
+
+
+def placement_key(user_id):
+    return f'todolist:task-shard:{user_id}'
+
+
+def get_placement(user_id):
+    # (алиас, идёт ли перенос): шард из TaskShard, иначе шард по хешу
+    from todolist.models import TaskShard
+
+    config = get_shard_settings()
+    cache = caches[config['PLACEMENT_CACHE']]
+    placement = cache.get(placement_key(user_id))
+    if placement is None:
+        row = TaskShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('alias', 'moving').first()
+        placement = tuple(row) if row is not None else (hash_shard(user_id), False)
+        cache.set(placement_key(user_id), placement, config['PLACEMENT_TTL'])
+    return placement
+
+
+def forget_placement(user_id):
+    caches[get_shard_settings()['PLACEMENT_CACHE']].delete(placement_key(user_id))
+
+
+def shard_for_user(user_id):
+    # База задач пользователя без проверки переноса: для transaction.atomic() и on_commit
+    if user_id is None or not get_shard_settings()['DATABASES']:
+        return DEFAULT_DB_ALIAS
+    return get_placement(user_id)[0]
+
+
+class ShardRouter:
+    """
+    Данные пользователя из SHARDED_MODELS - на его шарде.
+
+    Пользователь известен из экземпляра (задача или сам пользователь) или
+    из подсказки user_id: её добавляет TaskQuerySet при фильтре по
+    пользователю, её же передают явные router.db_for_write(..., user_id=).
+    Запросы без пользователя и остальные модели идут дальше по цепочке
+    (ReplicaRouter), реплики для задач при шардировании не используются.
+    Команды, обходящие всех пользователей, перебирают shard_aliases() сами.
+    """
+
+    def route(self, model, hints, for_write):
+        if not get_shard_settings()['DATABASES']:
+            return None
+        instance = hints.get('instance')
+        if not is_sharded(model):
+            # Владелец задачи - в default, а не на шарде задачи
+            return DEFAULT_DB_ALIAS if instance is not None and is_sharded(type(instance)) else None
+        if instance is not None:
+            user_id = instance.user_id if is_sharded(type(instance)) else instance.pk
+        else:
+            user_id = hints.get('user_id')
+        if user_id is None:
+            return None
+        alias, moving = get_placement(user_id)
+        if moving and for_write:
+            raise TasksMoving(get_shard_settings()['MOVE_WAIT'])
+        return alias
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints, for_write=False)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, hints, for_write=True)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Задача на шарде ссылается на пользователя в default
+        if get_shard_settings()['DATABASES'] and is_sharded(type(obj1)) != is_sharded(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема на всех базах одна: шард можно сделать из копии default
+        return None
@@ -0,0 +1,149 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from todolist.models import Task_char
+
+
+TASK_TABLE = Task_char._meta.db_table
+FTS_TABLE = f'{TASK_TABLE}_fts'
+
+# Документ задачи для PostgreSQL: выражение совпадает с GIN-индексом из миграции
+PG_DOCUMENT = (
+    f"to_tsvector('simple', coalesce({TASK_TABLE}.title, '') || ' ' || coalesce({TASK_TABLE}.description, ''))"
+)
+
+SQLITE_INSTALL = [
+    # Строка FTS имеет тот же rowid, что и задача, поэтому триггеры и
+    # поиск работают по первичному ключу, без просмотра таблиц.
+    # owner - токен владельца (u<user_id>), чтобы фильтровать по пользователю внутри индекса
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        owner, title, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TASK_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, owner, title, description)
+        VALUES (new.rowid, 'u' || new.user_id, new.title, coalesce(new.description, ''));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TASK_TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF user_id, title, description ON {TASK_TABLE} BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.rowid;
+        INSERT INTO {FTS_TABLE}(rowid, owner, title, description)
+        VALUES (new.rowid, 'u' || new.user_id, new.title, coalesce(new.description, ''));
+    END""",
+]
+
+SQLITE_UNINSTALL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+SQLITE_REBUILD = [
+    f'DELETE FROM {FTS_TABLE}',
+    f"""INSERT INTO {FTS_TABLE}(rowid, owner, title, description)
+        SELECT rowid, 'u' || user_id, title, coalesce(description, '') FROM {TASK_TABLE}""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')",
+]
+
+PG_INSTALL = [
+    f'CREATE INDEX IF NOT EXISTS {TASK_TABLE}_search_idx ON {TASK_TABLE} USING GIN ({PG_DOCUMENT})',
+]
+
+PG_UNINSTALL = [
+    f'DROP INDEX IF EXISTS {TASK_TABLE}_search_idx',
+]
+
+PG_REBUILD = [
+    f'REINDEX INDEX {TASK_TABLE}_search_idx',
+]
+
+
+def get_terms(query):
+    # Слова запроса; каждое ищется как префикс, все должны присутствовать
+    return re.findall(r'\w+', query.lower())
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def install_search_index(connection):
+    if connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_INSTALL + SQLITE_REBUILD)
+    elif connection.vendor == 'postgresql':
+        _execute(connection, PG_INSTALL)
+
+
+def uninstall_search_index(connection):
+    if connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL)
+    elif connection.vendor == 'postgresql':
+        _execute(connection, PG_UNINSTALL)
+
+
+def rebuild_search_index(connection):
+    # Пересоздаёт индекс (и триггеры SQLite, которые пропадают при пересоздании таблицы)
+    if connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL)
+        _execute(connection, SQLITE_INSTALL + SQLITE_REBUILD)
+    elif connection.vendor == 'postgresql':
+        _execute(connection, PG_INSTALL + PG_REBUILD)
+
+
+def search_tasks(queryset, query, user_id, ranked=False):
+    """
+    Фильтрует задачи пользователя по словам из `query` в title и description.
+
+    При ranked=True добавляет аннотацию search_rank (меньше - релевантнее),
+    совпадения в title весят больше, чем в description.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return queryset.none()
+
+    # Для архива (ArchivedTask) полнотекстового индекса нет: поиск подстрокой
+    vendor = connections[queryset.db].vendor if queryset.model is Task_char else None
+    if vendor == 'sqlite':
+        match = 'owner : u%d AND {title description} : (%s)' % (
+            user_id, ' AND '.join(f'"{term}"*' for term in terms)
+        )
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT t.id FROM {FTS_TABLE} JOIN {TASK_TABLE} t ON t.rowid = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s',
+            [match],
+        ))
+        if ranked:
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f'(SELECT bm25({FTS_TABLE}, 0.0, 10.0, 1.0) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {TASK_TABLE}.rowid)',
+                [match],
+                output_field=FloatField(),
+            ))
+        return queryset
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        queryset = queryset.filter(RawSQL(
+            f"{PG_DOCUMENT} @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField()
+        ))
+        if ranked:
+            queryset = queryset.annotate(search_rank=RawSQL(
+                f"-ts_rank({PG_DOCUMENT}, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()
+            ))
+        return queryset
+
+    # Остальные СУБД: поиск подстрокой без индекса
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term)
+    queryset = queryset.filter(condition)
+    if ranked:
+        queryset = queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    return queryset
@@ -1,18 +1,154 @@
 from rest_framework import serializers
-from todolist.models import Task_char
+from todolist.models import Job, Task_char
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from todolist.metrics import measure_serialization
+
+class MeasuredDataMixin:
+    # Время сериализации попадает в метрики запроса (todolist/metrics.py)
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class TaskCharListSerializer(MeasuredDataMixin, serializers.ListSerializer):
+    pass
+
+
+class TaskCharSerializer(MeasuredDataMixin, serializers.ModelSerializer):
+    # Наружу отдаётся публичный UUID, внутренний целый ключ не виден
+    id = serializers.UUIDField(source='uuid', read_only=True)
 
-class TaskCharSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task_char
         fields = ['id', 'user', 'title', 'description', 'completed', 'created_at', 'updated_at']
         read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+        list_serializer_class = TaskCharListSerializer
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
         return data
 
 
+class TaskCharImportSerializer(TaskCharSerializer):
+    # Строка экспорта: публичный id и даты задачи сохраняются при импорте
+    id = serializers.UUIDField(source='uuid', required=False)
+    created_at = serializers.DateTimeField(required=False)
+    updated_at = serializers.DateTimeField(required=False)
+
+    class Meta(TaskCharSerializer.Meta):
+        read_only_fields = ['user']
+
+
+class TaskCharRowEncoder:
+    """
+    Быстрая сериализация списка задач для чтения.
+
+    Работает со строками values_list() вместо экземпляров модели и даёт тот же
+    результат, что TaskCharSerializer (UUID строкой, даты в ISO 8601 в текущем
+    часовом поясе, UTC как "Z"), но без диспетчеризации по полям сериализатора.
+    Последняя колонка - внутренний id, он нужен только для курсора пагинации.
+    """
+    columns = ('uuid', 'user_id', 'title', 'description', 'completed', 'created_at', 'updated_at', 'id')
+    fields = TaskCharSerializer.Meta.fields
+
+    def __init__(self):
+        self.tz = timezone.get_current_timezone()
+
+    def format_datetime(self, value):
+        if value is None:
+            return None
+        value = value.astimezone(self.tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    def encode(self, row):
+        task_uuid, user_id, title, description, completed, created_at, updated_at, _ = row
+        format_datetime = self.format_datetime
+        return {
+            'id': str(task_uuid),
+            'user': user_id,
+            'title': title,
+            'description': description,
+            'completed': completed,
+            'created_at': format_datetime(created_at),
+            'updated_at': format_datetime(updated_at),
+        }
+
+    def values(self, queryset):
+        return queryset.values_list(*self.columns)
+
+    def encode_rows(self, rows):
+        encode = self.encode
+        return [encode(row) for row in rows]
+
+
+class TaskCharBulkCreateListSerializer(TaskCharListSerializer):
+    def create(self, validated_data):
+        # Одна вставка на весь пакет вместо INSERT на каждую задачу
+        return Task_char.objects.bulk_create([Task_char(**attrs) for attrs in validated_data])
+
+
+class TaskCharBulkCreateSerializer(TaskCharSerializer):
+    class Meta(TaskCharSerializer.Meta):
+        list_serializer_class = TaskCharBulkCreateListSerializer
+
+
+class TaskCharBulkUpdateListSerializer(TaskCharListSerializer):
+    def validate(self, attrs):
+        ids = [item['uuid'] for item in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError('Duplicate task ids in batch.')
+        return attrs
+
+    def update(self, instance, validated_data):
+        # `instance` - словарь {uuid: задача} уже отфильтрованных задач пользователя
+        now = timezone.now()
+        updated = []
+        fields = {'updated_at'}
+        for attrs in validated_data:
+            task = instance.get(attrs['uuid'])
+            if task is None:
+                continue
+            for attr, value in attrs.items():
+                if attr != 'uuid':
+                    setattr(task, attr, value)
+                    fields.add(attr)
+            task.updated_at = now
+            updated.append(task)
+        Task_char.objects.bulk_update(updated, sorted(fields))
+        return updated
+
+
+class TaskCharBulkUpdateSerializer(TaskCharSerializer):
+    id = serializers.UUIDField(source='uuid')
+
+    class Meta(TaskCharSerializer.Meta):
+        read_only_fields = ['user', 'created_at', 'updated_at']
+        list_serializer_class = TaskCharBulkUpdateListSerializer
+
+    def validate(self, attrs):
+        # Пакет разбирается с partial=True, где обязательных полей нет,
+        # но без id не понять, какую задачу обновлять
+        if 'uuid' not in attrs:
+            raise serializers.ValidationError({'id': [self.fields['id'].error_messages['required']]}, code='required')
+        return attrs
+
+
+class TaskBulkDeleteSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'result', 'error', 'attempts', 'created_at', 'updated_at', 'finished_at']
+        read_only_fields = fields
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     password1 = serializers.CharField(write_only=True, required=True)
     password2 = serializers.CharField(write_only=True, required=True)
@@ -0,0 +1,181 @@
+import time
+import uuid
+from itertools import groupby
+
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+
+from todolist.archive import get_archive_settings, move_rows
+from todolist.cache import invalidate_user_tasks
+from todolist.models import ArchivedTask, Task_char, TaskChange, TaskListState, TaskShard
+from todolist.routers import forget_placement, get_shard_settings, hash_shard
+from todolist.signals import bulk_task_changes
+
+
+# Перенос данных пользователя между шардами задач (todolist/routers.py) без
+# остановки сервиса. Пока идёт перенос, пользователь читает с исходного шарда,
+# а запись отклоняется с 503 (TasksMoving). Процессы помнят размещение не
+# дольше PLACEMENT_TTL, поэтому перед копированием и перед удалением
+# исходных данных - пауза MOVE_WAIT.
+
+# Столбцы задачи без внутреннего id: на целевом шарде он назначается заново,
+# в том же порядке, так что порядок задач в списке не меняется
+TASK_FIELDS = [field for field in Task_char._meta.concrete_fields if not field.primary_key]
+USER_MODELS = (Task_char, ArchivedTask, TaskChange, TaskListState)
+
+
+def current_shard(user_id):
+    # Шард из TaskShard, минуя кэш размещения, иначе шард по хешу
+    row = TaskShard.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).values_list('alias', flat=True).first()
+    return row or hash_shard(user_id)
+
+
+def delete_user_data(using, user_id):
+    with bulk_task_changes():
+        for model in USER_MODELS:
+            model.objects.using(using).filter(user_id=user_id).delete()
+
+
+def _insert_tasks(connection, rows):
+    qn = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        qn(Task_char._meta.db_table),
+        ', '.join(qn(field.column) for field in TASK_FIELDS),
+        ', '.join(['%s'] * len(TASK_FIELDS)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(value, connection) for field, value in zip(TASK_FIELDS, row)] for row in rows
+        ])
+
+
+def _skip_change_ids(using, user_id, through):
+    """
+    Новые записи журнала на шарде `using` получат id больше `through`: на
+    исходном шарде клиент мог получить токен больше, чем id здесь. Запись с
+    id = through вставляется и удаляется, счётчик id остаётся сдвинутым.
+    """
+    connection = connections[using]
+    if (TaskChange.objects.using(using).aggregate(latest=Max('id'))['latest'] or 0) >= through:
+        return
+    TaskChange.objects.using(using).create(
+        id=through, user_id=user_id, task_id=uuid.UUID(int=0), action=TaskChange.DELETE,
+    )
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [TaskChange]):
+            cursor.execute(sql)
+    TaskChange.objects.using(using).filter(id=through).delete()
+
+
+def copy_user_data(user_id, source, target, batch_size):
+    """
+    Копирует задачи, архив и состояние списка пользователя с `source` на
+    `target` одной транзакцией целевого шарда. Возвращает число задач.
+
+    Счётчики на целевом шарде ведут триггеры. Журнал изменений не копируется:
+    граница сжатия - последний выданный токен, клиенты с более старым
+    получают 410 и загружают список заново.
+    """
+    names = [field.attname for field in TASK_FIELDS]
+    tasks = list(Task_char.objects.using(source).filter(user_id=user_id).values_list('id', *names))
+    archived = list(
+        ArchivedTask.objects.using(source).filter(user_id=user_id).values_list('id', *names, 'archived_at')
+    )
+    state = TaskListState.objects.using(source).filter(user_id=user_id).first()
+    token = max(
+        TaskChange.objects.using(source).filter(user_id=user_id).aggregate(latest=Max('id'))['latest'] or 0,
+        state.compacted_through if state is not None else 0,
+    )
+
+    with transaction.atomic(using=target):
+        # Остатки прерванного переноса
+        delete_user_data(target, user_id)
+        # Задачи и архив - одной последовательностью по исходному id, архивные
+        # затем переносятся в архив: их id на целевом шарде не займёт новая задача
+        rows = sorted([row[:len(names) + 1] for row in archived] + tasks)
+        for start in range(0, len(rows), batch_size):
+            _insert_tasks(connections[target], [row[1:] for row in rows[start:start + batch_size]])
+        uuid_index = names.index('uuid') + 1
+        by_archived_at = sorted(archived, key=lambda row: row[-1])
+        for archived_at, group in groupby(by_archived_at, key=lambda row: row[-1]):
+            task_ids = [row[uuid_index] for row in group]
+            for start in range(0, len(task_ids), batch_size):
+                move_rows(
+                    Task_char.objects.using(target).filter(user_id=user_id, uuid__in=task_ids[start:start + batch_size]),
+                    ArchivedTask, archived_at=archived_at,
+                )
+
+        copied = (
+            Task_char.objects.using(target).filter(user_id=user_id).count(),
+            ArchivedTask.objects.using(target).filter(user_id=user_id).count(),
+        )
+        if copied != (len(tasks), len(archived)):
+            raise RuntimeError(
+                f'User {user_id}: copied {copied[0]} tasks and {copied[1]} archived tasks to "{target}", '
+                f'expected {len(tasks)} and {len(archived)}'
+            )
+
+        _skip_change_ids(target, user_id, token)
+        TaskListState.objects.using(target).update_or_create(user_id=user_id, defaults={
+            'last_deleted_at': state.last_deleted_at if state is not None else None,
+            'compacted_through': token,
+        })
+    return len(tasks) + len(archived)
+
+
+def move_user_tasks(user_id, target=None, wait=None):
+    """
+    Переносит данные пользователя на шард `target` (по умолчанию - шард по
+    хешу) и закрепляет его там; на шарде по хешу закрепление снимается.
+    Повторный вызов после сбоя продолжает перенос. Возвращает число
+    перенесённых задач.
+    """
+    target = target or hash_shard(user_id)
+    wait = get_shard_settings()['MOVE_WAIT'] if wait is None else wait
+    source = current_shard(user_id)
+    if source != target:
+        # Запись пользователя останавливается; ждём, пока это увидят все процессы
+        TaskShard.objects.update_or_create(user_id=user_id, defaults={'alias': source, 'moving': True})
+        forget_placement(user_id)
+        time.sleep(wait)
+        moved = copy_user_data(user_id, source, target, get_archive_settings()['BATCH_SIZE'])
+    else:
+        moved = 0
+
+    if target == hash_shard(user_id):
+        TaskShard.objects.filter(user_id=user_id).delete()
+    else:
+        TaskShard.objects.update_or_create(user_id=user_id, defaults={'alias': target, 'moving': False})
+    forget_placement(user_id)
+    invalidate_user_tasks(user_id)
+
+    if source != target:
+        # Процессы, ещё читающие с исходного шарда по старому размещению, заканчивают
+        time.sleep(wait)
+        with transaction.atomic(using=source):
+            delete_user_data(source, user_id)
+    return moved
+
+
+def pin_users():
+    """
+    Закрепляет пользователей без TaskShard за их текущим шардом: после этого
+    изменение TODOLIST_SHARDS не меняет, где лежат их задачи. Возвращает
+    число закреплённых.
+    """
+    sharded = bool(get_shard_settings()['DATABASES'])
+    pinned = set(TaskShard.objects.values_list('user_id', flat=True))
+    rows = [
+        TaskShard(user_id=user_id, alias=hash_shard(user_id) if sharded else DEFAULT_DB_ALIAS)
+        for user_id in User.objects.values_list('pk', flat=True).iterator()
+        if user_id not in pinned
+    ]
+    TaskShard.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def pinned_users():
+    # (user_id, шард) закреплённых пользователей, включая прерванные переносы
+    return list(TaskShard.objects.order_by('user_id').values_list('user_id', 'alias'))
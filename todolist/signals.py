@@ -0,0 +1,114 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from todolist.broker import get_broker
+from todolist.cache import invalidate_user_tasks
+from todolist.models import ArchivedTask, Task_char, TaskChange, TaskListState
+from todolist.routers import shard_for_user, stick_to_primary
+from todolist.sync import change_log_writer
+
+
+# Задачи пользователя изменились. Аргументы: user_id и списки UUID задач
+# created, updated, deleted. Отправляется один раз на запись из модели
+# (в том числе из админки) или на целый пакет из bulk-эндпоинтов
+tasks_changed = Signal()
+
+_state = threading.local()
+
+
+@contextmanager
+def bulk_task_changes():
+    # Внутри блока сигналы модели не рассылаются: пакетная операция
+    # сама отправляет один tasks_changed на весь пакет
+    _state.depth = getattr(_state, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _state.depth -= 1
+
+
+def in_bulk_task_changes():
+    return getattr(_state, 'depth', 0) > 0
+
+
+def is_user_deletion(origin):
+    # origin - пользователь (user.delete()) или QuerySet пользователей
+    return isinstance(origin, User) or (isinstance(origin, QuerySet) and origin.model is User)
+
+
+@receiver(post_save, sender=Task_char)
+def task_saved(sender, instance, created, **kwargs):
+    if instance.user_id is None or in_bulk_task_changes():
+        return
+    key = 'created' if created else 'updated'
+    tasks_changed.send(sender=sender, user_id=instance.user_id, **{key: [instance.uuid]})
+
+
+@receiver(post_delete, sender=Task_char)
+def task_deleted(sender, instance, origin=None, **kwargs):
+    # При удалении самого пользователя его состояние удаляется каскадом
+    if instance.user_id is None or is_user_deletion(origin) or in_bulk_task_changes():
+        return
+    tasks_changed.send(sender=sender, user_id=instance.user_id, deleted=[instance.uuid])
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_tasks(sender, instance, using, **kwargs):
+    # Каскад Django удаляет связанные строки только в базе пользователя;
+    # данные на другом шарде удаляются здесь, без сигналов по каждой задаче
+    shard = shard_for_user(instance.pk)
+    if shard == using:
+        return
+    with bulk_task_changes():
+        for model in (Task_char, ArchivedTask, TaskChange, TaskListState):
+            model.objects.using(shard).filter(user_id=instance.pk).delete()
+
+
+@receiver(tasks_changed)
+def invalidate_task_cache(sender, user_id, **kwargs):
+    invalidate_user_tasks(user_id)
+
+
+@receiver(tasks_changed)
+def stick_reads_to_primary(sender, user_id, **kwargs):
+    # Read-your-writes: следующие чтения пользователя не уходят на отстающую реплику
+    stick_to_primary(user_id)
+
+
+@receiver(tasks_changed)
+def record_task_deletion(sender, user_id, deleted=(), **kwargs):
+    if not deleted:
+        return
+    # Одна команда INSERT ... ON CONFLICT DO UPDATE вместо чтения и записи
+    TaskListState.objects.bulk_create(
+        [TaskListState(user_id=user_id, last_deleted_at=timezone.now())],
+        update_conflicts=True, unique_fields=['user'], update_fields=['last_deleted_at'],
+    )
+
+
+@receiver(tasks_changed)
+def record_task_changes(sender, user_id, created=(), updated=(), deleted=(), **kwargs):
+    # Одна вставка в журнал на запись или на целый пакет
+    changes = [
+        TaskChange(user_id=user_id, task_id=task_id, action=TaskChange.UPSERT)
+        for task_id in [*created, *updated]
+    ]
+    changes += [TaskChange(user_id=user_id, task_id=task_id, action=TaskChange.DELETE) for task_id in deleted]
+    with change_log_writer(user_id):
+        TaskChange.objects.bulk_create(changes)
+
+    # Рассылка подписчикам tasks/events/ только после коммита
+    events = [change_event(change) for change in changes]
+    transaction.on_commit(lambda: get_broker().publish(user_id, events), using=shard_for_user(user_id))
+
+
+def change_event(change):
+    # id события совпадает с id записи журнала, по нему клиент продолжает поток
+    return {'id': change.id, 'action': change.action, 'task_id': str(change.task_id)}
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+
+from todolist.metrics import record_flight
+from todolist.routers import shard_for_user
+from todolist.signals import tasks_changed
+
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    # Сколько секунд ждать результата чужого запроса, прежде чем считать самому
+    'TIMEOUT': 5,
+}
+
+# Результат ведущего запроса, завершившегося ошибкой: ждавшие считают сами
+_FAILED = object()
+
+
+class SingleFlight:
+    """
+    Одновременные одинаковые вычисления в процессе выполняются один раз.
+
+    Первый запрос с ключом (ведущий) считает, остальные ждут его результат.
+    Ожидание - concurrent.futures.Future: его ждут и потоки WSGI, и корутины
+    в цикле событий ASGI (через asyncio.wrap_future). Первый элемент ключа -
+    id пользователя: запись задач пользователя забывает его вычисления, и
+    пришедшие после записи запросы не получат данные, прочитанные до неё.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def _join(self, key):
+        # (future, ведущий ли запрос)
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = self._flights[key] = Future()
+            return future, True
+
+    def _finish(self, key, future, result):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        future.set_result(result)
+
+    def forget(self, user_id):
+        # Следующие запросы пользователя начнут новые вычисления; текущие досчитаются
+        with self._lock:
+            for key in [key for key in self._flights if key[0] == user_id]:
+                del self._flights[key]
+
+    def do(self, key, func):
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                result = future.result(self.timeout)
+            except TimeoutError:
+                result = _FAILED
+            record_flight(coalesced=result is not _FAILED)
+            return func() if result is _FAILED else result
+
+        record_flight(coalesced=False)
+        result = _FAILED
+        try:
+            result = func()
+        finally:
+            self._finish(key, future, result)
+        return result
+
+    async def ado(self, key, func):
+        # То же для корутины func; shield - таймаут не отменяет общий Future
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+            except TimeoutError:
+                result = _FAILED
+            record_flight(coalesced=result is not _FAILED)
+            return await func() if result is _FAILED else result
+
+        record_flight(coalesced=False)
+        result = _FAILED
+        try:
+            result = await func()
+        finally:
+            self._finish(key, future, result)
+        return result
+
+
+def get_single_flight_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_SINGLE_FLIGHT', {})}
+
+
+_single_flight = None
+
+
+def get_single_flight():
+    # None, если объединение запросов отключено в настройках
+    global _single_flight
+    if _single_flight is None:
+        config = get_single_flight_settings()
+        if not config['ENABLED']:
+            return None
+        _single_flight = SingleFlight(config['TIMEOUT'])
+    return _single_flight
+
+
+def coalesce(key, func):
+    single_flight = get_single_flight()
+    return func() if single_flight is None else single_flight.do(key, func)
+
+
+async def acoalesce(key, func):
+    single_flight = get_single_flight()
+    return await func() if single_flight is None else await single_flight.ado(key, func)
+
+
+@receiver(tasks_changed)
+def forget_user_flights(sender, user_id, **kwargs):
+    single_flight = get_single_flight()
+    if single_flight is None:
+        return
+    single_flight.forget(user_id)
+    using = shard_for_user(user_id)
+    if transaction.get_connection(using).in_atomic_block:
+        # И после коммита: запрос, начатый до него, мог прочитать старые данные
+        transaction.on_commit(lambda: single_flight.forget(user_id), using=using)
+
+
+@receiver(setting_changed)
+def reset_single_flight(setting, **kwargs):
+    global _single_flight
+    if setting == 'TODOLIST_SINGLE_FLIGHT':
+        _single_flight = None
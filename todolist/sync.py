@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+from todolist.models import ArchivedTask, Task_char, TaskChange, TaskListState
+
+
+class SyncTokenExpired(Exception):
+    # Токен старше сжатого журнала: клиенту нужна полная синхронизация
+    pass
+
+
+def parse_token(token):
+    try:
+        value = int(token)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sync token')
+    if value < 0:
+        raise ValueError('Invalid sync token')
+    return value
+
+
+@contextmanager
+def change_log_writer(user_id):
+    """
+    Блок, в котором добавляются записи журнала пользователя.
+
+    Токен - id записи из общей последовательности. На PostgreSQL транзакция
+    с меньшим id может закоммититься позже той, чей id клиент уже получил
+    как токен, и клиент её изменения не увидит. Поэтому строка TaskListState
+    пользователя блокируется до коммита: его записи коммитятся по порядку id.
+    На SQLite пишет одна транзакция за раз, блокировка не нужна.
+    """
+    using = router.db_for_write(TaskChange, user_id=user_id)
+    if not connections[using].features.has_select_for_update:
+        yield
+        return
+    with transaction.atomic(using=using):
+        TaskListState.objects.bulk_create([TaskListState(user_id=user_id)], ignore_conflicts=True)
+        TaskListState.objects.filter(user_id=user_id).select_for_update().values_list('pk', flat=True).first()
+        yield
+
+
+def compacted_through(user_id):
+    return TaskListState.objects.filter(user_id=user_id).values_list('compacted_through', flat=True).first() or 0
+
+
+def latest_token(user_id):
+    # Не ниже границы сжатия: иначе токен полной синхронизации после сжатия
+    # всего журнала (или переноса на другой шард) сразу бы устаревал
+    latest = TaskChange.objects.filter(user_id=user_id).aggregate(latest=Max('id'))['latest'] or 0
+    return max(latest, compacted_through(user_id))
+
+
+def full_snapshot(user_id):
+    # Токен берётся до чтения задач: изменения между запросами придут
+    # при следующей синхронизации ещё раз, и их повтор безопасен
+    token = latest_token(user_id)
+    # Архивные задачи не удалены: перенос в архив не попадает в журнал
+    tasks = list(Task_char.objects.filter(user_id=user_id)) + list(ArchivedTask.objects.filter(user_id=user_id))
+    return tasks, [], token, False
+
+
+def changes_since(user_id, since, limit):
+    """
+    Изменения задач пользователя после токена `since`.
+
+    Возвращает (изменённые задачи, id удалённых задач, новый токен, есть ли ещё).
+    Стоимость зависит от числа изменений, а не от размера списка.
+    """
+    if since < compacted_through(user_id):
+        raise SyncTokenExpired
+
+    changes = list(
+        TaskChange.objects.filter(user_id=user_id, id__gt=since)
+        .order_by('id')
+        .values_list('id', 'task_id', 'action')[:limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if not changes:
+        return [], [], since, False
+
+    # Важно только последнее действие по каждой задаче
+    last_action = {}
+    for _, task_id, action in changes:
+        last_action[task_id] = action
+    upserted = [task_id for task_id, action in last_action.items() if action == TaskChange.UPSERT]
+
+    tasks = list(Task_char.objects.filter(user_id=user_id, uuid__in=upserted))
+    found = {task.uuid for task in tasks}
+    missing = [task_id for task_id in upserted if task_id not in found]
+    if missing:
+        # Задача могла уйти в архив после изменения - она не удалена
+        tasks += ArchivedTask.objects.filter(user_id=user_id, uuid__in=missing)
+        found = {task.uuid for task in tasks}
+    deleted = [task_id for task_id in last_action if task_id not in found]
+    return tasks, deleted, changes[-1][0], has_more
@@ -0,0 +1,1741 @@
+import asyncio
+import gzip
+import json
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.hashers import get_hasher, identify_hasher, make_password
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from benchmarks.compare import find_regressions
+
+from .authentication import issue_token
+from .backends import clear_login_failures
+from .broker import get_broker
+from .compression import brotli
+from .counters import count_tasks, utc_today
+from .conditional import task_validators
+from .parsers import unpack_msgpack
+from .renderers import ORJSONRenderer, msgpack
+from .archive import archive_completed_tasks
+from .routers import ReplicaHealth, ReplicaRouter, get_replica_health, hash_shard, replica_reads, shard_aliases
+from .serializers import TaskCharRowEncoder, TaskCharSerializer
+from .singleflight import SingleFlight, get_single_flight
+from .throttling import CacheBucketStore, MemoryBucketStore, get_bucket_store, get_concurrency_limiter, parse_rate
+from .hashers import BoundedPBKDF2PasswordHasher, HashingExecutor, HashingOverloaded
+from .jobs import JOB_HANDLERS, claim_jobs, enqueue_job, run_job
+from .metrics import MetricsRegistry, RequestMetrics
+from .models import ArchivedTask, Job, RevokedToken, Task_char, TaskChange, TaskListState, TaskShard
+
+
+class TaskKeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+
+        for i in range(7):
+            Task_char.objects.create(user=self.user, title=f'Task {i}', completed=(i % 3 == 0))
+        Task_char.objects.create(user=self.other, title='Foreign task')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+        self.url = reverse('task-list')
+
+    def collect_pages(self, params):
+        titles = []
+        response = self.client.get(self.url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            titles += [task['title'] for task in response.data['results']]
+            if not response.data['next']:
+                return titles
+            response = self.client.get(response.data['next'])
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 7)
+
+    def test_pages_match_full_list(self):
+        for params in ({}, {'sort': 'title', 'order': 'asc'}, {'sort': 'created_at', 'order': 'desc'}):
+            full = [task['title'] for task in self.client.get(self.url, params).data]
+            paged = self.collect_pages({**params, 'limit': 3})
+            self.assertEqual(paged, full)
+
+    def test_completed_tasks_last(self):
+        results = self.client.get(self.url, {'limit': 10}).data['results']
+        flags = [task['completed'] for task in results]
+        self.assertEqual(flags, sorted(flags))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'limit': 2, 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_ties_broken_by_internal_key(self):
+        # Одинаковое время обновления: порядок внутри задаёт целый id
+        Task_char.objects.filter(user=self.user).update(updated_at=timezone.now())
+        for params in ({'order': 'desc'}, {'order': 'asc'}):
+            full = [task['title'] for task in self.client.get(self.url, params).data]
+            self.assertEqual(self.collect_pages({**params, 'limit': 2}), full)
+
+
+@override_settings(TODOLIST_CACHE={'ENABLED': True})
+class TaskResponseCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='Cached task')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+
+    def test_list_is_served_from_cache(self):
+        url = reverse('task-list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        # Остаются только запросы сессии и пользователя
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data[0]['title'], 'Cached task')
+
+    def test_write_invalidates_list_and_detail(self):
+        list_url = reverse('task-list')
+        detail_url = reverse('task-detail', args=[self.task.uuid])
+        self.client.get(list_url)
+        self.client.get(detail_url)
+
+        response = self.client.put(reverse('task-update', args=[self.task.uuid]), {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.client.post(reverse('task-create'), {'title': 'Second task'})
+
+        response = self.client.get(list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(sorted(task['title'] for task in response.data), ['Renamed', 'Second task'])
+        self.assertEqual(self.client.get(detail_url).data['title'], 'Renamed')
+
+
+class TaskConditionalRequestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.tasks = [
+            Task_char.objects.create(user=self.user, title='First task'),
+            Task_char.objects.create(user=self.user, title='Second task'),
+        ]
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+
+    def test_list_not_modified(self):
+        url = reverse('task-list')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_delete_changes_list_etag(self):
+        url = reverse('task-list')
+        etag = self.client.get(url)['ETag']
+        self.tasks[1].delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertTrue(TaskListState.objects.get(user=self.user).last_deleted_at)
+
+    def test_detail_not_modified(self):
+        url = reverse('task-detail', args=[self.tasks[0].uuid])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_if_match(self):
+        url = reverse('task-update', args=[self.tasks[0].uuid])
+        etag = self.client.get(reverse('task-detail', args=[self.tasks[0].uuid]))['ETag']
+
+        response = self.client.put(url, {'title': 'Renamed'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Повторная запись со старым ETag - конфликт
+        response = self.client.put(url, {'title': 'Stale'}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.tasks[0].refresh_from_db()
+        self.assertEqual(self.tasks[0].title, 'Renamed')
+
+
+class TaskBulkAPITest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        self.foreign = Task_char.objects.create(user=self.other, title='Foreign task')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+
+    def test_bulk_create(self):
+        payload = [{'title': f'Task {i}'} for i in range(5)]
+        response = self.client.post(reverse('task-bulk-create'), payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(Task_char.objects.filter(user=self.user).count(), 5)
+
+    def test_bulk_create_is_atomic(self):
+        payload = [{'title': 'Valid'}, {'title': ''}]
+        response = self.client.post(reverse('task-bulk-create'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task_char.objects.filter(user=self.user).exists())
+
+    @override_settings(TODOLIST_MAX_BATCH_SIZE=2)
+    def test_max_batch_size(self):
+        payload = [{'title': f'Task {i}'} for i in range(3)]
+        response = self.client.post(reverse('task-bulk-create'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_update_skips_foreign_tasks(self):
+        own = Task_char.objects.create(user=self.user, title='Own task')
+        payload = [{'id': str(own.uuid), 'completed': True}, {'id': str(self.foreign.uuid), 'completed': True}]
+        response = self.client.patch(reverse('task-bulk-update'), payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data['results']], [200, 404])
+
+        own.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertTrue(own.completed)
+        self.assertFalse(self.foreign.completed)
+
+    def test_bulk_update_requires_id(self):
+        own = Task_char.objects.create(user=self.user, title='Own task')
+        payload = [{'id': str(own.uuid), 'completed': True}, {'completed': True}]
+        response = self.client.patch(reverse('task-bulk-update'), payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'1': {'id': ['This field is required.']}})
+        self.assertEqual(response.data[1]['id'][0].code, 'required')
+        own.refresh_from_db()
+        self.assertFalse(own.completed)
+
+    def test_bulk_delete(self):
+        own = [Task_char.objects.create(user=self.user, title=f'Task {i}') for i in range(3)]
+        ids = [str(task.uuid) for task in own] + [str(self.foreign.uuid)]
+        response = self.client.post(reverse('task-bulk-delete'), {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data['results']], [204, 204, 204, 404])
+        self.assertFalse(Task_char.objects.filter(user=self.user).exists())
+        self.assertTrue(Task_char.objects.filter(id=self.foreign.id).exists())
+
+
+class TaskSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+
+        Task_char.objects.create(user=self.user, title='Buy milk', description='and fresh bread')
+        Task_char.objects.create(user=self.user, title='Write report', description='quarterly milk sales')
+        Task_char.objects.create(user=self.user, title='Walk the dog')
+        Task_char.objects.create(user=self.other, title='Buy milk too')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+        self.url = reverse('task-list')
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'search-area': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [task['title'] for task in response.data]
+
+    def test_searches_title_and_description(self):
+        self.assertEqual(sorted(self.search('milk')), ['Buy milk', 'Write report'])
+
+    def test_prefix_and_multi_term(self):
+        self.assertEqual(self.search('brea mil'), ['Buy milk'])
+        self.assertEqual(self.search('dog'), ['Walk the dog'])
+
+    def test_ranked(self):
+        self.assertEqual(self.search('milk', sort='relevance')[0], 'Buy milk')
+
+    def test_ranked_pages(self):
+        Task_char.objects.create(user=self.user, title='Milk the cow')
+        expected = self.search('milk', sort='relevance')
+        pages, url = [], self.url + '?search-area=milk&sort=relevance&limit=2'
+        while url:
+            response = self.client.get(url).json()
+            pages.append([task['title'] for task in response['results']])
+            url = response['next']
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual(sum(pages, []), expected)
+        response = self.client.get(self.url, {'search-area': 'milk', 'sort': 'relevance', 'cursor': 'bad'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_index_follows_updates_and_deletes(self):
+        task = Task_char.objects.get(title='Walk the dog')
+        task.title = 'Walk the cat'
+        task.save()
+        self.assertEqual(self.search('dog'), [])
+        self.assertEqual(self.search('cat'), ['Walk the cat'])
+        task.delete()
+        self.assertEqual(self.search('cat'), [])
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(sorted(self.search('milk')), ['Buy milk', 'Write report'])
+
+
+class TaskChangesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='First task')
+
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+        self.url = reverse('task-changes')
+
+    def test_delta_sync(self):
+        response = self.client.get(self.url)
+        self.assertEqual([task['title'] for task in response.data['changed']], ['First task'])
+        token = response.data['token']
+
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['token'], token)
+
+        second = Task_char.objects.create(user=self.user, title='Second task')
+        self.client.delete(reverse('task-delete', args=[self.task.uuid]))
+
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual([task['id'] for task in response.data['changed']], [str(second.uuid)])
+        self.assertEqual(response.data['deleted'], [self.task.uuid])
+        self.assertNotEqual(response.data['token'], token)
+
+    def test_compacted_token_expires(self):
+        token = self.client.get(self.url).data['token']
+        self.task.delete()
+        TaskChange.objects.update(created_at=timezone.now() - timedelta(days=60))
+        call_command('compact_task_changes', days=30, stdout=StringIO())
+
+        response = self.client.get(self.url, {'since': token})
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(TaskChange.objects.exists())
+
+
+class TaskEventsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='First task')
+        self.async_client.login(username='testuser', password='password123')
+
+    async def read_event(self, stream):
+        while True:
+            chunk = await anext(stream)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('id:'):
+                return chunk
+
+    async def test_resume_and_live_events(self):
+        response = await self.async_client.get(reverse('task-events'), headers={'Last-Event-ID': '0'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        replayed = await self.read_event(stream)
+        self.assertIn(str(self.task.uuid), replayed)
+        self.assertIn('event: upsert', replayed)
+
+        get_broker().publish(self.user.pk, [{'id': 10 ** 9, 'action': 'delete', 'task_id': str(self.task.uuid)}])
+        live = await self.read_event(stream)
+        self.assertIn('event: delete', live)
+        await stream.aclose()
+
+    async def test_requires_authentication(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('task-events'))
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(TODOLIST_AUTH={'MODE': 'token'})
+    async def test_accepts_token(self):
+        await self.async_client.alogout()
+        token = await sync_to_async(issue_token)(self.user)
+        response = await self.async_client.get(
+            reverse('task-events'), headers={'Authorization': f'Bearer {token}', 'Last-Event-ID': '0'},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(str(self.task.uuid), await self.read_event(stream))
+        await stream.aclose()
+        response = await self.async_client.get(reverse('task-events'), headers={'Authorization': 'Bearer broken'})
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncTaskAPITest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='First task')
+        self.foreign = Task_char.objects.create(user=self.other, title='Foreign task')
+        self.async_client.login(username='testuser', password='password123')
+
+    async def test_list_matches_sync_view(self):
+        response = await self.async_client.get(reverse('async-task-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task['title'] for task in response.json()], ['First task'])
+
+        response = await self.async_client.get(reverse('async-task-list'), {'limit': 1})
+        self.assertEqual(response.json()['results'][0]['id'], str(self.task.uuid))
+
+    async def test_create_update_delete(self):
+        response = await self.async_client.post(
+            reverse('async-task-create'), {'title': 'Async task'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        task_id = response.json()['id']
+
+        response = await self.async_client.patch(
+            reverse('async-task-update', args=[task_id]), {'completed': True}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['completed'])
+
+        response = await self.async_client.delete(reverse('async-task-delete', args=[task_id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(await Task_char.objects.filter(uuid=task_id).aexists())
+
+    async def test_update_if_match(self):
+        url = reverse('async-task-update', args=[self.task.uuid])
+        etag = (await self.async_client.get(reverse('async-task-detail', args=[self.task.uuid])))['ETag']
+
+        response = await self.async_client.patch(
+            url, {'title': 'Renamed'}, content_type='application/json', headers={'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Повторная запись со старым ETag - конфликт, задача не меняется
+        response = await self.async_client.patch(
+            url, {'title': 'Stale'}, content_type='application/json', headers={'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual((await Task_char.objects.aget(pk=self.task.pk)).title, 'Renamed')
+
+        response = await self.async_client.patch(
+            reverse('async-task-update', args=[self.foreign.uuid]), {'title': 'Foreign'},
+            content_type='application/json', headers={'If-Match': etag},
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_detail_not_modified(self):
+        url = reverse('async-task-detail', args=[self.task.uuid])
+        first = await self.async_client.get(url)
+        response = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(url, headers={'If-Modified-Since': first['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_foreign_task_not_found(self):
+        response = await self.async_client.get(reverse('async-task-detail', args=[self.foreign.uuid]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.delete(reverse('async-task-delete', args=[self.foreign.uuid]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TaskIntegerKeyTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_public_id_is_uuid(self):
+        user = User.objects.create_user(username='testuser', password='password123')
+        first = Task_char.objects.create(user=user, title='First')
+        second = Task_char.objects.create(user=user, title='Second')
+        self.assertGreater(second.id, first.id)
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse('task-detail', args=[first.uuid]))
+        self.assertEqual(response.data['id'], str(first.uuid))
+        self.assertEqual([task['id'] for task in client.get(reverse('task-list')).data], [str(second.uuid), str(first.uuid)])
+
+    def test_migration_keeps_existing_uuids(self):
+        executor = MigrationExecutor(connection)
+        leaf = executor.loader.graph.leaf_nodes('todolist')
+        executor.migrate([('todolist', '0008_job_queue')])
+        try:
+            apps = executor.loader.project_state([('todolist', '0008_job_queue')]).apps
+            user = apps.get_model('auth', 'User').objects.create(username='testuser')
+            old_task = apps.get_model('todolist', 'Task_char')
+            uuids = [old_task.objects.create(user_id=user.pk, title=f'Task {i}').id for i in range(3)]
+        finally:
+            executor = MigrationExecutor(connection)
+            executor.migrate(leaf)
+
+        tasks = list(Task_char.objects.order_by('id'))
+        self.assertEqual([task.uuid for task in tasks], uuids)
+        self.assertTrue(all(isinstance(task.id, int) for task in tasks))
+        self.assertGreater(Task_char.objects.create(user_id=user.pk, title='New').id, tasks[-1].id)
+
+        # Триггеры полнотекстового поиска пересозданы вместе с таблицей
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=user.pk))
+        response = client.get(reverse('task-list'), {'search-area': 'task'})
+        self.assertEqual(sorted(task['id'] for task in response.data), sorted(str(uuid) for uuid in uuids))
+
+
+    def test_migration_names_supported_backends(self):
+        migration = import_module('todolist.migrations.0009_task_char_integer_pk')
+        schema_editor = mock.MagicMock()
+        schema_editor.connection.vendor = 'oracle'
+        with self.assertRaisesMessage(RuntimeError, 'supported backends are sqlite, postgresql, mysql'):
+            migration.renumber(None, schema_editor)
+        schema_editor.connection.vendor = 'postgresql'
+        with self.assertRaisesMessage(RuntimeError, 'cannot be reversed on postgresql'):
+            migration.check_reversible(None, schema_editor)
+
+class TaskCharRowEncoderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        Task_char.objects.create(user=self.user, title='Plain task')
+        Task_char.objects.create(user=self.user, title='Задача', description='Описание   "кавычки"', completed=True)
+        Task_char.objects.create(title='Без пользователя', description=None)
+
+    def test_byte_compatible_with_model_serializer(self):
+        queryset = Task_char.objects.order_by('created_at')
+        expected = JSONRenderer().render(TaskCharSerializer(queryset, many=True).data)
+
+        encoder = TaskCharRowEncoder()
+        rows = encoder.encode_rows(encoder.values(queryset))
+        self.assertEqual(JSONRenderer().render(rows), expected)
+        self.assertEqual(ORJSONRenderer().render(rows), expected)
+
+    def test_fast_list_matches_slow_list(self):
+        self.client.login(username='testuser', password='password123')
+        for params in ({}, {'limit': 1}):
+            fast = self.client.get(reverse('task-list'), params).content
+            with override_settings(TODOLIST_FAST_SERIALIZER=False, TODOLIST_CACHE={'ENABLED': False}):
+                slow = self.client.get(reverse('task-list'), params).content
+            self.assertEqual(fast, slow)
+
+
+class SignedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        # Лимит входов с одного адреса общий для всех тестов процесса
+        get_bucket_store().clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        Task_char.objects.create(user=self.user, title='First task')
+        self.client = APIClient()
+
+    def get_token(self):
+        response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def test_token_request_without_auth_queries(self):
+        token = self.get_token()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.get(reverse('task-list')).status_code, 200)
+
+        # Пользователь уже в кэше процесса: ни auth_user, ни django_session
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('task-list'), {'search-area': 'first'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('django_session', sql)
+
+    def test_logout_revokes_token(self):
+        token = self.get_token()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.post(reverse('logout')).status_code, 200)
+        response = client.get(reverse('task-list'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+
+        client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(client.get(reverse('task-list')).status_code, 401)
+
+    def test_password_change_invalidates_token(self):
+        token = self.get_token()
+        self.user.set_password('newpassword123')
+        self.user.save()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.get(reverse('task-list')).status_code, 401)
+
+    def test_token_logout_ends_session(self):
+        # Вход в режиме 'both' выдал и сессию, и токен: выход по токену завершает обе
+        token = self.get_token()
+        self.assertIn('sessionid', self.client.cookies)
+        response = self.client.post(reverse('logout'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.client.get(reverse('task-list')).status_code, (401, 403))
+
+    def test_revoked_token_outlives_cache_and_expires(self):
+        token = self.get_token()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(client.post(reverse('logout')).status_code, 200)
+        # Отзыв хранится в БД, а не в кэше, который можно потерять
+        cache.clear()
+        caches['shared'].clear()
+        self.assertEqual(client.get(reverse('task-list')).status_code, 401)
+
+        # Истёкшие записи удаляет следующий отзыв
+        RevokedToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_token(self.user)}')
+        self.assertEqual(other.post(reverse('logout')).status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    async def test_async_views_reject_revoked_token(self):
+        response = await self.async_client.post(
+            reverse('login'), {'username': 'testuser', 'password': 'password123'}
+        )
+        headers = {'Authorization': f"Bearer {response.json()['token']}"}
+        response = await self.async_client.post(reverse('logout'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('async-task-list'), headers=headers)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        },
+    )
+    def test_local_shared_cache_fails_check(self):
+        # Счётчик неудачных входов в кэше одного процесса не виден другим
+        with override_settings(AUTHENTICATION_BACKENDS=['todolist.backends.LoginFailureBackend']):
+            with self.assertRaisesMessage(CommandError, 'todolist.E001'):
+                call_command('check', stdout=StringIO(), stderr=StringIO())
+        with override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.ModelBackend']):
+            call_command('check', stdout=StringIO())
+
+    @override_settings(TODOLIST_AUTH={'MODE': 'token'})
+    def test_token_mode_creates_no_session(self):
+        self.get_token()
+        self.assertNotIn('sessionid', self.client.cookies)
+
+    @override_settings(TODOLIST_AUTH={'MODE': 'session'})
+    def test_session_mode_returns_no_token(self):
+        response = self.client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+        self.assertNotIn('token', response.json())
+        self.assertIn('sessionid', self.client.cookies)
+
+    async def test_async_views_accept_token(self):
+        token = await self.async_client.post(
+            reverse('login'), {'username': 'testuser', 'password': 'password123'}
+        )
+        token = token.json()['token']
+        response = await self.async_client.get(
+            reverse('async-task-list'), headers={'Authorization': f'Bearer {token}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(
+            reverse('async-task-list'), headers={'Authorization': 'Bearer broken'}
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class SeedTasksCommandTest(TestCase):
+    def test_seed_is_reproducible(self):
+        call_command('seed_tasks', users=2, tasks=5, seed=1, stdout=StringIO())
+        first = list(Task_char.objects.order_by('user__username', 'title').values_list('title', flat=True))
+        self.assertEqual(len(first), 10)
+        self.assertEqual(TaskChange.objects.count(), 10)
+        self.assertTrue(self.client.login(username='bench0', password='bench-password'))
+
+        call_command('seed_tasks', users=2, tasks=5, seed=1, clear=True, stdout=StringIO())
+        second = list(Task_char.objects.order_by('user__username', 'title').values_list('title', flat=True))
+        self.assertEqual(first, second)
+        # Удаление пользователей запросом не пишет задачи в журнал
+        self.assertEqual(TaskChange.objects.count(), 10)
+
+    def test_compare_reports_regressions(self):
+        def report(p95, rps, queries):
+            result = {
+                'latency_ms': {'p50': 1.0, 'p95': p95, 'p99': p95}, 'throughput_rps': rps,
+                'queries_per_request': queries, 'alloc_peak_kib': 10.0, 'errors': 0,
+            }
+            return {'meta': {}, 'results': {'wsgi': {'list': result}}}
+
+        base = report(10.0, 100.0, 2.0)
+        self.assertEqual(find_regressions(base, report(11.0, 95.0, 2.0)), [])
+        regressions = find_regressions(base, report(20.0, 50.0, 3.0))
+        self.assertEqual(len(regressions), 4)
+
+
+class AsyncCsrfTest(TestCase):
+    def setUp(self):
+        # Лимит входов с одного адреса общий для всех тестов процесса
+        get_bucket_store().clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_token_requests_skip_csrf(self):
+        token = APIClient().post(
+            reverse('login'), {'username': 'testuser', 'password': 'password123'}
+        ).json()['token']
+        response = self.client.post(
+            reverse('async-task-create'), {'title': 'Token task'}, content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_session_requests_require_csrf(self):
+        self.client.login(username='testuser', password='password123')
+        response = self.client.post(
+            reverse('async-task-create'), {'title': 'Session task'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(TODOLIST_METRICS={'ENABLED': True, 'SLOW_SAMPLE_RATE': 0})
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='First task')
+        self.client = APIClient()
+        self.client.login(username='testuser', password='password123')
+
+    def test_metrics_per_view(self):
+        self.client.get(reverse('task-list'))
+        self.client.patch(reverse('task-update', args=[self.task.uuid]), {'completed': True})
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('todolist_http_requests_total{view="task-list",method="GET",status="200"} 1', text)
+        self.assertIn('todolist_http_requests_total{view="task-update",method="PATCH",status="200"} 1', text)
+        self.assertIn(
+            'todolist_http_request_duration_seconds_count{view="task-list",method="GET"} 1', text
+        )
+        # Сессия, пользователь и сами задачи - запросы к БД учтены
+        self.assertNotIn('todolist_http_request_db_queries_sum{view="task-list",method="GET"} 0\n', text)
+        self.assertIn('todolist_http_request_serialize_seconds_total{view="task-update",method="PATCH"}', text)
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+    @override_settings(TODOLIST_METRICS={'ENABLED': True, 'SLOW_REQUEST_MS': 0, 'SLOW_SAMPLE_RATE': 1})
+    def test_slow_request_log_contains_sql(self):
+        with self.assertLogs('todolist.metrics', 'WARNING') as logs:
+            self.client.get(reverse('task-list'))
+        self.assertIn('todolist_task_char', logs.output[0])
+
+
+    def test_finished_threads_fold_into_total(self):
+        registry = MetricsRegistry((0.1,), (1,))
+
+        def record():
+            registry.record('task-list', 'GET', 200, 0.01, RequestMetrics(collect_sql=False), 10)
+
+        for _ in range(5):
+            thread = threading.Thread(target=record)
+            thread.start()
+            thread.join()
+        record()
+        stats = registry.collect()[('task-list', 'GET')]
+        self.assertEqual(stats.statuses, {200: 6})
+        self.assertEqual(stats.response_bytes, 60)
+        # Остался словарь только текущего потока
+        self.assertEqual(len(registry._thread_stats), 1)
+
+class SQLiteProductionProfileTest(TestCase):
+    def setUp(self):
+        if connection.settings_dict['ENGINE'] != 'todolist.db.sqlite3':
+            self.skipTest('SQLite production profile is disabled')
+
+    def test_pragmas_and_write_queue(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+        # Транзакция TestCase открыта через BEGIN IMMEDIATE и стоит в очереди записи
+        self.assertTrue(connection._holds_write_queue)
+
+
+@override_settings(TODOLIST_REPLICAS={'DATABASES': ['replica'], 'STICKY_SECONDS': 5, 'MAX_LAG_SECONDS': 10})
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.router = ReplicaRouter()
+        # Метки read-your-writes из других тестов (id пользователей повторяются)
+        cache.clear()
+
+    def set_replica_state(self, lag):
+        health = get_replica_health()
+        health.state = {'replica': lag}
+        health.checked_at = time.monotonic()
+
+    def db_for_read(self):
+        with replica_reads(self.user.pk):
+            return self.router.db_for_read(Task_char)
+
+    def test_reads_go_to_healthy_replica(self):
+        self.set_replica_state(0.0)
+        self.assertEqual(self.db_for_read(), 'replica')
+        # Вне replica_reads и для записи - default
+        self.assertEqual(self.router.db_for_read(Task_char), 'default')
+        self.assertEqual(self.router.db_for_write(Task_char), 'default')
+
+    def test_read_your_writes(self):
+        self.set_replica_state(0.0)
+        Task_char.objects.create(user=self.user, title='Fresh task')
+        self.assertEqual(self.db_for_read(), 'default')
+
+    def test_lagging_or_unavailable_replica_falls_back(self):
+        self.set_replica_state(60.0)
+        self.assertEqual(self.db_for_read(), 'default')
+        self.set_replica_state(None)
+        self.assertEqual(self.db_for_read(), 'default')
+
+    def test_health_check_measures_lag(self):
+        Task_char.objects.create(user=self.user, title='Logged task')
+        health = ReplicaHealth(['default'], interval=5)
+        health.refresh()
+        self.assertEqual(health.available(max_lag=0), ['default'])
+
+
+class SingleStatementWriteTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        self.task = Task_char.objects.create(user=self.user, title='First task', description='Keep me')
+        self.foreign = Task_char.objects.create(user=self.other, title='Foreign task')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def task_statements(self, queries):
+        return [query['sql'] for query in queries.captured_queries if 'todolist_task_char"' in query['sql']]
+
+    def test_partial_update_is_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('task-update', args=[self.task.uuid]), {'completed': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['description'], 'Keep me')
+        self.assertTrue(response.data['completed'])
+        updated_at = Task_char.objects.get(id=self.task.id).updated_at
+        self.assertEqual(response['ETag'], task_validators(self.task.uuid, updated_at)[0])
+
+        statements = self.task_statements(queries)
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].startswith('UPDATE'))
+        # Записываются только переданные поля и updated_at
+        self.assertNotIn('"title"', statements[0].split('WHERE')[0])
+        self.assertTrue(TaskChange.objects.filter(task_id=self.task.uuid, action=TaskChange.UPSERT).exists())
+
+    def test_update_without_returning(self):
+        with mock.patch('todolist.writes.returning_supported', return_value=False):
+            response = self.client.patch(reverse('task-update', args=[self.task.uuid]), {'title': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Renamed')
+        self.assertEqual(response.data['description'], 'Keep me')
+
+    def test_update_foreign_task_is_not_found(self):
+        response = self.client.patch(reverse('task-update', args=[self.foreign.uuid]), {'title': 'Mine now'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Task_char.objects.get(id=self.foreign.id).title, 'Foreign task')
+
+    def test_delete_status_codes(self):
+        response = self.client.delete(reverse('task-delete', args=[self.foreign.uuid]))
+        self.assertEqual(response.status_code, 404)
+        self.assertTrue(Task_char.objects.filter(id=self.foreign.id).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse('task-delete', args=[self.task.uuid]))
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(self.task_statements(queries)), 1)
+        self.assertTrue(TaskChange.objects.filter(task_id=self.task.uuid, action=TaskChange.DELETE).exists())
+        self.assertEqual(self.client.delete(reverse('task-delete', args=[self.task.uuid])).status_code, 404)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        self.files_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.files_dir.cleanup)
+        settings_override = override_settings(TODOLIST_JOBS={'FILES_DIR': self.files_dir.name, 'RETRY_DELAY': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        Task_char.objects.create(user=self.user, title='Open task')
+        Task_char.objects.create(user=self.user, title='Done task', completed=True)
+        Task_char.objects.create(user=self.other, title='Foreign done', completed=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def run_jobs(self):
+        call_command('run_jobs', once=True, workers=0, stdout=StringIO())
+
+    def test_export(self):
+        response = self.client.post(reverse('job-export'))
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], Job.QUEUED)
+        job_url = response['Location']
+
+        result_url = reverse('job-result', args=[response.data['id']])
+        self.assertEqual(self.client.get(result_url).status_code, 409)
+        self.run_jobs()
+
+        response = self.client.get(job_url)
+        self.assertEqual(response.data['status'], Job.SUCCEEDED)
+        self.assertEqual(response.data['result'], {'count': 2, 'format': 'ndjson'})
+        response = self.client.get(result_url)
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(sorted(json.loads(line)['title'] for line in lines), ['Done task', 'Open task'])
+
+        other_client = APIClient()
+        other_client.force_authenticate(self.other)
+        self.assertEqual(other_client.get(job_url).status_code, 404)
+
+    def test_import(self):
+        response = self.client.post(
+            reverse('job-import'), data=b'{"title": "Imported"}\nnot json\n{"title": ""}\n',
+            content_type='application/x-ndjson',
+        )
+        self.assertEqual(response.status_code, 202)
+        self.run_jobs()
+
+        job = Job.objects.get(id=response.data['id'])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result['created'], 1)
+        self.assertEqual([error['line'] for error in job.result['errors']], [2, 3])
+        self.assertTrue(Task_char.objects.filter(user=self.user, title='Imported').exists())
+
+        response = self.client.post(reverse('job-import'), {'title': 'Not a list'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_clear_completed(self):
+        response = self.client.post(reverse('job-clear-completed'))
+        self.run_jobs()
+        job = Job.objects.get(id=response.data['id'])
+        self.assertEqual(job.result, {'deleted': 1})
+        self.assertEqual(list(Task_char.objects.filter(user=self.user).values_list('title', flat=True)), ['Open task'])
+        self.assertTrue(Task_char.objects.filter(title='Foreign done').exists())
+        self.assertTrue(TaskChange.objects.filter(user=self.user, action=TaskChange.DELETE).exists())
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = enqueue_job(self.user, Job.EXPORT)
+        with mock.patch.dict(JOB_HANDLERS, {Job.EXPORT: mock.Mock(side_effect=RuntimeError('boom'))}):
+            with self.assertLogs('todolist.jobs', 'ERROR') as logs:
+                self.run_jobs()
+        self.assertEqual(len(logs.records), job.max_attempts)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertIn('boom', job.error)
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue_job(self.user, Job.CLEAR_COMPLETED)
+        [(job_id, lease)] = claim_jobs(1)
+        self.assertEqual(claim_jobs(1), [])
+
+        # Воркер пропал: после таймаута задачу забирает другой, старый теряет аренду
+        Job.objects.filter(id=job_id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        [(_, new_lease)] = claim_jobs(1)
+        self.assertNotEqual(lease, new_lease)
+        run_job(job_id, lease)
+        self.assertEqual(Job.objects.get(id=job_id).status, Job.RUNNING)
+        run_job(job_id, new_lease)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.SUCCEEDED, 2))
+
+
+class TaskExportImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+        Task_char.objects.create(user=self.user, title='First', description='Line one\nline two, "quoted"')
+        Task_char.objects.create(user=self.user, title='Second', completed=True)
+        Task_char.objects.create(user=self.other, title='Foreign')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_export_ndjson(self):
+        response = self.client.get(reverse('task-export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['First', 'Second'])
+        task = Task_char.objects.get(title='First')
+        self.assertEqual(rows[0], TaskCharSerializer(task).data)
+
+    def test_export_csv_round_trip(self):
+        response = self.client.get(reverse('task-export'), HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        body = b''.join(response.streaming_content)
+        self.assertTrue(body.startswith(b'id,user,title,description,completed,created_at,updated_at'))
+        self.assertEqual(self.client.get(reverse('task-export') + '?format=csv')['Content-Type'],
+                         'text/csv; charset=utf-8')
+
+        other_client = APIClient()
+        other_client.force_authenticate(self.other)
+        response = other_client.post(reverse('task-import'), data=body, content_type='text/csv')
+        # id задач чужого пользователя заменяются новыми
+        self.assertEqual(response.data, {'created': 2, 'updated': 0, 'errors': []})
+        imported = Task_char.objects.filter(user=self.other).exclude(title='Foreign').order_by('title')
+        self.assertEqual(
+            list(imported.values_list('title', 'description', 'completed')),
+            [('First', 'Line one\nline two, "quoted"', False), ('Second', '', True)],
+        )
+        self.assertEqual(Task_char.objects.filter(user=self.user).count(), 2)
+
+    def test_reimport_keeps_ids_and_dates(self):
+        body = b''.join(self.client.get(reverse('task-export')).streaming_content)
+        rows = [json.loads(line) for line in body.splitlines()]
+        Task_char.objects.filter(user=self.user).delete()
+        response = self.client.post(reverse('task-import'), data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.data, {'created': 2, 'updated': 0, 'errors': []})
+        tasks = Task_char.objects.filter(user=self.user).order_by('created_at')
+        self.assertEqual(TaskCharSerializer(tasks, many=True).data, rows)
+
+        # Повторный импорт обновляет те же задачи, включая архивные
+        self.assertEqual(archive_completed_tasks(days=0), 1)
+        edited = '\n'.join(json.dumps({**row, 'title': row['title'] + '!'}) for row in rows)
+        response = self.client.post(reverse('task-import'), data=edited.encode(), content_type='application/x-ndjson')
+        self.assertEqual(response.data, {'created': 0, 'updated': 2, 'errors': []})
+        self.assertEqual(
+            sorted(Task_char.objects.filter(user=self.user).values_list('uuid', 'title')),
+            sorted((uuid.UUID(row['id']), row['title'] + '!') for row in rows),
+        )
+        self.assertFalse(ArchivedTask.objects.filter(user=self.user).exists())
+
+    @override_settings(TODOLIST_MAX_BATCH_SIZE=2)
+    def test_import_ndjson_in_batches(self):
+        lines = [json.dumps({'title': f'Task {n}'}) for n in range(5)] + ['[1, 2]', '{"title": ""}', '{oops']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('task-import'), data='\n'.join(lines).encode(), content_type='application/x-ndjson',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual([error['line'] for error in response.data['errors']], [6, 7, 8])
+        inserts = [query for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT INTO "todolist_task_char"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(TaskChange.objects.filter(user=self.user, action=TaskChange.UPSERT).count(), 7)
+
+    def test_import_unsupported_media_type(self):
+        response = self.client.post(reverse('task-import'), [{'title': 'JSON'}], format='json')
+        self.assertEqual(response.status_code, 415)
+
+
+@override_settings(TODOLIST_THROTTLE={'RATES': {'anon': '100/min', 'user': '2/min', 'auth': '2/min'}})
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.other = User.objects.create_user(username='otheruser', password='password123')
+
+    def test_login_is_limited_per_ip(self):
+        client = APIClient()
+        for _ in range(2):
+            response = client.post(reverse('login'), {'username': 'testuser', 'password': 'wrong'}, format='json')
+            self.assertEqual(response.status_code, 401)
+        response = client.post(reverse('login'), {'username': 'testuser', 'password': 'password123'}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 31))
+
+        other_ip = APIClient(REMOTE_ADDR='10.0.0.2')
+        response = other_ip.post(reverse('login'), {'username': 'testuser', 'password': 'password123'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_buckets_are_per_user(self):
+        client, other_client = APIClient(), APIClient()
+        client.force_authenticate(self.user)
+        other_client.force_authenticate(self.other)
+        self.assertEqual([client.get(reverse('task-list')).status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(other_client.get(reverse('task-list')).status_code, 200)
+        # Асинхронные view списывают из той же корзины
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('async-task-list'))
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_bucket_refill(self):
+        store = MemoryBucketStore()
+        capacity, refill_rate = parse_rate('2/s')
+        self.assertEqual([store.consume('key', capacity, refill_rate, now=0) for _ in range(3)], [0, 0, 0.5])
+        self.assertEqual(store.consume('key', capacity, refill_rate, now=0.5), 0)
+        self.assertEqual(store.consume('key', capacity, refill_rate, now=10), 0)
+
+        cache_store = CacheBucketStore()
+        self.assertEqual([cache_store.consume('key', 1, 1, now=0) for _ in range(2)], [0, 1])
+        self.assertEqual(cache_store.consume('key', 1, 1, now=1), 0)
+
+    @override_settings(TODOLIST_THROTTLE={'MAX_CONCURRENT_REQUESTS': 1, 'QUEUE_TIMEOUT': 0, 'RETRY_AFTER': 2})
+    def test_concurrency_limit_sheds_load(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        limiter = get_concurrency_limiter()
+        self.assertTrue(limiter.acquire())
+        try:
+            response = client.get(reverse('task-list'))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '2')
+            self.assertEqual(client.get(reverse('metrics')).status_code, 200)
+        finally:
+            limiter.release()
+        self.assertEqual(client.get(reverse('task-list')).status_code, 200)
+        self.assertEqual(limiter.active, 0)
+
+    @override_settings(TODOLIST_THROTTLE={'MAX_CONCURRENT_REQUESTS': 1, 'QUEUE_TIMEOUT': 0, 'RETRY_AFTER': 2})
+    def test_concurrency_limit_holds_slot_while_streaming(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        limiter = get_concurrency_limiter()
+        # Экспорт занимает место, пока его тело отдаётся
+        response = client.get(reverse('task-export'))
+        self.assertEqual(limiter.active, 1)
+        self.assertEqual(client.get(reverse('task-list')).status_code, 503)
+        b''.join(response.streaming_content)
+        self.assertEqual(limiter.active, 0)
+
+        # Оборванная отдача тоже освобождает место
+        response = client.get(reverse('task-export'))
+        response.close()
+        self.assertEqual(limiter.active, 0)
+        self.assertEqual(client.get(reverse('task-list')).status_code, 200)
+
+    @override_settings(TODOLIST_THROTTLE={'MAX_CONCURRENT_REQUESTS': 1, 'QUEUE_TIMEOUT': 0, 'RETRY_AFTER': 2})
+    async def test_async_concurrency_limit_holds_slot_while_streaming(self):
+        await self.async_client.aforce_login(self.user)
+        limiter = get_concurrency_limiter()
+        response = await self.async_client.get(reverse('task-export'))
+        self.assertEqual(limiter.active, 1)
+        # Синхронный итератор экспорта обращается к БД: ASGI читает его в потоке
+        await sync_to_async(b''.join)(response.streaming_content)
+        self.assertEqual(limiter.active, 0)
+
+
+class PasswordHashingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_bucket_store().clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+
+    def login(self, password='password123'):
+        return self.client.post(reverse('login'), {'username': 'testuser', 'password': password}, format='json')
+
+    def test_new_hashes_use_preferred_hasher(self):
+        self.assertEqual(identify_hasher(self.user.password).algorithm, get_hasher('default').algorithm)
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        with mock.patch.object(BoundedPBKDF2PasswordHasher, 'iterations', 1000):
+            User.objects.filter(pk=self.user.pk).update(password=make_password('password123', hasher='pbkdf2_sha256'))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm, get_hasher('default').algorithm)
+
+    @override_settings(TODOLIST_PASSWORDS={'FAILED_LOGIN_LIMIT': 3, 'FAILED_LOGIN_WINDOW': 60})
+    def test_locked_username_skips_password_check(self):
+        self.assertEqual([self.login('wrong').status_code for _ in range(3)], [401, 401, 429])
+        with mock.patch('django.contrib.auth.models.AbstractBaseUser.check_password') as check:
+            response = self.login()
+        check.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+        clear_login_failures('testuser')
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_non_string_username_rejected(self):
+        for username in (123, ['testuser'], {'name': 'testuser'}):
+            response = self.client.post(
+                reverse('login'), {'username': username, 'password': 'password123'}, format='json',
+            )
+            self.assertEqual(response.status_code, 401)
+
+    def test_hashing_executor_is_bounded(self):
+        executor = HashingExecutor(workers=1, max_pending=1)
+        self.addCleanup(executor.shutdown)
+        release = threading.Event()
+        started = threading.Thread(target=executor.run, args=(release.wait,))
+        started.start()
+        time.sleep(0.05)
+        with self.assertRaises(HashingOverloaded):
+            executor.run(lambda: None)
+        release.set()
+        started.join()
+        self.assertEqual(executor.run(lambda: 42), 42)
+
+        with mock.patch.object(HashingExecutor, 'run', side_effect=HashingOverloaded):
+            response = self.client.post(
+                reverse('register'), {'username': 'new', 'password1': 'pw', 'password2': 'pw'}, format='json',
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class TaskStatsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stats(self):
+        response = self.client.get(reverse('task-stats'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertCountsMatch(self):
+        stats = self.stats()
+        self.assertEqual(
+            {name: stats[name] for name in ('total', 'completed', 'updated_today')}, count_tasks(self.user.pk),
+        )
+        self.assertEqual(stats['pending'], stats['total'] - stats['completed'])
+        return stats
+
+    def test_counters_follow_every_write_path(self):
+        self.assertEqual(self.stats(), {'total': 0, 'completed': 0, 'pending': 0, 'updated_today': 0})
+        task = Task_char.objects.create(user=self.user, title='Model save')
+        self.client.post(reverse('task-bulk-create'), [{'title': 'A'}, {'title': 'B', 'completed': True}], format='json')
+        self.assertEqual(self.assertCountsMatch()['total'], 3)
+
+        # Одиночный UPDATE ... RETURNING и повторное обновление той же задачи за сутки
+        self.client.patch(reverse('task-update', args=[task.uuid]), {'completed': True})
+        self.client.patch(reverse('task-update', args=[task.uuid]), {'title': 'Again'})
+        stats = self.assertCountsMatch()
+        self.assertEqual((stats['completed'], stats['updated_today']), (2, 3))
+
+        Task_char.objects.filter(pk=task.pk).update(completed=False, updated_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.assertCountsMatch()['updated_today'], 2)
+        self.client.delete(reverse('task-delete', args=[task.uuid]))
+        ids = [str(uuid) for uuid in Task_char.objects.filter(user=self.user).values_list('uuid', flat=True)[:1]]
+        self.client.post(reverse('task-bulk-delete'), {'ids': ids}, format='json')
+        self.assertEqual(self.assertCountsMatch()['total'], 1)
+
+    def test_stats_read_one_row(self):
+        Task_char.objects.create(user=self.user, title='Counted')
+        with CaptureQueriesContext(connection) as queries:
+            self.stats()
+        self.assertFalse([query for query in queries.captured_queries if 'todolist_task_char"' in query['sql']])
+
+    def test_day_rollover(self):
+        task = Task_char.objects.create(user=self.user, title='Yesterday')
+        TaskListState.objects.filter(user=self.user).update(updated_day=utc_today() - timedelta(days=1))
+        self.assertEqual(self.stats()['updated_today'], 0)
+        task.save()
+        self.assertEqual(self.stats()['updated_today'], 1)
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Task_char.objects.create(user=self.user, title='Counted')
+        TaskListState.objects.filter(user=self.user).update(task_count=5)
+        out = StringIO()
+        call_command('reconcile_task_counts', '--dry-run', stdout=out)
+        self.assertIn(f'user {self.user.pk}: total 5 -> 1', out.getvalue())
+        self.assertEqual(self.stats()['total'], 5)
+
+        call_command('reconcile_task_counts', stdout=StringIO())
+        self.assertEqual(self.assertCountsMatch()['total'], 1)
+
+    def test_user_deletion(self):
+        Task_char.objects.create(user=self.user, title='Cascade')
+        self.user.delete()
+        # Внешние ключи SQLite проверяются при коммите, которого в TestCase нет
+        connection.check_constraints()
+        self.assertFalse(TaskListState.objects.exists())
+
+
+
+@unittest.skipIf(msgpack is None, 'msgpack is not installed')
+class MessagePackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        for n in range(3):
+            Task_char.objects.create(user=self.user, title=f'Task {n}', completed=n == 0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_same_data_as_json(self):
+        expected = self.client.get(reverse('task-list'), {'limit': 2}).json()
+        response = self.client.get(reverse('task-list'), {'limit': 2}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+
+        accept = 'application/msgpack; layout=columns'
+        response = self.client.get(reverse('task-list'), {'limit': 2}, HTTP_ACCEPT=accept)
+        packed = msgpack.unpackb(response.content)
+        self.assertEqual(packed['results']['columns'][0], 'id')
+        self.assertEqual(len(packed['results']['rows']), 2)
+        self.assertEqual(unpack_msgpack(response.content, accept), expected)
+
+    def test_bulk_create_from_columns(self):
+        body = msgpack.packb({'columns': ['title', 'completed'], 'rows': [['Packed', True], ['Columns', False]]})
+        response = self.client.post(
+            reverse('task-bulk-create'), data=body, content_type='application/msgpack; layout=columns',
+            HTTP_ACCEPT='application/msgpack',
+        )
+        self.assertEqual(response.status_code, 201)
+        created = msgpack.unpackb(response.content)['results']
+        self.assertEqual(
+            [(item['task']['title'], item['task']['completed']) for item in created],
+            [('Packed', True), ('Columns', False)],
+        )
+
+        response = self.client.post(reverse('task-bulk-create'), data=b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_async_views(self):
+        self.client.logout()
+        self.client = Client()
+        self.client.login(username='testuser', password='password123')
+        response = self.client.post(
+            reverse('async-task-create'), data=msgpack.packb({'title': 'Async packed'}),
+            content_type='application/msgpack', HTTP_ACCEPT='application/msgpack',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)['title'], 'Async packed')
+
+        accept = 'application/msgpack; layout=columns'
+        response = self.client.get(reverse('async-task-list'), HTTP_ACCEPT=accept)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(len(unpack_msgpack(response.content, accept)), 4)
+        self.assertEqual(self.client.get(reverse('async-task-list'))['Content-Type'], 'application/json')
+
+
+class ResponseCompressionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        Task_char.objects.bulk_create(
+            Task_char(user=self.user, title=f'Task {n}', description='Some description ' * 5) for n in range(50)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_gzip_list_etag(self):
+        plain = self.client.get(reverse('task-list'))
+        self.assertNotIn('Content-Encoding', plain)
+        response = self.client.get(reverse('task-list'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        # Сильный ETag различает байты представлений, версия задач та же
+        self.assertEqual(response['ETag'], plain['ETag'][:-1] + '-gzip"')
+        if msgpack is not None:
+            msgpack_etag = self.client.get(reverse('task-list'), HTTP_ACCEPT='application/msgpack')['ETag']
+            self.assertEqual(msgpack_etag, plain['ETag'][:-1] + '-msgpack"')
+
+        not_modified = self.client.get(
+            reverse('task-list'), HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_if_match_accepts_representation_etag(self):
+        task = Task_char.objects.filter(user=self.user).first()
+        url = reverse('task-update', args=[task.uuid])
+        etag = self.client.get(reverse('task-detail', args=[task.uuid]))['ETag']
+        response = self.client.patch(url, {'title': 'Renamed'}, HTTP_IF_MATCH=etag[:-1] + '-msgpack-gzip"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(url, {'title': 'Stale'}, HTTP_IF_MATCH=etag[:-1] + '-gzip"')
+        self.assertEqual(response.status_code, 412)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_preferred(self):
+        response = self.client.get(reverse('task-list'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(brotli.decompress(response.content))), 50)
+        response = self.client.get(reverse('task-list'), HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_small_response_not_compressed(self):
+        task = Task_char.objects.filter(user=self.user).first()
+        response = self.client.get(reverse('task-detail', args=[task.uuid]), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_streaming_export(self):
+        response = self.client.get(reverse('task-export'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 50)
+
+    async def test_event_stream_not_compressed(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('task-events'), headers={'Last-Event-ID': '0', 'Accept-Encoding': 'gzip'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertNotIn('Content-Encoding', response)
+        await response.streaming_content.aclose()
+
+
+class TaskArchiveTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now()
+        for n in range(6):
+            task = Task_char.objects.create(user=self.user, title=f'Task {n}', completed=n < 4)
+            # Выполненные 0-2 и невыполненная 4 давно не менялись, выполненная 3 - недавно
+            age = timedelta(days=40 + n) if n != 3 else timedelta(days=1)
+            Task_char.objects.filter(pk=task.pk).update(updated_at=now - age)
+        self.archived = list(Task_char.objects.filter(title__in=['Task 0', 'Task 1', 'Task 2']).order_by('id'))
+
+    def archive(self, **options):
+        out = StringIO()
+        call_command('archive_tasks', stdout=out, **options)
+        return out.getvalue()
+
+    def list_ids(self, **params):
+        return [task['id'] for task in self.client.get(reverse('task-list'), params).json()]
+
+    def test_archive_moves_old_completed_tasks(self):
+        before = self.list_ids()
+        stats = self.client.get(reverse('task-stats')).data
+        changes = TaskChange.objects.count()
+
+        self.assertIn('Archived 3 tasks', self.archive(batch_size=2))
+        self.assertEqual(
+            list(ArchivedTask.objects.order_by('id').values_list('id', 'uuid')),
+            [(task.id, task.uuid) for task in self.archived],
+        )
+        self.assertEqual(Task_char.objects.count(), 3)
+        # Перенос - не изменение задач: журнал, счётчики и полный список прежние
+        self.assertEqual(TaskChange.objects.count(), changes)
+        self.assertEqual(self.client.get(reverse('task-stats')).data, stats)
+        self.assertEqual(count_tasks(self.user.pk)['total'], 6)
+        self.assertEqual(self.list_ids(), [task_id for task_id in before if task_id not in
+                                           {str(task.uuid) for task in self.archived}])
+        self.assertEqual(self.list_ids(include='archived'), before)
+        with override_settings(TODOLIST_FAST_SERIALIZER=False):
+            self.assertEqual(self.list_ids(include='archived'), before)
+
+        for sort in ('updated_at', 'title'):
+            expected = self.list_ids(include='archived', sort=sort, order='asc')
+            self.assertEqual(sorted(expected), sorted(before))
+            pages, url = [], reverse('task-list') + f'?include=archived&sort={sort}&order=asc&limit=2'
+            while url:
+                response = self.client.get(url).json()
+                pages += [task['id'] for task in response['results']]
+                url = response['next']
+            self.assertEqual(pages, expected)
+        self.assertIn('Archived 0 tasks', self.archive())
+
+    def test_archived_task_read_update_delete(self):
+        task = self.archived[0]
+        detail = self.client.get(reverse('task-detail', args=[task.uuid]))
+        self.archive()
+        cache.clear()
+        response = self.client.get(reverse('task-detail', args=[task.uuid]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data, response['ETag']), (detail.data, detail['ETag']))
+
+        # Запись возвращает задачу в рабочую таблицу с прежними ключами
+        response = self.client.patch(reverse('task-update', args=[task.uuid]), {'completed': False})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['completed'])
+        self.assertEqual(Task_char.objects.get(uuid=task.uuid).id, task.id)
+        self.assertFalse(ArchivedTask.objects.filter(uuid=task.uuid).exists())
+        self.assertEqual(TaskChange.objects.filter(task_id=task.uuid).last().action, TaskChange.UPSERT)
+
+        response = self.client.patch(
+            reverse('task-bulk-update'), [{'id': str(self.archived[1].uuid), 'title': 'Restored'}], format='json',
+        )
+        self.assertEqual(response.data['results'][0]['status'], 200)
+        self.assertEqual(Task_char.objects.get(uuid=self.archived[1].uuid).title, 'Restored')
+
+        response = self.client.delete(reverse('task-delete', args=[self.archived[2].uuid]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertEqual(self.client.get(reverse('task-stats')).data['total'], 5)
+
+    def test_sync_and_export_see_archived_tasks(self):
+        token = self.client.get(reverse('task-changes')).data['token']
+        self.client.patch(reverse('task-update', args=[self.archived[0].uuid]), {'title': 'Changed'})
+        Task_char.objects.filter(uuid=self.archived[0].uuid).update(updated_at=timezone.now() - timedelta(days=60))
+        self.archive()
+
+        response = self.client.get(reverse('task-changes'), {'since': token})
+        self.assertEqual([task['title'] for task in response.data['changed']], ['Changed'])
+        self.assertEqual(response.data['deleted'], [])
+        self.assertEqual(len(self.client.get(reverse('task-changes')).data['changed']), 6)
+        self.assertEqual(len(b''.join(self.client.get(reverse('task-export')).streaming_content).splitlines()), 6)
+
+    async def test_async_views(self):
+        await sync_to_async(self.archive)()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('async-task-detail', args=[self.archived[0].uuid]))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('async-task-list'), {'include': 'archived', 'limit': 4})
+        self.assertEqual(len(response.json()['results']), 4)
+        self.assertIsNotNone(response.json()['next'])
+
+
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        Task_char.objects.create(user=self.user, title='First task')
+
+    def run_concurrently(self, flight, key, func, count):
+        # Ведущий ждёт, пока остальные потоки не встанут в очередь за его результатом
+        joined = threading.Semaphore(0)
+        join = flight._join
+
+        def counting_join(key):
+            result = join(key)
+            joined.release()
+            return result
+
+        flight._join = counting_join
+        release = threading.Event()
+        results = []
+
+        def leader_func():
+            release.wait(5)
+            return func()
+
+        def request():
+            try:
+                results.append(flight.do(key, leader_func))
+            except ValueError as exc:
+                results.append(exc)
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for _ in range(count):
+            joined.acquire(timeout=5)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_threads_share_one_computation(self):
+        calls = []
+        results = self.run_concurrently(SingleFlight(timeout=5), (1, 'list'), lambda: calls.append(1) or ['data'], 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['data']] * 4)
+
+    def test_failed_leader_and_forget(self):
+        flight = SingleFlight(timeout=5)
+        calls = []
+
+        def failing():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError('leader failed')
+            return 'own'
+
+        # Ждавшие не получают чужую ошибку, а считают сами
+        results = self.run_concurrently(flight, (1, 'list'), failing, 3)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sorted(map(str, results)), ['leader failed', 'own', 'own'])
+
+        future, leader = flight._join((1, 'list'))
+        flight.forget(1)
+        self.assertIsNot(flight._join((1, 'list'))[0], future)
+        self.assertTrue(leader)
+
+    def test_task_write_forgets_user_flights(self):
+        flight = get_single_flight()
+        future, _ = flight._join((self.user.pk, 'list', 'key'))
+        Task_char.objects.create(user=self.user, title='Second task')
+        self.assertNotIn((self.user.pk, 'list', 'key'), flight._flights)
+        future.set_result(None)
+
+    @override_settings(TODOLIST_METRICS={'ENABLED': True, 'SLOW_SAMPLE_RATE': 0})
+    async def test_async_requests_coalesced(self):
+        await self.async_client.aforce_login(self.user)
+        responses = await asyncio.gather(*[self.async_client.get(reverse('async-task-list')) for _ in range(3)])
+        self.assertEqual({response.content for response in responses}, {responses[0].content})
+
+        text = (await self.async_client.get(reverse('metrics'))).content.decode()
+        labels = 'view="async-task-list",method="GET"'
+        self.assertIn(f'todolist_singleflight_requests_total{{{labels}}} 3', text)
+        self.assertIn(f'todolist_singleflight_coalesced_total{{{labels}}} 2', text)
+        self.assertIn(f'todolist_singleflight_coalescing_ratio{{{labels}}} 0.666667', text)
+
+    def test_sync_and_async_lists_share_rendered_body(self):
+        flight = get_single_flight()
+        keys = []
+        join = flight._join
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.client.force_login(self.user)
+        with mock.patch.object(flight, '_join', side_effect=lambda key: keys.append(key) or join(key)):
+            sync_response = client.get(reverse('task-list'))
+            async_response = self.client.get(reverse('async-task-list'))
+            client.get(reverse('task-list'), HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(async_response.content, sync_response.content)
+        if msgpack is not None:
+            self.assertNotEqual(keys[2], keys[0])
+
+        # Ожидающий запрос отдаёт тело, отрисованное ведущим
+        future, _ = flight._join(keys[0])
+        future.set_result(([], 200, (b'["shared"]', 'application/json')))
+        self.assertEqual(client.get(reverse('task-list')).content, b'["shared"]')
+        self.assertEqual(self.client.get(reverse('async-task-list')).content, b'["shared"]')
+        flight.forget(self.user.pk)
+
+    @override_settings(TODOLIST_SINGLE_FLIGHT={'ENABLED': False})
+    def test_disabled(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(reverse('task-list')).status_code, 200)
+        self.assertIsNone(get_single_flight())
+
+
+class ShardDatabasesMixin:
+    # Базы шардов в памяти на время класса, отдельно от шардов TODOLIST_SHARDING
+    shard_aliases = ('test_shard0', 'test_shard1')
+
+    @classmethod
+    def setUpClass(cls):
+        for alias in cls.shard_aliases:
+            default = connections.settings['default']
+            connections.settings[alias] = {**default, 'NAME': ':memory:', 'TEST': {**default['TEST'], 'NAME': None}}
+            connections[alias].creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            cls.addClassCleanup(cls.remove_shard_database, alias)
+        # Раннер тестов собирает databases до setUpClass, шардов тогда ещё нет
+        cls.databases = {*cls.databases, *cls.shard_aliases}
+        super().setUpClass()
+
+    @classmethod
+    def remove_shard_database(cls, alias):
+        connections[alias].creation.destroy_test_db(':memory:', verbosity=0)
+        del connections[alias]
+        del connections.settings[alias]
+
+
+@override_settings(TODOLIST_SHARDS={'DATABASES': ['test_shard0', 'test_shard1'], 'PLACEMENT_TTL': 0, 'MOVE_WAIT': 0})
+class TaskShardingTest(ShardDatabasesMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='password123')
+        self.shard = hash_shard(self.user.pk)
+        self.other_shard = next(alias for alias in shard_aliases() if alias != self.shard)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def user_rows(self, using, model=Task_char):
+        return model.objects.using(using).filter(user_id=self.user.pk).count()
+
+    def create_tasks(self, count):
+        for n in range(count):
+            self.client.post(reverse('task-create'), {'title': f'Task {n}', 'completed': n % 2 == 0})
+
+    def rebalance(self, **options):
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out, **options)
+        return out.getvalue()
+
+    def test_tasks_live_on_user_shard(self):
+        self.create_tasks(3)
+        self.assertEqual(
+            [self.user_rows(alias) for alias in ('default', self.shard, self.other_shard)], [0, 3, 0],
+        )
+        task_id = self.client.get(reverse('task-list')).json()[0]['id']
+        self.assertEqual(self.client.patch(reverse('task-update', args=[task_id]), {'title': 'Changed'}).status_code, 200)
+        self.assertEqual(self.client.delete(reverse('task-delete', args=[task_id])).status_code, 204)
+
+        self.assertEqual(len(self.client.get(reverse('task-list')).json()), 2)
+        self.assertEqual(self.client.get(reverse('task-stats')).data['total'], 2)
+        self.assertEqual(self.user_rows(self.shard, TaskChange), 5)
+        self.assertEqual(self.user_rows(self.shard, TaskListState), 1)
+        self.assertEqual(self.user_rows('default', TaskChange), 0)
+
+    def test_rebalance_moves_user_data(self):
+        self.create_tasks(3)
+        old_token = self.client.get(reverse('task-changes')).data['token']
+        self.client.post(reverse('task-create'), {'title': 'Task 3'})
+        Task_char.objects.filter(user=self.user, completed=True).update(updated_at=timezone.now() - timedelta(days=60))
+        archive_completed_tasks(days=30)
+        before = self.client.get(reverse('task-list'), {'include': 'archived'}).json()
+        stats = self.client.get(reverse('task-stats')).data
+        token = self.client.get(reverse('task-changes')).data['token']
+
+        self.assertIn('moved 4 tasks', self.rebalance(user=self.user.pk, to=self.other_shard))
+        self.assertEqual(TaskShard.objects.get(user=self.user).alias, self.other_shard)
+        self.assertEqual([self.user_rows(self.shard), self.user_rows(self.shard, ArchivedTask)], [0, 0])
+        self.assertEqual(
+            [self.user_rows(self.other_shard), self.user_rows(self.other_shard, ArchivedTask)], [2, 2],
+        )
+        # Тот же список в том же порядке, счётчики пересчитаны триггерами
+        self.assertEqual(self.client.get(reverse('task-list'), {'include': 'archived'}).json(), before)
+        self.assertEqual(self.client.get(reverse('task-stats')).data, stats)
+
+        # Журнал не переносится: последний токен действует, более старый истёк
+        self.assertEqual(self.client.get(reverse('task-changes'), {'since': old_token}).status_code, 410)
+        self.assertEqual(self.client.get(reverse('task-changes'), {'since': token}).data['changed'], [])
+        self.assertEqual(len(self.client.get(reverse('task-changes')).data['changed']), 4)
+        self.client.post(reverse('task-create'), {'title': 'After move'})
+        response = self.client.get(reverse('task-changes'), {'since': token})
+        self.assertEqual([task['title'] for task in response.data['changed']], ['After move'])
+
+        # Без параметров пользователь возвращается на шард по хешу и открепляется
+        self.assertIn('Rebalanced 1 users, moved 5 tasks', self.rebalance())
+        self.assertFalse(TaskShard.objects.exists())
+        self.assertEqual([self.user_rows(self.shard), self.user_rows(self.other_shard)], [3, 0])
+
+    def test_writes_rejected_while_moving(self):
+        self.create_tasks(1)
+        TaskShard.objects.create(user=self.user, alias=self.shard, moving=True)
+        response = self.client.post(reverse('task-create'), {'title': 'During move'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.client.get(reverse('task-list')).status_code, 200)
+
+        async_client = Client()
+        async_client.force_login(self.user)
+        response = async_client.post(reverse('async-task-create'), {'title': 'During move'})
+        self.assertEqual(response.status_code, 503)
+
+    def test_pin_then_enable_sharding(self):
+        with override_settings(TODOLIST_SHARDS={'DATABASES': []}):
+            self.create_tasks(2)
+            self.assertIn('Pinned 1 users', self.rebalance(pin=True))
+            with self.assertRaises(CommandError):
+                self.rebalance()
+        self.assertEqual(TaskShard.objects.get(user=self.user).alias, 'default')
+        # Закреплённый пользователь и после включения шардов работает с default
+        self.assertEqual(len(self.client.get(reverse('task-list')).json()), 2)
+
+        self.assertIn(f'user {self.user.pk} -> {self.shard}', self.rebalance(dry_run=True))
+        self.rebalance()
+        self.assertEqual([self.user_rows('default'), self.user_rows(self.shard)], [0, 2])
+        self.assertEqual(len(self.client.get(reverse('task-list')).json()), 2)
+
+    def test_user_deletion_removes_shard_data(self):
+        self.create_tasks(2)
+        self.user.delete()
+        for model in (Task_char, TaskChange, TaskListState):
+            self.assertEqual(self.user_rows(self.shard, model), 0)
+
+    def test_admin_lists_chosen_shard(self):
+        self.create_tasks(1)
+        admin_user = User.objects.create_superuser(username='admin', password='password123')
+        client = Client()
+        client.force_login(admin_user)
+        url = reverse('admin:todolist_task_char_changelist')
+        self.assertContains(client.get(url, {'shard': self.shard}), 'Task 0')
+        self.assertNotContains(client.get(url, {'shard': self.other_shard}), 'Task 0')
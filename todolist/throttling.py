@@ -0,0 +1,306 @@
+import asyncio
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+DEFAULT_SETTINGS = {
+    'ENABLED': True,
+    'BACKEND': 'todolist.throttling.MemoryBucketStore',
+    'OPTIONS': {},
+    # Лимиты по throttle_scope view: 'N/s', 'N/min', 'N/hour', 'N/day'.
+    # Без throttle_scope - 'user' для вошедших и 'anon' для остальных
+    'RATES': {
+        'anon': '60/min',
+        'user': '1200/min',
+        'auth': '10/min',
+    },
+    # Одновременных запросов на процесс; 0 - без ограничения
+    'MAX_CONCURRENT_REQUESTS': 0,
+    # Сколько запрос ждёт свободного места перед ответом 503
+    'QUEUE_TIMEOUT': 0.05,
+    'RETRY_AFTER': 1,
+    # Не ограничиваются: мониторинг и долгие соединения событий
+    'EXEMPT_PATHS': ('/metrics/', '/tasks/events/', '/async/tasks/events/'),
+}
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600,
+           'd': 86400, 'day': 86400}
+
+
+def get_throttle_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'TODOLIST_THROTTLE', {})}
+
+
+def parse_rate(rate):
+    # '10/min' -> (ёмкость корзины 10, пополнение 10/60 токена в секунду)
+    count, period = rate.split('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().lower()]
+
+
+class MemoryBucketStore:
+    """
+    Корзины токенов в памяти процесса; одна короткая блокировка на проверку.
+
+    Полная корзина неотличима от отсутствующей, поэтому при переполнении
+    max_keys удаляются заполнившиеся корзины.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        # 0, если запрос разрешён, иначе секунды до появления токена
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                self._buckets[key] = [capacity - 1, now, capacity, refill_rate]
+                return 0
+            tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return 0
+            bucket[0] = tokens
+            return (1 - tokens) / refill_rate
+
+    def _prune(self, now):
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[3] < bucket[2]
+        }
+        if len(self._buckets) >= self.max_keys:
+            # Все корзины активны - лучше пропустить лишние запросы, чем расти без предела
+            self._buckets.clear()
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Корзины в кэше из settings.CACHES, общие для процессов.
+
+    Чтение и запись не атомарны, при одновременных запросах лимит
+    соблюдается приблизительно.
+    """
+    cache_prefix = 'todolist:throttle:'
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, now=None):
+        now = time.time() if now is None else now
+        key = self.cache_prefix + key
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+        wait = 0 if tokens >= 1 else (1 - tokens) / refill_rate
+        if not wait:
+            tokens -= 1
+        # Хранить дольше времени полного пополнения незачем
+        self.cache.set(key, (tokens, now), math.ceil((capacity - tokens) / refill_rate) + 1)
+        return wait
+
+
+_store = None
+
+
+def get_bucket_store():
+    global _store
+    if _store is None:
+        config = get_throttle_settings()
+        _store = import_string(config['BACKEND'])(**config['OPTIONS'])
+    return _store
+
+
+def get_client_ip(request):
+    # REMOTE_ADDR; X-Forwarded-For учитывается так же, как в DRF (NUM_PROXIES)
+    return BaseThrottle().get_ident(request)
+
+
+def throttle_key(request, user, scope):
+    if user is not None and user.is_authenticated:
+        return f'{scope}:user:{user.pk}'
+    return f'{scope}:ip:{get_client_ip(request)}'
+
+
+_rates = None
+
+
+def get_rates():
+    # Разобранные RATES, пустой словарь - ограничение выключено
+    global _rates
+    if _rates is None:
+        config = get_throttle_settings()
+        _rates = {scope: parse_rate(rate) for scope, rate in config['RATES'].items()} if config['ENABLED'] else {}
+    return _rates
+
+
+def check_rate(request, user, scope=None):
+    """
+    Списывает токен из корзины области `scope` для пользователя или адреса.
+    Возвращает 0 или число секунд до следующего разрешённого запроса.
+    """
+    if scope is None:
+        scope = 'user' if user is not None and user.is_authenticated else 'anon'
+    rate = get_rates().get(scope)
+    if rate is None:
+        return 0
+    return get_bucket_store().consume(throttle_key(request, user, scope), *rate)
+
+
+async def acheck_rate(request, user, scope=None):
+    if isinstance(get_bucket_store(), MemoryBucketStore):
+        # Без ввода-вывода, можно прямо в цикле событий
+        return check_rate(request, user, scope)
+    return await sync_to_async(check_rate)(request, user, scope)
+
+
+def throttled_response(wait):
+    return JsonResponse(
+        {'detail': f'Request was throttled. Expected available in {math.ceil(wait)} seconds.'},
+        status=429, headers={'Retry-After': str(math.ceil(wait))},
+    )
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Ограничение частоты запросов корзиной токенов: throttle_scope view или
+    'user'/'anon', отдельная корзина на пользователя или IP-адрес.
+    Retry-After в ответе 429 DRF берёт из wait().
+    """
+
+    def __init__(self):
+        self._wait = None
+
+    def allow_request(self, request, view):
+        self._wait = check_rate(request, request.user, getattr(view, 'throttle_scope', None))
+        return not self._wait
+
+    def wait(self):
+        # DRF отбрасывает дробную часть, а раньше повторять бесполезно
+        return math.ceil(self._wait) if self._wait else None
+
+
+class ConcurrencyLimiter:
+    # Счётчик запросов в обработке; ждать места можно не дольше timeout
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=0):
+        with self._condition:
+            if self.active >= self.limit and (
+                not timeout or not self._condition.wait_for(lambda: self.active < self.limit, timeout)
+            ):
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+_limiter = None
+
+
+def get_concurrency_limiter():
+    # None, если ограничение выключено
+    global _limiter
+    limit = get_throttle_settings()['MAX_CONCURRENT_REQUESTS']
+    if not limit:
+        return None
+    if _limiter is None:
+        _limiter = ConcurrencyLimiter(limit)
+    return _limiter
+
+
+@receiver(setting_changed)
+def reset_throttle_state(setting, **kwargs):
+    global _store, _rates, _limiter
+    if setting == 'TODOLIST_THROTTLE':
+        _store = None
+        _rates = None
+        _limiter = None
+
+
+@sync_and_async_middleware
+def concurrency_limit_middleware(get_response):
+    """
+    Отвечает 503 с Retry-After, когда в процессе уже обрабатывается
+    MAX_CONCURRENT_REQUESTS запросов: лишние запросы отбрасываются сразу,
+    а не ждут в очереди, пока задержка не вырастет у всех.
+    """
+    config = get_throttle_settings()
+    limiter = get_concurrency_limiter()
+    if limiter is None:
+        raise MiddlewareNotUsed
+    timeout = config['QUEUE_TIMEOUT']
+    exempt_paths = tuple(config['EXEMPT_PATHS'])
+
+    def overloaded():
+        return JsonResponse(
+            {'detail': 'Server is overloaded, try again later.'},
+            status=503, headers={'Retry-After': str(config['RETRY_AFTER'])},
+        )
+
+    def release_after(response):
+        # Потоковый ответ (экспорт) отдаёт тело уже после возврата из view:
+        # место освобождается, когда сервер закроет ответ - после отдачи
+        # всего тела или обрыва соединения
+        if response.streaming:
+            response._resource_closers.append(limiter.release)
+        else:
+            limiter.release()
+        return response
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if request.path.startswith(exempt_paths):
+                return await get_response(request)
+            # Блокирующее ожидание остановило бы цикл событий - опрашиваем
+            deadline = time.monotonic() + timeout
+            while not limiter.acquire():
+                if time.monotonic() >= deadline:
+                    return overloaded()
+                await asyncio.sleep(0.005)
+            try:
+                response = await get_response(request)
+            except BaseException:
+                limiter.release()
+                raise
+            return release_after(response)
+    else:
+        def middleware(request):
+            if request.path.startswith(exempt_paths):
+                return get_response(request)
+            if not limiter.acquire(timeout):
+                return overloaded()
+            try:
+                response = get_response(request)
+            except BaseException:
+                limiter.release()
+                raise
+            return release_after(response)
+    return middleware
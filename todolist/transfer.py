@@ -0,0 +1,148 @@
+from itertools import chain
+
+from django.db import transaction
+from django.utils import timezone
+
+from todolist.archive import restore_tasks
+from todolist.models import ArchivedTask, Task_char
+from todolist.routers import shard_for_user
+from todolist.serializers import TaskCharImportSerializer, TaskCharRowEncoder
+from todolist.signals import tasks_changed
+
+
+# Экспорт и импорт задач потоком: память не зависит от числа задач.
+# Используется эндпоинтами tasks/export/, tasks/import/ и фоновыми задачами.
+
+EXPORT_CHUNK_SIZE = 2000
+# В ответе и в результате задачи хранится не больше стольких ошибок
+MAX_IMPORT_ERRORS = 100
+
+
+def export_rows(user_id, chunk_size=EXPORT_CHUNK_SIZE):
+    # Порядок совпадает с индексом task_user_created_idx - строки идут без сортировки.
+    # Задачи из архива - следом за рабочими
+    encoder = TaskCharRowEncoder()
+    querysets = [
+        encoder.values(model.objects.filter(user_id=user_id).order_by('completed', 'created_at', 'id'))
+        for model in (Task_char, ArchivedTask)
+    ]
+    for row in chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in querysets):
+        yield encoder.encode(row)
+
+
+class TaskImporter:
+    """
+    Импортирует задачи пакетами по batch_size: проверка
+    TaskCharImportSerializer, один bulk_create и один tasks_changed в
+    отдельной транзакции на пакет.
+
+    Публичный id, created_at и updated_at из строки экспорта сохраняются:
+    задача пользователя с тем же id (в том числе архивная) обновляется, а не
+    дублируется. Id задачи другого пользователя заменяется новым.
+
+    on_batch(importer) вызывается внутри транзакции пакета, чтобы сохранить
+    прогресс вместе с данными.
+    """
+    fields = ('title', 'description', 'completed', 'created_at', 'updated_at')
+
+    def __init__(self, user_id, batch_size, on_batch=None, created=0, updated=0, errors=None, line=0):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.created = created
+        self.updated = updated
+        self.errors = list(errors or [])
+        # Номер последней обработанной строки
+        self.line = line
+        self.batch = []
+
+    def add_error(self, line, errors):
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def feed(self, records):
+        # records - пары (номер строки, словарь полей или ParseError)
+        for line, item in records:
+            if line <= self.line:
+                continue
+            if isinstance(item, Exception):
+                self.add_error(line, str(item))
+            else:
+                self.batch.append((line, item))
+                if len(self.batch) >= self.batch_size:
+                    self.flush()
+        self.flush()
+        return self
+
+    def flush(self):
+        if not self.batch:
+            return
+        rows = []
+        for line, item in self.batch:
+            serializer = TaskCharImportSerializer(data=item)
+            if serializer.is_valid():
+                rows.append(serializer.validated_data)
+            else:
+                self.add_error(line, serializer.errors)
+
+        # Задачи - на шарде пользователя, прогресс фоновой задачи - в default:
+        # задачи коммитятся первыми, при сбое между коммитами пакет повторится
+        using = shard_for_user(self.user_id)
+        with transaction.atomic(), transaction.atomic(using=using):
+            created, updated = self.save(using, rows)
+            if created or updated:
+                tasks_changed.send(
+                    sender=Task_char, user_id=self.user_id,
+                    created=[task.uuid for task in created], updated=[task.uuid for task in updated],
+                )
+            self.created += len(created)
+            self.updated += len(updated)
+            self.line = self.batch[-1][0]
+            if self.on_batch is not None:
+                self.on_batch(self)
+        self.batch = []
+
+    def save(self, using, rows):
+        uuids = [row['uuid'] for row in rows if 'uuid' in row]
+        owners = dict(chain.from_iterable(
+            model.objects.using(using).filter(uuid__in=uuids).values_list('uuid', 'user_id')
+            for model in (Task_char, ArchivedTask)
+        ))
+        own = [task_uuid for task_uuid, user_id in owners.items() if user_id == self.user_id]
+        restore_tasks(self.user_id, own)
+        existing = {task.uuid: task for task in Task_char.objects.using(using).filter(user_id=self.user_id, uuid__in=own)}
+
+        now = timezone.now()
+        new = {}
+        # Даты из строк: bulk_create ставит created_at и updated_at текущим
+        # временем, поэтому они записываются следом
+        stamps = {}
+        for row in rows:
+            if owners.get(row.get('uuid'), self.user_id) != self.user_id:
+                row = {name: value for name, value in row.items() if name != 'uuid'}
+            task = existing.get(row.get('uuid')) or new.get(row.get('uuid'))
+            if task is None:
+                task = Task_char(user_id=self.user_id, **row)
+                new[task.uuid] = task
+            else:
+                for name, value in {'updated_at': now, **row}.items():
+                    setattr(task, name, value)
+            if task.uuid in new and ('created_at' in row or 'updated_at' in row):
+                stamps[task.uuid] = (row.get('created_at'), row.get('updated_at'))
+
+        created = Task_char.objects.using(using).bulk_create(new.values())
+        restamped = [new[task_uuid] for task_uuid in stamps]
+        if restamped and restamped[0].pk is None:
+            # Бэкенд не вернул id вставленных строк
+            ids = dict(Task_char.objects.using(using).filter(uuid__in=stamps).values_list('uuid', 'id'))
+            for task in restamped:
+                task.pk = ids[task.uuid]
+        for task in restamped:
+            created_at, updated_at = stamps[task.uuid]
+            task.created_at, task.updated_at = created_at or task.created_at, updated_at or task.updated_at
+        updated = list(existing.values())
+        Task_char.objects.using(using).bulk_update([*updated, *restamped], self.fields)
+        return created, updated
+
+    def progress(self):
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors, 'line': self.line}
@@ -1,10 +1,13 @@
 ﻿from django.forms.models import BaseModelForm
-from django.http import HttpResponse, Http404
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import redirect, render, redirect, get_object_or_404
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView, FormView
 from django.urls import reverse_lazy, reverse
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import get_conditional_response
 
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -17,19 +20,64 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import authenticate, login
 from rest_framework import status
 from rest_framework.views import APIView
+from rest_framework.exceptions import ParseError
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from rest_framework.authentication import TokenAuthentication
 
 
-from todolist.models import Task_char 
-from todolist.serializers import TaskCharSerializer, RegisterSerializer
+from todolist.models import ArchivedTask, Job, Task_char 
+from todolist.serializers import (
+    TaskCharSerializer, RegisterSerializer, TaskCharBulkCreateSerializer, TaskCharBulkUpdateSerializer,
+    TaskBulkDeleteSerializer, TaskCharRowEncoder, JobSerializer,
+)
+from todolist.signals import bulk_task_changes, tasks_changed
 from todolist.permissions import IsNotAuthenticated
+from todolist.authentication import (
+    SignedTokenAuthentication, get_auth_settings, issue_token, revoke_token, session_auth_enabled, token_auth_enabled,
+)
+from todolist.pagination import (
+    RELEVANCE, TaskKeysetPagination, get_task_ordering, include_archived, merge_tasks, order_tasks,
+)
+from todolist.search import search_tasks
+from todolist.sync import SyncTokenExpired, changes_since, full_snapshot, parse_token
+from todolist.cache import list_params
+from todolist.routers import replica_reads, shard_for_user
+from todolist.metrics import get_metrics_registry, get_metrics_settings, measure_serialization
+from todolist.conditional import (
+    conditional_task_response, detail_validators, has_preconditions, list_validators, set_validator_headers,
+    task_validators,
+)
+from todolist.writes import delete_task, update_task
+from todolist.archive import restore_tasks
+from todolist.jobs import enqueue_job, job_file_path
+from todolist.renderers import CSVRenderer, NDJSONRenderer, ORJSONRenderer
+from todolist.parsers import CSVParser, NDJSONParser
+from todolist.transfer import TaskImporter, export_rows
+from todolist.backends import is_login_locked
+from todolist.hashers import get_password_settings
+from todolist.counters import get_task_stats
 
 # Create your views here.
 
+def get_task_list_queryset(user, query_params, model=Task_char):
+    # Фильтрация задач для текущего пользователя (model=ArchivedTask - по архиву)
+    queryset = model.objects.filter(user=user)
+
+    # Логика поиска
+    search_input = query_params.get('search-area', '')
+    sort_by, descending = get_task_ordering(query_params)
+    if search_input:
+        queryset = search_tasks(queryset, search_input, user.pk, ranked=(sort_by == RELEVANCE))
+
+    # Логика сортировки (по умолчанию по дате обновления, по убыванию)
+    return order_tasks(queryset, sort_by, descending)
+
+
 class LoginAPIView(APIView):
     permission_classes = [IsNotAuthenticated]
+    # Отдельный строгий лимит против перебора паролей
+    throttle_scope = 'auth'
 
     def post(self, request):
         username = request.data.get('username')
@@ -38,8 +86,19 @@ class LoginAPIView(APIView):
         user = authenticate(request, username=username, password=password)
 
         if user is not None:
-            login(request, user)
-            return Response({"detail": "Successfully logged in"}, status=status.HTTP_200_OK)
+            data = {"detail": "Successfully logged in"}
+            if session_auth_enabled():
+                login(request, user)
+            if token_auth_enabled():
+                data["token"] = issue_token(user)
+                data["expires_in"] = get_auth_settings()['TOKEN_TTL']
+            return Response(data, status=status.HTTP_200_OK)
+        if username and isinstance(username, str) and is_login_locked(username):
+            return Response(
+                {"detail": "Too many failed login attempts, try again later."},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(get_password_settings()['FAILED_LOGIN_WINDOW'])},
+            )
         return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
 
@@ -47,12 +106,18 @@ class LogoutAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        logout(request)
+        # Вход по токену - отзываем сам токен. В режиме 'both' вход выдал и
+        # сессию: она завершается тоже, даже если выход пришёл с токеном
+        if isinstance(request.successful_authenticator, SignedTokenAuthentication):
+            revoke_token(request.auth)
+        if request.session.session_key is not None:
+            logout(request)
         return Response({"detail": "Successfully logged out"}, status=status.HTTP_200_OK)
     
 
 class RegisterAPIView(APIView):
     permission_classes = [AllowAny]  # Доступ для незарегистрированных пользователей
+    throttle_scope = 'auth'
 
     def post(self, request, *args, **kwargs):
         serializer = RegisterSerializer(data=request.data)
@@ -65,35 +130,90 @@ class RegisterAPIView(APIView):
 class TaskCharListView(generics.ListAPIView):
     serializer_class = TaskCharSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TaskKeysetPagination
 
     def get_queryset(self):
-        # Фильтрация задач для текущего пользователя
-        queryset = Task_char.objects.filter(user=self.request.user)
-        
-        # Логика поиска
-        search_input = self.request.query_params.get('search-area', '')
-        if search_input:
-            queryset = queryset.filter(title__icontains=search_input)
-        
-        # Логика сортировки
-        sort_by = self.request.query_params.get('sort', 'updated_at')  # По умолчанию сортировка по дате обновления
-        order = self.request.query_params.get('order', 'desc')
-        if order == 'asc':
-            queryset = queryset.order_by('completed', sort_by)
-        else:
-            queryset = queryset.order_by('completed', f'-{sort_by}')
+        return get_task_list_queryset(self.request.user, self.request.query_params)
+
+    def get_list_querysets(self):
+        # Рабочие задачи и, с ?include=archived, архивные
+        querysets = [self.filter_queryset(self.get_queryset())]
+        if include_archived(self.request.query_params):
+            querysets.append(get_task_list_queryset(self.request.user, self.request.query_params, ArchivedTask))
+        return querysets
 
-        return queryset
+    def list(self, request, *args, **kwargs):
+        # Ответ 304 по If-None-Match / If-Modified-Since без сериализации
+        variant = '|'.join(list_params(request))
+        with replica_reads(request.user.pk):
+            return conditional_task_response(
+                request,
+                lambda task_cache: task_cache.list_key(request),
+                lambda: list_validators(self.filter_queryset(self.get_queryset()), request.user.pk, variant),
+                lambda: self.get_list_response(request, *args, **kwargs),
+                flight_key=('list', variant),
+            )
+
+    def get_list_response(self, request, *args, **kwargs):
+        querysets = self.get_list_querysets()
+        if not getattr(settings, 'TODOLIST_FAST_SERIALIZER', True):
+            if len(querysets) == 1:
+                return super().list(request, *args, **kwargs)
+            return self.get_merged_response(request, querysets)
+
+        # Быстрый путь: values_list() и TaskCharRowEncoder вместо экземпляров модели и ModelSerializer
+        encoder = TaskCharRowEncoder()
+        querysets = [encoder.values(queryset) for queryset in querysets]
+        page_querysets = [self.paginator.get_page_queryset(queryset, request) for queryset in querysets]
+        if page_querysets[0] is None:
+            with measure_serialization():
+                rows = encoder.encode_rows(merge_tasks(querysets, request.query_params))
+            return Response(rows)
+        # Курсор строится по последней строке страницы (с внутренним id), до кодирования
+        page = self.paginator.set_page(merge_tasks([list(page) for page in page_querysets], request.query_params))
+        with measure_serialization():
+            rows = encoder.encode_rows(page)
+        return self.get_paginated_response(rows)
+
+    def get_merged_response(self, request, querysets):
+        # Задачи и архив экземплярами моделей: страница каждой таблицы по тому же курсору, затем слияние
+        page_querysets = [self.paginator.get_page_queryset(queryset, request) for queryset in querysets]
+        if page_querysets[0] is None:
+            return Response(self.get_serializer(merge_tasks(querysets, request.query_params), many=True).data)
+        page = self.paginator.set_page(merge_tasks([list(page) for page in page_querysets], request.query_params))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
     
     
 class TaskCharDetailView(generics.RetrieveAPIView):
     queryset = Task_char.objects.all()
     serializer_class = TaskCharSerializer
     permission_classes = [IsAuthenticated]
+    # В URL - публичный UUID задачи
+    lookup_field = 'uuid'
+    lookup_url_kwarg = 'pk'
 
     def get_queryset(self):
         # Фильтрация по пользователю, чтобы каждый пользователь мог видеть только свои задачи
         return Task_char.objects.filter(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        with replica_reads(request.user.pk):
+            return conditional_task_response(
+                request,
+                lambda task_cache: task_cache.detail_key(request, kwargs['pk']),
+                lambda: detail_validators(
+                    self.get_queryset(), kwargs['pk'], ArchivedTask.objects.filter(user=request.user),
+                ),
+                lambda: super(TaskCharDetailView, self).retrieve(request, *args, **kwargs),
+                flight_key=('detail', str(kwargs['pk'])),
+            )
+
+    def get_object(self):
+        # Архивная задача читается из архива, без переноса обратно
+        try:
+            return super().get_object()
+        except Http404:
+            return get_object_or_404(ArchivedTask, user=self.request.user, uuid=self.kwargs['pk'])
     
     
 class TaskCharCreateView(generics.CreateAPIView):
@@ -111,14 +231,43 @@ class TaskCharUpdateView(generics.UpdateAPIView):
     serializer_class = TaskCharSerializer
     permission_classes = [IsAuthenticated]
 
-    def get_object(self):
-        # Получаем задачу текущего пользователя по `id`
-        obj = Task_char.objects.get(id=self.kwargs['pk'], user=self.request.user)
-        return obj
-
     def get_queryset(self):
         # Возвращаем только задачи текущего пользователя
         return Task_char.objects.filter(user=self.request.user)
+
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        if has_preconditions(request):
+            return self.update_with_preconditions(request, partial, **kwargs)
+
+        # Одна команда UPDATE ... RETURNING с проверкой владельца, без чтения строки
+        serializer = self.get_serializer(data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        task = update_task(request.user.pk, kwargs['pk'], serializer.validated_data)
+        if task is None:
+            raise Http404
+        response = Response(self.get_serializer(task).data)
+        return set_validator_headers(response, *task_validators(task.uuid, task.updated_at))
+
+    def update_with_preconditions(self, request, partial, **kwargs):
+        with transaction.atomic(using=shard_for_user(request.user.pk)):
+            # Блокируем строку, чтобы проверка If-Match и запись были атомарны
+            instance = self.get_queryset().select_for_update().filter(uuid=kwargs['pk']).first()
+            if instance is None and restore_tasks(request.user.pk, [kwargs['pk']]):
+                instance = self.get_queryset().select_for_update().filter(uuid=kwargs['pk']).first()
+            if instance is None:
+                raise Http404
+            etag, last_modified = task_validators(instance.uuid, instance.updated_at)
+            precondition_failed = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if precondition_failed is not None:
+                return precondition_failed
+
+            serializer = self.get_serializer(instance, data=request.data, partial=partial)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
+
+        response = Response(serializer.data)
+        return set_validator_headers(response, *task_validators(instance.uuid, instance.updated_at))
     
 
 class TaskDeleteAPIView(generics.DestroyAPIView):
@@ -126,15 +275,253 @@ class TaskDeleteAPIView(generics.DestroyAPIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, *args, **kwargs):
-        task = self.get_object()
-        if task.user != request.user:
-            return Response({"detail": "You do not have permission to delete this task."})
-        
-        # Удаляем задачу
-        task.delete()
+        # Одна команда DELETE с проверкой владельца: чужая задача неотличима от отсутствующей
+        if not delete_task(request.user.pk, kwargs['pk']):
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        # Возвращаем пустой ответ без статуса
-        return Response()  # Пустой Response без явного указания статуса    
 
-    
-    
+def get_max_batch_size():
+    return getattr(settings, 'TODOLIST_MAX_BATCH_SIZE', 500)
+
+
+class TaskBulkCreateAPIView(generics.GenericAPIView):
+    serializer_class = TaskCharBulkCreateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True, max_length=get_max_batch_size())
+        serializer.is_valid(raise_exception=True)
+
+        with transaction.atomic(using=shard_for_user(request.user.pk)):
+            with bulk_task_changes():
+                tasks = serializer.save(user=request.user)
+            tasks_changed.send(sender=Task_char, user_id=request.user.pk, created=[task.uuid for task in tasks])
+
+        results = [
+            {'index': index, 'status': status.HTTP_201_CREATED, 'task': data}
+            for index, data in enumerate(serializer.data)
+        ]
+        return Response({'results': results}, status=status.HTTP_201_CREATED)
+
+
+class TaskBulkUpdateAPIView(generics.GenericAPIView):
+    serializer_class = TaskCharBulkUpdateSerializer
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            data=request.data, many=True, partial=True, max_length=get_max_batch_size()
+        )
+        serializer.is_valid(raise_exception=True)
+        ids = [item['uuid'] for item in serializer.validated_data]
+
+        with transaction.atomic(using=shard_for_user(request.user.pk)):
+            with bulk_task_changes():
+                # Владелец проверяется одним запросом на весь пакет
+                serializer.instance = Task_char.objects.filter(user=request.user).select_for_update().in_bulk(ids, field_name='uuid')
+                missing = [task_id for task_id in ids if task_id not in serializer.instance]
+                if missing and restore_tasks(request.user.pk, missing):
+                    # Архивные задачи из пакета возвращены в рабочую таблицу
+                    serializer.instance.update(
+                        Task_char.objects.filter(user=request.user).select_for_update().in_bulk(missing, field_name='uuid')
+                    )
+                tasks = serializer.save()
+            tasks_changed.send(sender=Task_char, user_id=request.user.pk, updated=[task.uuid for task in tasks])
+
+        updated = {task.uuid: data for task, data in zip(tasks, serializer.data)}
+        results = []
+        for task_id in ids:
+            if task_id in updated:
+                results.append({'id': task_id, 'status': status.HTTP_200_OK, 'task': updated[task_id]})
+            else:
+                results.append({'id': task_id, 'status': status.HTTP_404_NOT_FOUND})
+        return Response({'results': results})
+
+
+class TaskBulkDeleteAPIView(generics.GenericAPIView):
+    serializer_class = TaskBulkDeleteSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if len(ids) > get_max_batch_size():
+            return Response(
+                {'ids': [f'Ensure this field has no more than {get_max_batch_size()} elements.']},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        with transaction.atomic(using=shard_for_user(request.user.pk)):
+            with bulk_task_changes():
+                queryset = Task_char.objects.filter(user=request.user, uuid__in=ids)
+                existing = set(queryset.values_list('uuid', flat=True))
+                queryset.delete()
+                missing = [task_id for task_id in ids if task_id not in existing]
+                if missing:
+                    archived = ArchivedTask.objects.filter(user=request.user, uuid__in=missing)
+                    existing.update(archived.values_list('uuid', flat=True))
+                    archived.delete()
+            tasks_changed.send(sender=Task_char, user_id=request.user.pk, deleted=list(existing))
+
+        results = [
+            {'id': task_id, 'status': status.HTTP_204_NO_CONTENT if task_id in existing else status.HTTP_404_NOT_FOUND}
+            for task_id in ids
+        ]
+        return Response({'results': results})
+
+
+class TaskExportAPIView(APIView):
+    """
+    Все задачи пользователя в NDJSON (по умолчанию) или CSV (Accept: text/csv
+    или ?format=csv). Строки читаются из БД курсором и сразу отдаются клиенту.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONRenderer, CSVRenderer]
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(export_rows(request.user.pk), TaskCharRowEncoder.fields), content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="tasks.{renderer.format}"'
+        return response
+
+
+class TaskImportAPIView(APIView):
+    """
+    Импорт задач из NDJSON или CSV. Тело разбирается по строкам, задачи
+    создаются пакетами по TODOLIST_MAX_BATCH_SIZE; каждый пакет - отдельная
+    транзакция, поэтому при обрыве остаются уже вставленные пакеты. Задачи
+    с id, которые у пользователя уже есть, обновляются.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [NDJSONParser, CSVParser]
+
+    def post(self, request, *args, **kwargs):
+        records = request.data
+        importer = TaskImporter(request.user.pk, get_max_batch_size())
+        # Пустое тело DRF разбирает в {}
+        importer.feed(records if not isinstance(records, dict) else ())
+        return Response({'created': importer.created, 'updated': importer.updated, 'errors': importer.errors})
+
+
+class TaskChangesAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_changes = 1000
+
+    def get(self, request, *args, **kwargs):
+        # Без ?since= - полный список и начальный токен
+        since = request.query_params.get('since')
+        try:
+            if since is None:
+                tasks, deleted, token, has_more = full_snapshot(request.user.pk)
+            else:
+                tasks, deleted, token, has_more = changes_since(request.user.pk, parse_token(since), self.max_changes)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except SyncTokenExpired:
+            return Response(
+                {"detail": "Sync token has expired, a full sync is required."}, status=status.HTTP_410_GONE
+            )
+
+        return Response({
+            'changed': TaskCharSerializer(tasks, many=True).data,
+            'deleted': deleted,
+            'token': str(token),
+            'has_more': has_more,
+        })
+
+
+class TaskStatsAPIView(APIView):
+    """
+    Сводка задач пользователя для дашборда: total, completed, pending и
+    updated_today (сутки по UTC). Одна строка TaskListState по первичному
+    ключу, независимо от числа задач.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        with replica_reads(request.user.pk):
+            return Response(get_task_stats(request.user.pk))
+
+
+class JobListAPIView(generics.ListAPIView):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user).order_by('-id')
+
+
+class JobDetailAPIView(generics.RetrieveAPIView):
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class JobResultAPIView(JobDetailAPIView):
+    def get(self, request, *args, **kwargs):
+        # Файл экспорта; до завершения задачи - 409
+        job = self.get_object()
+        if job.kind != Job.EXPORT:
+            raise Http404
+        if job.status != Job.SUCCEEDED:
+            return Response({"detail": "Job has not finished yet."}, status=status.HTTP_409_CONFLICT)
+        path = job_file_path(job, 'export.ndjson')
+        if not path.exists():
+            raise Http404
+        return FileResponse(
+            open(path, 'rb'), as_attachment=True, filename=f'tasks-{job.id}.ndjson', content_type='application/x-ndjson',
+        )
+
+
+class JobEnqueueAPIView(APIView):
+    # Тяжёлые операции не выполняются в запросе: ставим задачу и отвечаем 202
+    permission_classes = [IsAuthenticated]
+    kind = None
+
+    def enqueue(self, request):
+        return enqueue_job(request.user, self.kind)
+
+    def post(self, request, *args, **kwargs):
+        job = self.enqueue(request)
+        response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+        response['Location'] = reverse('job-detail', kwargs={'pk': job.pk})
+        return response
+
+
+class JobImportAPIView(JobEnqueueAPIView):
+    kind = Job.IMPORT
+
+    def enqueue(self, request):
+        # Тело - JSON-массив задач или NDJSON (application/x-ndjson), по задаче в строке
+        if request.content_type.startswith('application/x-ndjson'):
+            body = request.body
+        else:
+            items = request.data
+            if not isinstance(items, list):
+                raise ParseError("Expected a list of tasks or an application/x-ndjson body.")
+            renderer = ORJSONRenderer()
+            body = b''.join(renderer.render(item) + b'\n' for item in items)
+
+        def write_files(job):
+            job_file_path(job, 'import.ndjson').write_bytes(body)
+
+        return enqueue_job(request.user, self.kind, write_files=write_files)
+
+
+def metrics_view(request):
+    # Метрики в текстовом формате Prometheus для staff и адресов из ALLOWED_IPS
+    config = get_metrics_settings()
+    if not config['ENABLED']:
+        raise Http404
+    if request.META.get('REMOTE_ADDR') not in config['ALLOWED_IPS'] and not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(get_metrics_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,125 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from todolist.archive import restore_tasks
+from todolist.models import ArchivedTask, Task_char
+from todolist.signals import tasks_changed
+
+
+# Изменение и удаление задачи одной командой с проверкой владельца в WHERE,
+# без предварительного чтения строки. Сигналы модели при этом не рассылаются,
+# поэтому tasks_changed отправляется явно в той же транзакции.
+# Запись идёт в обход Collector: на Task_char не должно быть внешних ключей.
+
+TASK_FIELDS = Task_char._meta.concrete_fields
+
+
+def returning_supported(connection):
+    # UPDATE ... RETURNING есть в PostgreSQL и SQLite 3.35+, но не в MySQL/MariaDB
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def task_from_row(connection, row):
+    # Те же преобразования значений, что делает компилятор запросов ORM
+    values = []
+    for field, value in zip(TASK_FIELDS, row):
+        column = field.get_col(Task_char._meta.db_table)
+        for converter in connection.ops.get_db_converters(column) + field.get_db_converters(connection):
+            value = converter(value, column, connection)
+        values.append(value)
+    return Task_char.from_db(connection.alias, [field.attname for field in TASK_FIELDS], values)
+
+
+def _owner_condition(connection, user_id, task_id):
+    # task_id - публичный UUID задачи, как в URL
+    meta = Task_char._meta
+    qn = connection.ops.quote_name
+    uuid_field = meta.get_field('uuid')
+    sql = f"{qn(uuid_field.column)} = %s AND {qn(meta.get_field('user').column)} = %s"
+    return sql, [uuid_field.get_db_prep_value(task_id, connection), user_id]
+
+
+def _update_returning(connection, user_id, task_id, values):
+    meta = Task_char._meta
+    qn = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in values]
+    where, where_params = _owner_condition(connection, user_id, task_id)
+    sql = 'UPDATE {} SET {} WHERE {} RETURNING {}'.format(
+        qn(meta.db_table),
+        ', '.join(f'{qn(field.column)} = %s' for field in fields),
+        where,
+        ', '.join(qn(field.column) for field in TASK_FIELDS),
+    )
+    params = [field.get_db_prep_save(values[field.name], connection) for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + where_params)
+        row = cursor.fetchone()
+    return None if row is None else task_from_row(connection, row)
+
+
+def update_task(user_id, task_id, values):
+    """
+    Записывает в задачу пользователя только поля из `values` и updated_at.
+
+    Возвращает обновлённую задачу или None, если задачи нет или она чужая.
+    Где есть RETURNING - это единственная команда к таблице задач.
+    Архивная задача сначала возвращается в рабочую таблицу.
+    """
+    values = {**values, 'updated_at': timezone.now()}
+    using = router.db_for_write(Task_char, user_id=user_id)
+    connection = connections[using]
+
+    def update():
+        if returning_supported(connection):
+            return _update_returning(connection, user_id, task_id, values)
+        updated = Task_char.objects.using(using).filter(uuid=task_id, user_id=user_id).update(**values)
+        return Task_char.objects.using(using).get(uuid=task_id) if updated else None
+
+    with transaction.atomic(using=using):
+        task = update()
+        if task is None and restore_tasks(user_id, [task_id]):
+            task = update()
+        if task is not None:
+            tasks_changed.send(sender=Task_char, user_id=user_id, updated=[task.uuid])
+    return task
+
+
+def update_task_checked(user_id, task_id, values, check):
+    """
+    Как update_task, но для записи с условием (If-Match, If-Unmodified-Since):
+    `check(task)` получает задачу под блокировкой строки и возвращает ответ,
+    если записывать нельзя, иначе None. Записываются только поля из `values`.
+
+    Возвращает (задача или None, если её нет или она чужая; ответ check).
+    """
+    using = router.db_for_write(Task_char, user_id=user_id)
+    with transaction.atomic(using=using):
+        tasks = Task_char.objects.using(using).filter(uuid=task_id, user_id=user_id).select_for_update()
+        task = tasks.first()
+        if task is None and restore_tasks(user_id, [task_id]):
+            task = tasks.first()
+        if task is None:
+            return None, None
+        rejected = check(task)
+        if rejected is not None:
+            return task, rejected
+        for attr, value in values.items():
+            setattr(task, attr, value)
+        task.save(using=using, update_fields=[*values, 'updated_at'])
+    return task, None
+
+
+def delete_task(user_id, task_id):
+    # True, если задача пользователя была удалена
+    using = router.db_for_write(Task_char, user_id=user_id)
+    connection = connections[using]
+    where, params = _owner_condition(connection, user_id, task_id)
+    with transaction.atomic(using=using):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(Task_char._meta.db_table)} WHERE {where}', params)
+            deleted = cursor.rowcount > 0
+        if not deleted:
+            deleted = ArchivedTask.objects.using(using).filter(uuid=task_id, user_id=user_id).delete()[0] > 0
+        if deleted:
+            tasks_changed.send(sender=Task_char, user_id=user_id, deleted=[task_id])
+    return deleted